@@ -0,0 +1,507 @@
+#
+# Title: CLI_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# Command line interface to the USB20F bridge library.
+#
+#	python -m USB_SSI_Libs.rei_usb_lib <command> [options]
+#
+#	list		enumerate attached bridges
+#	dump		register dump (table, json or csv)
+#	monitor		live frame/error counter rates
+#	metrics		serve Prometheus/OpenMetrics metrics over HTTP
+#	stream		bulk send a file / receive to a file
+#	bench		register latency, bulk throughput and loopback
+#				benchmarks
+#	soak		long mixed workload run, fails on resource growth
+#
+# Every command except list takes --sn (repeatable) to select
+# bridges by serial number, or --all for every attached bridge.
+# Without either the first bridge found is used.
+#
+#
+# TODO:
+# ----------------------
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# Console log output of the library is off unless -v is given,
+# the log file is always written.
+#
+
+import sys
+import csv
+import json
+import time
+import argparse
+from USB_SSI_Libs import rei_usb_lib
+from USB_SSI_Libs import Telemetry_USB20F
+from USB_SSI_Libs import Loopback_USB20F
+from USB_SSI_Libs import Metrics_USB20F
+from USB_SSI_Libs import Soak_USB20F
+
+
+
+
+def _int(s):
+	return int(s, 0)
+
+
+# byte counts with optional K/M/G suffix (powers of 1024)
+def _size(s):
+	mult = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+	s = s.strip().upper()
+	if(s and s[-1] in mult):
+		return int(float(s[:-1]) * mult[s[-1]])
+	return int(s, 0)
+
+
+# durations in seconds with optional s/m/h suffix
+def _duration(s):
+	mult = {"S": 1, "M": 60, "H": 3600}
+	s = s.strip().upper()
+	if(s and s[-1] in mult):
+		return float(s[:-1]) * mult[s[-1]]
+	return float(s)
+
+
+# send_stream() tail padding: zero, ff or a byte value
+def _pad(s):
+	if(s.lower() in ("zero", "ff")):
+		return s.lower()
+	v = int(s, 0)
+	if(not 0 <= v <= 0xFF):
+		raise argparse.ArgumentTypeError(f"pad byte <{s}> out of range 0-0xff")
+	return v
+
+
+# op weights "reg=8,bulk=2,..."
+def _mix(s):
+	mix = {}
+	for item in s.split(","):
+		op, _, w = item.partition("=")
+		mix[op.strip()] = int(w or 1)
+	return mix
+
+
+
+
+#------------------------------------------------------------
+# Name: _serials():
+#
+# Description:
+#   Serial numbers selected by --sn/--all ([None] = first
+#	bridge found).
+#
+#------------------------------------------------------------
+def _serials(args):
+	if(getattr(args, "all", False)):
+		found = [b.serial for b in rei_usb_lib.list_bridges(args.vid, args.pid)]
+		if(not found):
+			raise SystemExit(f"no bridges with VID/PID {args.vid:04x}:{args.pid:04x} found")
+		return found
+	return args.sn or [None]
+
+
+def _open(args, sn):
+	dev = rei_usb_lib.USB20F_Device(quiet=not args.verbose, name="CLI")
+	r = dev.open_usb(args.vid, args.pid, sn=sn)
+	if(r[0]):
+		dev.log.shutdown_logging()
+		raise SystemExit(f"failed to open bridge {args.vid:04x}:{args.pid:04x} sn <{sn}>, error code <{r[1]}>")
+	return dev
+
+
+def _open_sim(args, name):
+	dev = Soak_USB20F.SimSoakBridge(quiet=not args.verbose, name=name, packet=args.sim_packet)
+	dev.open_usb()
+	return dev
+
+
+def _label(dev, sn):
+	# sn_string_d is decoded from a fixed size buffer, drop the padding
+	return sn if sn is not None else getattr(dev, "sn_string_d", "?").rstrip("\x00")
+
+
+
+
+#------------------------------------------------------------
+# Name: cmd_list():
+#
+# Description:
+#   list command.
+#
+#------------------------------------------------------------
+def cmd_list(args):
+	bridges = rei_usb_lib.list_bridges(args.vid, args.pid)
+	if(args.format == "json"):
+		json.dump([{"serial": b.serial, "bus": b.bus, "address": b.address, "port": b.location}
+				   for b in bridges], sys.stdout, indent="\t")
+		print()
+	else:
+		print(f"{'SERIAL':<20}{'BUS':>4}{'ADDR':>6}  PORT")
+		for b in bridges:
+			print(f"{str(b.serial):<20}{b.bus:>4}{b.address:>6}  {b.location}")
+	return 0
+
+
+
+
+#------------------------------------------------------------
+# Name: cmd_dump():
+#
+# Description:
+#   dump command, one batched snapshot per bridge.
+#
+#------------------------------------------------------------
+def cmd_dump(args):
+	snaps = {}
+	for sn in _serials(args):
+		dev = _open(args, sn)
+		try:
+			snaps[_label(dev, sn)] = dev.snapshot()
+		finally:
+			dev.close_usb()
+
+	out = open(args.output, "w", newline="") if args.output else sys.stdout
+	try:
+		if(args.format == "json"):
+			json.dump({sn: {n: v for (n, v) in s.items()} for (sn, s) in snaps.items()}, out, indent="\t")
+			out.write("\n")
+		elif(args.format == "csv"):
+			w = csv.writer(out)
+			w.writerow(("serial", "register", "address", "value"))
+			for (sn, s) in snaps.items():
+				for (n, a, v) in zip(s.names, s.addresses, s.values):
+					w.writerow((sn, n, f"{a:#010x}", f"{v:#010x}"))
+		else:
+			for (sn, s) in snaps.items():
+				out.write(f"Bridge {sn}\n")
+				out.write(f"{'REGISTER':<14}{'ADDRESS':<12}{'VALUE':<12}{'DECIMAL':>12}\n")
+				for (n, a, v) in zip(s.names, s.addresses, s.values):
+					out.write(f"{n:<14}{a:#010x}  {v:#010x}  {v:>12}\n")
+				out.write("\n")
+	finally:
+		if(out is not sys.stdout):
+			out.close()
+	return 0
+
+
+
+
+#------------------------------------------------------------
+# Name: cmd_monitor():
+#
+# Description:
+#   monitor command, prints counter rates (per second) of every
+#	selected bridge each interval.
+#
+#------------------------------------------------------------
+def cmd_monitor(args):
+	counters = tuple(args.counters.split(",")) if args.counters else Telemetry_USB20F.COUNTER_NAMES
+	devs = []
+	samplers = []
+	try:
+		for sn in _serials(args):
+			dev = _open(args, sn)
+			devs.append((_label(dev, sn), dev))
+			s = Telemetry_USB20F.CounterSampler(dev, rate_hz=args.rate, counters=counters)
+			s.start()
+			samplers.append(s)
+
+		print(f"{'SERIAL':<12}" + "".join(f"{c:>13}" for c in counters))
+		end = None if args.duration is None else time.monotonic() + args.duration
+		while end is None or time.monotonic() < end:
+			time.sleep(args.interval)
+			for ((label, dev), s) in zip(devs, samplers):
+				rates = s.rates(args.interval)
+				print(f"{label:<12}" + "".join(f"{rates.get(c, 0.0):>13.1f}" for c in counters), flush=True)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		for s in samplers:
+			s.stop()
+		for (label, dev) in devs:
+			dev.close_usb()
+	return 0
+
+
+
+
+#------------------------------------------------------------
+# Name: cmd_metrics():
+#
+# Description:
+#   metrics command, serves /metrics until interrupted.
+#
+#------------------------------------------------------------
+def cmd_metrics(args):
+	devs = []
+	exp = Metrics_USB20F.MetricsExporter(port=args.port, addr=args.addr, sample_hz=args.rate)
+	try:
+		for sn in _serials(args):
+			dev = _open(args, sn)
+			devs.append(dev)
+			exp.add(dev)
+		exp.start()
+		print(f"serving {len(devs)} bridge(s) on http://{args.addr or '0.0.0.0'}:{exp.port}/metrics", flush=True)
+		if(args.duration is None):
+			while True:
+				time.sleep(3600)
+		time.sleep(args.duration)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		exp.stop()
+		for dev in devs:
+			dev.close_usb()
+	return 0
+
+
+
+
+#------------------------------------------------------------
+# Name: cmd_stream():
+#
+# Description:
+#   stream send/recv commands (one bridge).
+#
+#------------------------------------------------------------
+def cmd_stream(args):
+	serials = _serials(args)
+	if(len(serials) != 1):
+		raise SystemExit("stream works on one bridge, select it with a single --sn")
+
+	dev = _open(args, serials[0])
+	try:
+		if(args.direction == "send"):
+			r = dev.send_file(args.path, transfer_size=args.chunk, depth=args.depth, pad=args.pad)
+		else:
+			if(args.bytes is None and args.duration is None):
+				raise SystemExit("stream recv needs --bytes and/or --duration")
+			r = dev.capture_to_file(args.path, nbytes=args.bytes, duration=args.duration, chunk=args.chunk)
+	except rei_usb_lib.USB20F_Error as e:
+		print(f"stream {args.direction} failed: {e}", file=sys.stderr)
+		return 1
+	finally:
+		dev.close_usb()
+
+	print(f"{args.direction} {args.path}: {r.nbytes} bytes, {r.transfers} transfers, "
+		  f"{r.elapsed:.3f} s, {r.mbps:.3f} MB/s")
+	return 0
+
+
+
+
+#------------------------------------------------------------
+# Name: cmd_bench():
+#
+# Description:
+#   bench command.
+#	- register read latency (INT0 round trip)
+#	- bulk TX throughput with send_stream()
+#	- optional loopback throughput/BER/latency (--loopback),
+#	  against a simulated bridge with --sim
+#
+#------------------------------------------------------------
+def cmd_bench(args):
+	status = 0
+	targets = [None] if args.sim else _serials(args)
+
+	for sn in targets:
+		if(args.sim):
+			dev = Loopback_USB20F.SimLoopbackBridge(quiet=not args.verbose, mbps=args.sim_rate,
+															packet=args.sim_packet)
+			dev.open_usb()
+			label = "sim"
+		else:
+			dev = _open(args, sn)
+			label = _label(dev, sn)
+
+		try:
+			print(f"Bridge {label}  bulk packet {dev.packet_size(dev._EP_BULK_OUT)} bytes")
+			if(not args.sim and args.reg_reads):
+				lat = []
+				for i in range(args.reg_reads):
+					t = time.perf_counter()
+					dev.read_reg(dev.SR1_ADDR)
+					lat.append((time.perf_counter() - t) * 1e6)
+				lat.sort()
+				print(f"  register read   n={len(lat)}  min {lat[0]:.1f} us  avg {sum(lat) / len(lat):.1f} us  "
+					  f"p99 {lat[min(len(lat) - 1, int(len(lat) * 0.99))]:.1f} us  max {lat[-1]:.1f} us")
+
+			if(not args.sim and args.tx_bytes):
+				r = dev.send_stream(bytearray(args.tx_bytes), transfer_size=args.chunk, depth=args.depth)
+				print(f"  bulk TX         {r.nbytes} bytes  {r.transfers} transfers  {r.mbps:.3f} MB/s")
+
+			if(args.loopback or args.sim):
+				lb = Loopback_USB20F.LoopbackTest(dev, chunk=args.chunk or 16384)
+				r = lb.run(args.loopback or "prbs31", args.loopback_bytes)
+				print(f"  loopback        {r.pattern}  {r.received}/{r.nbytes} bytes  {r.mbps:.3f} MB/s  "
+					  f"BER {r.ber:.3e}  latency avg {r.latency_avg or 0:.3f} mS")
+				p = lb.ping(args.pings)
+				print(f"  loopback ping   n={args.pings}  min {p.latency_min:.3f} mS  avg {p.latency_avg:.3f} mS  "
+					  f"max {p.latency_max:.3f} mS")
+				if(not r.ok or not p.ok):
+					status = 1
+		except rei_usb_lib.USB20F_Error as e:
+			print(f"  bench failed: {e}", file=sys.stderr)
+			status = 1
+		finally:
+			dev.close_usb()
+
+	return status
+
+
+
+
+#------------------------------------------------------------
+# Name: cmd_soak():
+#
+# Description:
+#   soak command, one workload thread per bridge (or per
+#	simulated bridge with --sim N). Prints a sample line every
+#	interval and the fitted trends at the end.
+#
+#------------------------------------------------------------
+def cmd_soak(args):
+	if(args.sim):
+		factories = [lambda i=i: _open_sim(args, f"Soak{i}") for i in range(args.sim)]
+	else:
+		factories = [lambda sn=sn: _open(args, sn) for sn in _serials(args)]
+
+	def show(s):
+		rss = f"{s.rss / (1 << 20):.1f} MB" if s.rss is not None else "n/a"
+		print(f"{s.t:9.0f} s  rss {rss:>10}  threads {s.threads:>3}  fds {str(s.fds):>4}  "
+			  f"objects {s.objects:>8}  log {s.log_bytes >> 10:>8} KB  {s.ops_per_sec:9.0f} ops/s  "
+			  f"errors {s.errors}", flush=True)
+
+	limits = {}
+	if(args.max_rss_mb_per_hour is not None):
+		limits["rss"] = (args.max_rss_mb_per_hour * (1 << 20), Soak_USB20F.DEFAULT_LIMITS["rss"][1])
+	if(args.max_log_mb_per_hour is not None):
+		limits["log_bytes"] = (args.max_log_mb_per_hour * (1 << 20), 1 << 20)
+
+	soak = Soak_USB20F.SoakTest(factories, duration=args.duration, interval=args.interval, warmup=args.warmup,
+								mix=args.mix, loopback=args.loopback or bool(args.sim), bulk_bytes=args.bulk_bytes,
+								reopen=args.reopen, limits=limits, max_slowdown=args.max_slowdown, on_sample=show)
+	r = soak.run()
+
+	if(args.csv):
+		r.save_csv(args.csv)
+	print(f"soak {r.elapsed:.0f} s  {r.ops} ops  {sum(r.errors.values())} errors  {r.reopens} reopens")
+	for (key, n) in sorted(r.errors.items()):
+		print(f"  error {key}: {n}")
+	for tr in r.trends.values():
+		print(f"  {tr.metric:<11} {tr.first} -> {tr.last}  {tr.per_hour:+.1f}/h{'  FAILED' if tr.failed else ''}")
+	for f in r.failures:
+		print(f"FAIL: {f}", file=sys.stderr)
+	return 0 if r.ok else 1
+
+
+
+
+#------------------------------------------------------------
+# Name: build_parser():
+#
+# Description:
+#   argparse parser for all commands.
+#
+#------------------------------------------------------------
+def build_parser():
+	p = argparse.ArgumentParser(prog="python -m USB_SSI_Libs.rei_usb_lib",
+								description="REIndustries USB20F SSI bridge utility")
+	p.add_argument("--vid", type=_int, default=0x1cbf, help="bridge USB VID (default 0x1cbf)")
+	p.add_argument("--pid", type=_int, default=0x0007, help="bridge USB PID (default 0x0007)")
+	p.add_argument("-v", "--verbose", action="store_true", help="library log output on the console")
+	sub = p.add_subparsers(dest="command", required=True)
+
+	def select(sp):
+		g = sp.add_mutually_exclusive_group()
+		g.add_argument("--sn", action="append", help="bridge serial number (repeatable)")
+		g.add_argument("--all", action="store_true", help="every attached bridge")
+
+	sp = sub.add_parser("list", help="enumerate bridges")
+	sp.add_argument("--format", choices=("table", "json"), default="table")
+	sp.set_defaults(func=cmd_list)
+
+	sp = sub.add_parser("dump", help="register dump")
+	select(sp)
+	sp.add_argument("--format", choices=("table", "json", "csv"), default="table")
+	sp.add_argument("-o", "--output", help="output file (default stdout)")
+	sp.set_defaults(func=cmd_dump)
+
+	sp = sub.add_parser("monitor", help="live counter rates")
+	select(sp)
+	sp.add_argument("--interval", type=float, default=1.0, help="print period in seconds")
+	sp.add_argument("--rate", type=float, default=10.0, help="counter sample rate in Hz")
+	sp.add_argument("--duration", type=float, help="stop after this many seconds")
+	sp.add_argument("--counters", help="comma separated counter names")
+	sp.set_defaults(func=cmd_monitor)
+
+	sp = sub.add_parser("metrics", help="Prometheus/OpenMetrics exporter")
+	select(sp)
+	sp.add_argument("--port", type=int, default=9464, help="HTTP port (default 9464)")
+	sp.add_argument("--addr", default="", help="bind address (default all interfaces)")
+	sp.add_argument("--rate", type=float, default=1.0, help="bridge counter sample rate in Hz")
+	sp.add_argument("--duration", type=float, help="stop after this many seconds")
+	sp.set_defaults(func=cmd_metrics)
+
+	sp = sub.add_parser("stream", help="bulk send/receive files")
+	select(sp)
+	sp.add_argument("direction", choices=("send", "recv"))
+	sp.add_argument("path")
+	sp.add_argument("--bytes", type=_size, help="recv: bytes to capture")
+	sp.add_argument("--duration", type=float, help="recv: capture time limit in seconds")
+	sp.add_argument("--chunk", type=_size, help="bytes per bulk transfer")
+	sp.add_argument("--depth", type=int, help="send: transfers in flight")
+	sp.add_argument("--pad", type=_pad, default="zero", metavar="{zero,ff,BYTE}",
+					help="send: tail padding, zero, ff or a byte value such as 0x55 (default zero)")
+	sp.set_defaults(func=cmd_stream)
+
+	sp = sub.add_parser("bench", help="throughput and latency benchmarks")
+	select(sp)
+	sp.add_argument("--reg-reads", type=int, default=1000, help="register reads to time (0 - skip)")
+	sp.add_argument("--tx-bytes", type=_size, default=16 << 20, help="bulk TX bytes (0 - skip)")
+	sp.add_argument("--chunk", type=_size, help="bytes per bulk transfer")
+	sp.add_argument("--depth", type=int, help="bulk TX transfers in flight")
+	sp.add_argument("--loopback", choices=Loopback_USB20F.PATTERNS,
+					help="also run a loopback test with this pattern (SSI loopback wired)")
+	sp.add_argument("--loopback-bytes", type=_size, default=16 << 20)
+	sp.add_argument("--pings", type=int, default=100, help="loopback round trips to time")
+	sp.add_argument("--sim", action="store_true", help="loopback bench against a simulated bridge")
+	sp.add_argument("--sim-rate", type=float, help="simulated link rate in MB/s")
+	sp.add_argument("--sim-packet", type=int, choices=(64, 512), default=64,
+					help="simulated bulk max packet size (512 - high speed bridge)")
+	sp.set_defaults(func=cmd_bench)
+
+	sp = sub.add_parser("soak", help="long run resource leak test")
+	select(sp)
+	sp.add_argument("--duration", type=_duration, default=3600.0, help="run time, s/m/h suffix (default 1h)")
+	sp.add_argument("--interval", type=_duration, default=10.0, help="sample period (default 10s)")
+	sp.add_argument("--warmup", type=_duration, default=300.0, help="excluded from trend fits (default 5m)")
+	sp.add_argument("--mix", type=_mix, help="op weights, e.g. reg=8,regs=2,int1=4,bulk=2,legacy=1")
+	sp.add_argument("--loopback", action="store_true", help="verify INT1/bulk read back (SSI loopback wired)")
+	sp.add_argument("--bulk-bytes", type=_size, default=4096, help="bytes per bulk op")
+	sp.add_argument("--reopen", type=_duration, default=0, help="close/reopen every bridge this often")
+	sp.add_argument("--max-rss-mb-per-hour", type=float, help="RSS growth limit")
+	sp.add_argument("--max-log-mb-per-hour", type=float, help="log file growth limit (default report only)")
+	sp.add_argument("--max-slowdown", type=float, default=0.2, help="allowed ops/sec drop (default 0.2)")
+	sp.add_argument("--csv", help="write the samples to this file")
+	sp.add_argument("--sim", type=int, default=0, metavar="N", help="run against N simulated bridges")
+	sp.add_argument("--sim-packet", type=int, choices=(64, 512), default=64,
+					help="simulated bulk max packet size")
+	sp.set_defaults(func=cmd_soak)
+
+	return p
+
+
+
+
+def main(argv=None):
+	args = build_parser().parse_args(argv)
+	return args.func(args)
@@ -0,0 +1,265 @@
+#
+# Title: Capture_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# Continuous bulk RX capture with double (N) buffering and SSI
+# frame loss detection.
+#
+# - a receiver thread fills preallocated buffers back to back,
+#	a processing thread hands each full buffer to the caller's
+#	callback, so processing never stalls the USB receive
+# - after each buffer the bridge SSIRXFC (SSI RX frame count) and
+#	SIRXFSSCNT (SSI RX frame sync count) counters are read and
+#	compared with the bytes the host actually received
+#
+#	frames_expected = SSIRXFC delta since start
+#	frames_received = bytes received / frame_bytes
+#	frames_lost     = frames_expected - frames_received - frames
+#					  that may still sit in the bridge FIFO
+#
+#	A frame sync count running ahead of SSIRXFC means frames were
+#	started on the SSI bus but never stored by the bridge.
+#
+#
+# TODO:
+# ----------------------
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# frame_bytes is the payload size of one SSI frame as configured
+# on the bridge, fifo_frames the number of frames the bridge can
+# hold before they reach the host. Both are bridge configuration
+# dependent parameters.
+#
+
+import time
+import queue
+import threading
+from USB_SSI_Libs import rei_usb_lib
+
+
+
+
+#------------------------------------------------------------
+# Name: CaptureStats():
+#
+# Description:
+#   Slotted capture state passed to the buffer callback and
+#	returned by DoubleBufferCapture.stop().
+#
+#------------------------------------------------------------
+class CaptureStats(object):
+	__slots__ = ("buffers", "nbytes", "overruns", "dropped", "frames_expected", "frame_syncs",
+				 "frames_received", "frames_lost", "sync_gap", "elapsed")
+
+	def __init__(self):
+		self.buffers = 0
+		self.nbytes = 0
+		self.overruns = 0
+		self.dropped = 0
+		self.frames_expected = 0
+		self.frame_syncs = 0
+		self.frames_received = 0
+		self.frames_lost = 0
+		self.sync_gap = 0
+		self.elapsed = 0.0
+
+	@property
+	def complete(self):
+		return self.frames_lost == 0 and self.dropped == 0 and self.sync_gap == 0
+
+	def __repr__(self):
+		return (f"CaptureStats(buffers={self.buffers}, nbytes={self.nbytes}, overruns={self.overruns}, "
+				f"dropped={self.dropped}, frames expected/received/lost={self.frames_expected}/"
+				f"{self.frames_received}/{self.frames_lost}, sync_gap={self.sync_gap}, elapsed={self.elapsed:.3f} s)")
+
+
+
+
+#------------------------------------------------------------
+# Name: DoubleBufferCapture():
+#
+# Description:
+#   Continuous bulk capture into alternating preallocated
+#	buffers.
+#
+#	def on_buffer(data, stats):
+#		# data: memoryview of the filled part of the buffer,
+#		# only valid during the call
+#		...
+#	cap = DoubleBufferCapture(dev, on_buffer)
+#	cap.start()
+#	...
+#	stats = cap.stop()
+#
+# Parameters:
+#	dev: opened USB20F_Device
+#	on_buffer: callback(data, stats), run on the processing thread
+#	buf_size: bytes per buffer (multiple of chunk)
+#	nbuf: number of buffers (2 = double buffering)
+#	chunk: bytes per bulk transfer, multiple of the bulk IN
+#		packet size
+#	frame_bytes: payload bytes per SSI frame
+#	fifo_frames: frames that may be in flight inside the bridge
+#	timeout: per transfer timeout in mS, a timeout hands over a
+#		partly filled buffer
+#
+#------------------------------------------------------------
+class DoubleBufferCapture(object):
+	def __init__(self, dev, on_buffer, buf_size=262144, nbuf=2, chunk=16384, frame_bytes=64,
+					fifo_frames=64, timeout=100):
+		pkt = dev.packet_size(dev._EP_BULK_IN)
+		if(chunk % pkt or buf_size % chunk):
+			raise ValueError(f"chunk must be a multiple of {pkt} bytes and buf_size a multiple of chunk!")
+
+		self.dev = dev
+		self.on_buffer = on_buffer
+		self.buf_size = buf_size
+		self.chunk = chunk
+		self.frame_bytes = frame_bytes
+		self.fifo_frames = fifo_frames
+		self.timeout = timeout
+		self.stats = CaptureStats()
+
+		# one spare chunk so every receive can ask for a full chunk
+		# after a short read, a handed over buffer may hold up to
+		# buf_size + chunk - 1 bytes
+		self._bufs = [bytearray(buf_size + chunk) for i in range(nbuf)]
+		self._scratch = bytearray(chunk)
+		self._free = queue.Queue()
+		self._ready = queue.Queue()
+		self._running = False
+		self._rx_thread = None
+		self._proc_thread = None
+		self._errors = []
+		self._t0 = 0.0
+		self._rxfc0 = 0
+		self._fss0 = 0
+
+
+	def start(self):
+		dev = self.dev
+		self._rxfc0, self._fss0 = dev.read_regs((dev.SSIRXFC_ADDR, dev.SIRXFSSCNT_ADDR))
+		self.stats = CaptureStats()
+		self._errors = []
+		for b in self._bufs:
+			self._free.put(b)
+
+		self._running = True
+		self._t0 = time.perf_counter()
+		self._rx_thread = threading.Thread(target=self._receiver, name="DoubleBufferCapture-rx", daemon=True)
+		self._proc_thread = threading.Thread(target=self._processor, name="DoubleBufferCapture-proc", daemon=True)
+		self._proc_thread.start()
+		self._rx_thread.start()
+
+
+	#------------------------------------------------------------
+	# Name: stop():
+	#
+	# Description:
+	#   Stop receiving, process the buffers still queued and do a
+	#	final frame loss check (no FIFO allowance, the bridge is
+	#	expected to be idle by now).
+	#
+	# Return:
+	#	CaptureStats
+	#	Re-raises the first error hit by the receiver
+	#
+	#------------------------------------------------------------
+	def stop(self):
+		self._running = False
+		if(self._rx_thread is not None):
+			self._rx_thread.join()
+		self._ready.put(None)
+		if(self._proc_thread is not None):
+			self._proc_thread.join()
+
+		self._update_counters(final=True)
+		self.stats.elapsed = time.perf_counter() - self._t0
+
+		# leave the buffers ready for the next start()
+		while not self._free.empty():
+			self._free.get_nowait()
+
+		self.dev.log.write("INFO", f"DoubleBufferCapture stopped: {self.stats}")
+		if(not self.stats.complete):
+			self.dev.log.write("WARNING", f"DoubleBufferCapture: capture incomplete, {self.stats.frames_lost} frame(s) lost, "
+										f"{self.stats.dropped} byte(s) dropped")
+		if(self._errors):
+			raise self._errors[0]
+		return self.stats
+
+
+	def _receiver(self):
+		dev = self.dev
+		chunk = self.chunk
+		try:
+			while self._running:
+				try:
+					buf = self._free.get(timeout=0.005)
+				except queue.Empty:
+					# processing is behind - keep the link drained,
+					# the data is lost and accounted for
+					self.stats.overruns += 1
+					try:
+						self.stats.dropped += dev.rec_bulk_into(self._scratch, self.timeout)
+					except rei_usb_lib.USB20F_TimeoutError:
+						pass
+					continue
+
+				mv = memoryview(buf)
+				pos = 0
+				while pos < self.buf_size and self._running:
+					try:
+						pos += dev.rec_bulk_into(mv[pos:pos + chunk], self.timeout)
+					except rei_usb_lib.USB20F_TimeoutError:
+						if(pos):
+							break
+				mv.release()
+
+				if(pos):
+					self._ready.put((buf, pos))
+				else:
+					self._free.put(buf)
+		except Exception as e:
+			# stop() re-raises it, the thread must not die silently
+			self._errors.append(e)
+			self._running = False
+
+
+	def _processor(self):
+		while True:
+			item = self._ready.get()
+			if(item is None):
+				return
+			buf, n = item
+
+			self.stats.buffers += 1
+			self.stats.nbytes += n
+			try:
+				self._update_counters()
+			except rei_usb_lib.USB20F_Error as e:
+				self.dev.log.write("WARNING", f"DoubleBufferCapture counter read failed: {e}")
+
+			mv = memoryview(buf)
+			try:
+				self.on_buffer(mv[:n], self.stats)
+			finally:
+				mv.release()
+				self._free.put(buf)
+
+
+	def _update_counters(self, final=False):
+		dev = self.dev
+		rxfc, fss = dev.read_regs((dev.SSIRXFC_ADDR, dev.SIRXFSSCNT_ADDR))
+		s = self.stats
+		s.frames_expected = (rxfc - self._rxfc0) & 0xFFFFFFFF
+		s.frame_syncs = (fss - self._fss0) & 0xFFFFFFFF
+		s.frames_received = (s.nbytes + s.dropped) // self.frame_bytes
+		slack = 0 if final else self.fifo_frames
+		s.frames_lost = max(0, s.frames_expected - s.frames_received - slack)
+		s.sync_gap = max(0, s.frame_syncs - s.frames_expected)
@@ -0,0 +1,241 @@
+#
+# Title: CounterMode_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# API for the bridge's built-in counter mode traffic generator.
+#
+# In counter mode the bridge generates SSI TX frames itself from
+# the CTRTXDATA0-7 words, no payload comes from the host. The last
+# words received in counter mode are readable in CTRRXDATA0-7.
+# Counting SSITXFC/SSIRXFC frames over a timed run gives the SSI
+# link throughput independent of the host and the USB data path,
+# a ceiling to compare host driven send_stream()/LoopbackTest
+# numbers against.
+#
+#	cm = CounterMode(dev)
+#	r = cm.measure(duration=2.0, tx_data=range(8))
+#	print(r.tx_mbps, r.rx_mbps, r.rx_data)
+#
+#
+# TODO:
+# ----------------------
+# 1. Replace the enable_mask/mode_mask defaults with named
+#	CTRMODECR fields once the register layout is final.
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# The CTRMODECR bit used to enable the generator and any mode
+# field are parameters (enable_mask, mode_mask), not constants,
+# since they depend on the bridge firmware revision. The enable
+# bit is always cleared again by measure(), also on errors.
+#
+
+import time
+
+
+# frame/error counters captured around a counter mode run
+_COUNTERS = ("SSITXFC", "SSITXEC", "SSIRXFC", "SSIRXEC")
+
+
+
+
+#------------------------------------------------------------
+# Name: CounterModeResult():
+#
+# Description:
+#   Slotted result of a counter mode run. Frame/error counts
+#	are deltas since start(), elapsed is in seconds.
+#
+#------------------------------------------------------------
+class CounterModeResult(object):
+	__slots__ = ("tx_frames", "tx_errors", "rx_frames", "rx_errors", "elapsed", "frame_bytes", "rx_data")
+
+	def __init__(self, tx_frames, tx_errors, rx_frames, rx_errors, elapsed, frame_bytes, rx_data=None):
+		self.tx_frames = tx_frames
+		self.tx_errors = tx_errors
+		self.rx_frames = rx_frames
+		self.rx_errors = rx_errors
+		self.elapsed = elapsed
+		self.frame_bytes = frame_bytes
+		self.rx_data = rx_data
+
+	@property
+	def tx_mbps(self):
+		return (self.tx_frames * self.frame_bytes / self.elapsed / 1e6) if self.elapsed > 0 else 0.0
+
+	@property
+	def rx_mbps(self):
+		return (self.rx_frames * self.frame_bytes / self.elapsed / 1e6) if self.elapsed > 0 else 0.0
+
+	@property
+	def frame_rate(self):
+		return (self.tx_frames / self.elapsed) if self.elapsed > 0 else 0.0
+
+	def __repr__(self):
+		rx = "n/a" if self.rx_data is None else "[" + ", ".join(f"{v:#010x}" for v in self.rx_data) + "]"
+		return (f"CounterModeResult(tx {self.tx_frames} frames/{self.tx_errors} errors {self.tx_mbps:.2f} MB/s, "
+				f"rx {self.rx_frames} frames/{self.rx_errors} errors {self.rx_mbps:.2f} MB/s, "
+				f"elapsed={self.elapsed:.3f} s, rx_data={rx})")
+
+
+
+
+#------------------------------------------------------------
+# Name: CounterMode():
+#
+# Description:
+#   Configure, start and stop the bridge counter mode generator
+#	and measure the SSI frame rate it achieves.
+#
+# Parameters:
+#	dev: opened USB20F_Device
+#	frame_bytes: payload bytes per SSI frame (for MB/s)
+#	enable_mask: CTRMODECR bit(s) that enable the generator
+#	mode_mask: CTRMODECR bits written by configure(mode=...)
+#
+#------------------------------------------------------------
+class CounterMode(object):
+	def __init__(self, dev, frame_bytes=64, enable_mask=0x00000001, mode_mask=0x00000000):
+		if(enable_mask & mode_mask):
+			raise ValueError("enable_mask and mode_mask must not overlap!")
+
+		self.dev = dev
+		self.frame_bytes = frame_bytes
+		self.enable_mask = enable_mask
+		self.mode_mask = mode_mask
+		self.tx_addrs = tuple(getattr(dev, f"CTRTXDATA{i}_ADDR") for i in range(8))
+		self.rx_addrs = tuple(getattr(dev, f"CTRRXDATA{i}_ADDR") for i in range(8))
+		self._ctr_addrs = tuple(getattr(dev, f"{n}_ADDR") for n in _COUNTERS)
+		self._start = None
+		self._t0 = 0.0
+
+
+	#------------------------------------------------------------
+	# Name: configure():
+	#
+	# Description:
+	#   Load the CTRTXDATA0-7 words and/or the CTRMODECR mode
+	#	field in one verified register transaction. The enable
+	#	bit is left untouched.
+	#
+	# Parameters:
+	#	tx_data: up to 8 32-bit words for CTRTXDATA0..n (None -
+	#		leave unchanged)
+	#	mode: value for the mode_mask bits (None - leave
+	#		unchanged)
+	#
+	# Return:
+	#	NA
+	#	Raises USB20F_VerifyError when a write doesn't read back
+	#
+	#------------------------------------------------------------
+	def configure(self, tx_data=None, mode=None):
+		writes = []
+		if(tx_data is not None):
+			words = list(tx_data)
+			if(len(words) > 8):
+				raise ValueError(f"counter mode takes at most 8 TX data words, got <{len(words)}>")
+			writes += [(a, w, 0xFFFFFFFF) for (a, w) in zip(self.tx_addrs, words)]
+		if(mode is not None):
+			if(mode & ~self.mode_mask):
+				raise ValueError(f"mode <{mode:#x}> has bits outside mode_mask <{self.mode_mask:#x}>")
+			writes.append((self.dev.CTRMODECR_ADDR, mode, self.mode_mask))
+
+		if(writes):
+			self.dev.write_regs(writes, verify=True)
+
+
+	def read_tx_data(self):
+		return self.dev.read_regs(self.tx_addrs)
+
+
+	def read_rx_data(self):
+		return self.dev.read_regs(self.rx_addrs)
+
+
+	@property
+	def running(self):
+		return bool(self.dev.read_reg(self.dev.CTRMODECR_ADDR) & self.enable_mask)
+
+
+	#------------------------------------------------------------
+	# Name: start():
+	#
+	# Description:
+	#   Snapshot the SSI frame/error counters and enable the
+	#	generator.
+	#
+	#------------------------------------------------------------
+	def start(self):
+		dev = self.dev
+		self._start = dev.read_regs(self._ctr_addrs)
+		self._t0 = time.perf_counter()
+		dev.write_reg(dev.CTRMODECR_ADDR, self.enable_mask, self.enable_mask)
+		dev.log.write("INFO", f"CounterMode: generator enabled, CTRMODECR mask <{self.enable_mask:#010x}>")
+
+
+	#------------------------------------------------------------
+	# Name: sample():
+	#
+	# Description:
+	#   Counter deltas and rates since start() while the generator
+	#	keeps running.
+	#
+	# Parameters:
+	#	rx_data: also read CTRRXDATA0-7
+	#
+	# Return:
+	#	CounterModeResult
+	#
+	#------------------------------------------------------------
+	def sample(self, rx_data=False):
+		if(self._start is None):
+			raise RuntimeError("CounterMode.sample() called before start()")
+
+		now = self.dev.read_regs(self._ctr_addrs)
+		elapsed = time.perf_counter() - self._t0
+		d = [(b - a) & 0xFFFFFFFF for (a, b) in zip(self._start, now)]
+		rx = self.read_rx_data() if rx_data else None
+		return CounterModeResult(d[0], d[1], d[2], d[3], elapsed, self.frame_bytes, rx)
+
+
+	#------------------------------------------------------------
+	# Name: stop():
+	#
+	# Description:
+	#   Disable the generator and return the run's counters, rates
+	#	and the CTRRXDATA0-7 words.
+	#
+	#------------------------------------------------------------
+	def stop(self):
+		dev = self.dev
+		dev.write_reg(dev.CTRMODECR_ADDR, 0, self.enable_mask)
+		result = self.sample(rx_data=True)
+		self._start = None
+		dev.log.write("INFO", f"CounterMode: generator disabled, {result}")
+		return result
+
+
+	#------------------------------------------------------------
+	# Name: measure():
+	#
+	# Description:
+	#   Timed counter mode run: configure, run for duration
+	#	seconds, stop.
+	#
+	# Return:
+	#	CounterModeResult
+	#
+	#------------------------------------------------------------
+	def measure(self, duration=1.0, tx_data=None, mode=None):
+		self.configure(tx_data, mode)
+		self.start()
+		try:
+			time.sleep(duration)
+		finally:
+			result = self.stop()
+		return result
@@ -0,0 +1,437 @@
+#
+# Title: EventLoop_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# Single threaded event loop servicing many bridges. libusb's
+# pollable file descriptors are registered with a Python
+# selectors selector and the loop waits on them together with
+# libusb's next internal timeout, so one thread drives the async
+# transfers of every opened bridge instead of one blocking
+# thread per bridge.
+#
+#	loop = EventLoop()
+#	for dev in bridges:
+#		loop.stream_in(dev, on_data=lambda dev, data: ...)
+#	loop.run(duration=10)
+#	loop.close()
+#
+# Callbacks run on the loop thread, one call per completed
+# transfer. They must not block, use loop.call_later() for
+# delayed work.
+#
+#
+# TODO:
+# ----------------------
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# Platforms where libusb has no pollable descriptors (Windows)
+# fall back to handle_events_timeout() with the loop timeout, the
+# API stays the same.
+#
+# The selector can also be shared with application sockets etc.:
+# register them on loop.selector with a callable as data, the
+# loop calls data(key, events) when they are ready.
+#
+
+import time
+import heapq
+import itertools
+import selectors
+import ctypes as ct
+import libusb as usb
+from collections import deque
+from USB_SSI_Libs import rei_usb_lib
+
+
+POLLIN = 0x001
+POLLOUT = 0x004
+
+
+
+
+#------------------------------------------------------------
+# Name: LoopTransfer():
+#
+# Description:
+#   One async transfer owned by an EventLoop. Passed to the
+#	submit() callback once it completes.
+#	dev: USB20F_Device
+#	ep: endpoint address
+#	buf: ctypes c_ubyte buffer (kept alive until completion)
+#	length: requested bytes
+#	actual: bytes transferred
+#	status: libusb transfer status (LIBUSB_TRANSFER_*)
+#
+#------------------------------------------------------------
+class LoopTransfer(object):
+	__slots__ = ("dev", "ep", "buf", "length", "actual", "status", "callback", "xfer", "cancelled")
+
+	def __init__(self, dev, ep, buf, length, callback, xfer):
+		self.dev = dev
+		self.ep = ep
+		self.buf = buf
+		self.length = length
+		self.actual = 0
+		self.status = None
+		self.callback = callback
+		self.xfer = xfer
+		self.cancelled = False
+
+	@property
+	def ok(self):
+		return self.status == rei_usb_lib.LIBUSB_TRANSFER_COMPLETED
+
+	# received / sent bytes, only valid inside the callback
+	@property
+	def data(self):
+		return memoryview(self.buf).cast("B")[:self.actual]
+
+	def error(self):
+		code = rei_usb_lib._TRANSFER_STATUS_ERR.get(self.status, rei_usb_lib.LIBUSB_ERROR_OTHER)
+		return rei_usb_lib._usb_error(code, self.ep, self.actual)
+
+	def __repr__(self):
+		return f"LoopTransfer({self.ep:#04x}, {self.actual}/{self.length} bytes, status {self.status})"
+
+
+
+
+#------------------------------------------------------------
+# Name: EventLoop():
+#
+# Description:
+#   selectors based libusb event loop.
+#
+# Parameters:
+#	selector: selectors.BaseSelector to use (default
+#		selectors.DefaultSelector())
+#
+#------------------------------------------------------------
+class EventLoop(object):
+	def __init__(self, selector=None):
+		self.selector = selector or selectors.DefaultSelector()
+		self.running = False
+
+		# statistics
+		self.wakeups = 0
+		self.completed = 0
+		self.nbytes = 0
+
+		self._active = {}		# addressof(libusb transfer) -> LoopTransfer
+		self._done = deque()
+		self._timers = []
+		self._seq = itertools.count()
+		self._usb_fds = {}
+		self._tv = usb.timeval(0, 0)
+
+		# C callbacks only queue, dispatch happens in run_once()
+		self._cb = usb.transfer_cb_fn(lambda t: self._done.append(ct.addressof(t.contents)))
+		self._added_cb = usb.pollfd_added_cb(lambda fd, events, user: self._add_fd(fd, events))
+		self._removed_cb = usb.pollfd_removed_cb(lambda fd, user: self._remove_fd(fd))
+
+		self.pollable = False
+		fds = usb.get_pollfds(None)
+		if(fds):
+			self.pollable = True
+			i = 0
+			while fds[i]:
+				self._add_fd(fds[i].contents.fd, fds[i].contents.events)
+				i += 1
+			usb.free_pollfds(fds)
+			usb.set_pollfd_notifiers(None, self._added_cb, self._removed_cb, None)
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+	def _add_fd(self, fd, events):
+		mask = (selectors.EVENT_READ if events & POLLIN else 0) | (selectors.EVENT_WRITE if events & POLLOUT else 0)
+		if(fd in self._usb_fds):
+			self.selector.modify(fd, mask, None)
+		else:
+			self.selector.register(fd, mask, None)
+		self._usb_fds[fd] = mask
+
+
+	def _remove_fd(self, fd):
+		if(self._usb_fds.pop(fd, None) is not None):
+			self.selector.unregister(fd)
+
+
+	# number of transfers submitted and not completed yet
+	@property
+	def pending(self):
+		return len(self._active)
+
+
+	#------------------------------------------------------------
+	# Name: submit():
+	#
+	# Description:
+	#   Submit one async bulk/interrupt transfer.
+	#
+	# Parameters:
+	#	dev: opened USB20F_Device
+	#	ep: endpoint address
+	#	buf: ctypes c_ubyte array, untouched until completion
+	#	length: bytes to transfer
+	#	callback: callback(LoopTransfer) on completion
+	#	timeout: transfer timeout in mS (0 - none)
+	#
+	# Return:
+	#	LoopTransfer
+	#	Raises USB20F_Error when libusb rejects the transfer
+	#
+	#------------------------------------------------------------
+	def submit(self, dev, ep, buf, length, callback, timeout=0):
+		lt = LoopTransfer(dev, ep, buf, length, callback, None)
+		self._submit(lt, timeout)
+		return lt
+
+
+	# (re)submit lt, its libusb transfer is reused when it has one
+	def _submit(self, lt, timeout=0):
+		x = lt.xfer if lt.xfer is not None else usb.alloc_transfer(0)
+		usb.fill_bulk_transfer(x, lt.dev.dev_handle, lt.ep, ct.cast(lt.buf, ct.POINTER(ct.c_ubyte)), lt.length,
+								self._cb, None, timeout)
+		r = usb.submit_transfer(x)
+		if(r < 0):
+			usb.free_transfer(x)
+			lt.xfer = None
+			raise rei_usb_lib._usb_error(r, lt.ep)
+		lt.xfer = x
+		lt.actual = 0
+		lt.status = None
+		self._active[ct.addressof(x.contents)] = lt
+
+
+	#------------------------------------------------------------
+	# Name: send():
+	#
+	# Description:
+	#   Send a bytes-like payload on the BULK OUT endpoint (or
+	#	INT1 OUT with ep=dev._EP_INT1_OUT) as one async transfer.
+	#	The payload is copied.
+	#
+	# Parameters:
+	#	on_done: callback(dev, LoopTransfer), optional
+	#
+	#------------------------------------------------------------
+	def send(self, dev, data, ep=None, on_done=None, timeout=0):
+		ep = dev._EP_BULK_OUT if ep is None else ep
+		n = len(memoryview(data).cast("B"))
+		dev._check_packets(n, ep, "Data passed to EventLoop.send()")
+		dev._claim(2 if ep == dev._EP_BULK_OUT else 1)
+
+		buf = (ct.c_ubyte*n).from_buffer_copy(data)
+		return self.submit(dev, ep, buf, n, (lambda lt: on_done(dev, lt)) if on_done else (lambda lt: None), timeout)
+
+
+	#------------------------------------------------------------
+	# Name: stream_in():
+	#
+	# Description:
+	#   Keep depth receive transfers queued on an IN endpoint of
+	#	dev, resubmitting each one as soon as its data has been
+	#	handed to on_data.
+	#
+	# Parameters:
+	#	dev: opened USB20F_Device
+	#	on_data: callback(dev, memoryview), the view is only
+	#		valid during the call
+	#	ep: BULK IN (default) or INT1 IN
+	#	size: bytes per transfer (default dev.STREAM_XFER_SIZE
+	#		for BULK IN, one packet for INT1 IN)
+	#	depth: transfers kept queued
+	#	on_error: callback(dev, USB20F_Error), the stream stops
+	#		after an error (default logs through dev.log)
+	#
+	# Return:
+	#	list of the LoopTransfers (see cancel())
+	#
+	#------------------------------------------------------------
+	def stream_in(self, dev, on_data, ep=None, size=None, depth=2, on_error=None):
+		ep = dev._EP_BULK_IN if ep is None else ep
+		if(size is None):
+			size = dev.STREAM_XFER_SIZE if ep == dev._EP_BULK_IN else dev.packet_size(ep)
+		dev._check_packets(size, ep, "stream_in() size")
+		dev._claim(2 if ep == dev._EP_BULK_IN else 1)
+
+		def failed(err):
+			if(on_error is not None):
+				on_error(dev, err)
+			else:
+				dev.log.write("ERROR", f"EventLoop stream on endpoint {ep:#04x} stopped: {err}")
+
+		def done(lt):
+			if(lt.cancelled):
+				return
+			if(not lt.ok):
+				failed(lt.error())
+				return
+			on_data(dev, lt.data)
+			if(not lt.cancelled):
+				try:
+					self._submit(lt)
+				except rei_usb_lib.USB20F_Error as e:
+					failed(e)
+
+		return [self.submit(dev, ep, (ct.c_ubyte*size)(), size, done) for i in range(depth)]
+
+
+	#------------------------------------------------------------
+	# Name: cancel():
+	#
+	# Description:
+	#   Cancel transfers: one LoopTransfer, a list of them, or
+	#	every transfer of a device (dev=...). Cancelled
+	#	transfers complete without calling back.
+	#
+	#------------------------------------------------------------
+	def cancel(self, transfers=None, dev=None):
+		if(dev is not None):
+			transfers = [lt for lt in self._active.values() if lt.dev is dev]
+		elif(isinstance(transfers, LoopTransfer)):
+			transfers = [transfers]
+		for lt in transfers:
+			lt.cancelled = True
+			if(lt.xfer is not None and ct.addressof(lt.xfer.contents) in self._active):
+				usb.cancel_transfer(lt.xfer)
+
+
+	#------------------------------------------------------------
+	# Name: call_later():
+	#
+	# Description:
+	#   Run fn() on the loop thread after delay seconds.
+	#
+	#------------------------------------------------------------
+	def call_later(self, delay, fn):
+		heapq.heappush(self._timers, (time.monotonic() + delay, next(self._seq), fn))
+
+
+	#------------------------------------------------------------
+	# Name: run_once():
+	#
+	# Description:
+	#   Wait until a libusb descriptor or application descriptor
+	#	is ready, libusb's next timeout expires, a call_later()
+	#	timer is due or timeout seconds passed, then handle the
+	#	libusb events and run the callbacks.
+	#
+	# Return:
+	#	number of transfer callbacks run
+	#
+	#------------------------------------------------------------
+	def run_once(self, timeout=None):
+		wait = timeout
+		if(self._timers):
+			due = max(0.0, self._timers[0][0] - time.monotonic())
+			wait = due if wait is None else min(wait, due)
+		if(self._done):
+			wait = 0
+
+		if(self.pollable):
+			if(usb.get_next_timeout(None, ct.byref(self._tv)) == 1):
+				t = self._tv.tv_sec + self._tv.tv_usec / 1e6
+				wait = t if wait is None else min(wait, t)
+			ready = self.selector.select(wait)
+			self._tv.tv_sec = 0
+			self._tv.tv_usec = 0
+			usb.handle_events_timeout(None, ct.byref(self._tv))
+		else:
+			t = 0.1 if wait is None else wait
+			self._tv.tv_sec = int(t)
+			self._tv.tv_usec = int((t - int(t)) * 1e6)
+			usb.handle_events_timeout(None, ct.byref(self._tv))
+			ready = self.selector.select(0) if self.selector.get_map() else []
+		self.wakeups += 1
+
+		for (key, events) in ready:
+			if(key.data is not None):
+				key.data(key, events)
+
+		n = 0
+		while self._done:
+			lt = self._active.pop(self._done.popleft(), None)
+			if(lt is None):
+				continue
+			x = lt.xfer
+			lt.status = x.contents.status
+			lt.actual = x.contents.actual_length
+			self.completed += 1
+			self.nbytes += lt.actual
+			n += 1
+			try:
+				lt.callback(lt)
+			finally:
+				# not resubmitted by the callback
+				if(lt.xfer is x and ct.addressof(x.contents) not in self._active):
+					usb.free_transfer(x)
+					lt.xfer = None
+
+		now = time.monotonic()
+		while self._timers and self._timers[0][0] <= now:
+			heapq.heappop(self._timers)[2]()
+
+		return n
+
+
+	#------------------------------------------------------------
+	# Name: run():
+	#
+	# Description:
+	#   Run the loop until stop() is called, duration seconds
+	#	passed or (duration None) no transfers and timers are
+	#	left.
+	#
+	#------------------------------------------------------------
+	def run(self, duration=None):
+		self.running = True
+		end = None if duration is None else time.monotonic() + duration
+		while self.running:
+			if(end is None):
+				if(not self._active and not self._timers):
+					break
+				self.run_once()
+			else:
+				left = end - time.monotonic()
+				if(left <= 0):
+					break
+				self.run_once(left)
+		self.running = False
+
+
+	def stop(self):
+		self.running = False
+
+
+	#------------------------------------------------------------
+	# Name: close():
+	#
+	# Description:
+	#   Cancel all transfers, wait for them to complete and drop
+	#	the libusb pollfd notifiers.
+	#
+	#------------------------------------------------------------
+	def close(self, timeout=1.0):
+		self.cancel(list(self._active.values()))
+		end = time.monotonic() + timeout
+		while self._active and time.monotonic() < end:
+			self.run_once(0.01)
+
+		if(self.pollable):
+			usb.set_pollfd_notifiers(None, None, None, None)
+		for fd in list(self._usb_fds):
+			self._remove_fd(fd)
+		self.selector.close()
@@ -0,0 +1,193 @@
+#
+# Title: FlowControl_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# Credit based flow control for bulk TX. Instead of pushing data
+# into the bridge until a bulk transfer times out, the sender
+# tracks how much data is still buffered in the bridge and only
+# sends when the buffer has room (credits):
+#
+#	in_bridge = bytes sent - (SSITXFC - SSITXFC at start) * frame_bytes
+#	credits   = fifo_bytes - in_bridge
+#
+# SSITXFC is the bridge SSI TX frame counter (32-bit, wraps).
+# Optionally a USBBLKSR status bit can be used as an additional
+# "buffer full" gate.
+#
+#
+# TODO:
+# ----------------------
+# 1. Use INT1 notifications for credit updates once the bridge
+#	firmware reports TX FIFO level on INT1.
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# fifo_bytes and frame_bytes depend on the bridge configuration
+# (SSI frame size set in CR1/CR2 and the bulk FIFO size of the
+# part), they are parameters here rather than constants.
+#
+
+import time
+from USB_SSI_Libs import rei_usb_lib
+
+
+
+
+#------------------------------------------------------------
+# Name: CreditSender():
+#
+# Description:
+#   Flow controlled bulk sender for one USB20F_Device.
+#
+# Parameters:
+#	dev: opened USB20F_Device
+#	fifo_bytes: bridge bulk TX buffer size in bytes
+#	frame_bytes: payload bytes per SSI frame counted by SSITXFC
+#	min_credit: don't send windows smaller than this (bytes,
+#		multiple of the bulk packet size) unless it completes
+#		the payload
+#	full_mask: optional USBBLKSR bit mask, when any of these
+#		bits is set the bridge is treated as full
+#	stall_timeout: raise USB20F_TimeoutError when SSITXFC
+#		doesn't advance for this long (mS) while data is pending
+#	max_delay: credit poll backoff cap in mS
+#
+#------------------------------------------------------------
+class CreditSender(object):
+	def __init__(self, dev, fifo_bytes=4096, frame_bytes=64, min_credit=512, full_mask=None,
+					stall_timeout=1000, max_delay=5):
+		pkt = dev.packet_size(dev._EP_BULK_OUT)
+		if(fifo_bytes % pkt or min_credit % pkt):
+			raise ValueError(f"fifo_bytes and min_credit must be multiples of {pkt} bytes!")
+
+		self.dev = dev
+		self.pkt = pkt
+		self.fifo_bytes = fifo_bytes
+		self.frame_bytes = frame_bytes
+		self.min_credit = min(min_credit, fifo_bytes)
+		self.full_mask = full_mask
+		self.stall_timeout = stall_timeout
+		self.max_delay = max_delay
+
+		# statistics
+		self.credit_polls = 0
+		self.waits = 0
+		self.sent = 0
+
+		self._txfc_last = None
+		self._drained = 0
+
+
+	#------------------------------------------------------------
+	# Name: sync():
+	#
+	# Description:
+	#   Restart credit accounting from the current SSITXFC value.
+	#	Only valid while the bridge TX buffer is empty.
+	#
+	#------------------------------------------------------------
+	def sync(self):
+		self._txfc_last = self.dev.read_reg(self.dev.SSITXFC_ADDR)
+		self._drained = 0
+		self.sent = 0
+
+
+	#------------------------------------------------------------
+	# Name: credits():
+	#
+	# Description:
+	#   Read the bridge counters and return the free buffer space
+	#	in bytes (0 when the USBBLKSR full gate is set).
+	#
+	#------------------------------------------------------------
+	def credits(self):
+		dev = self.dev
+		if(self.full_mask is not None):
+			txfc, blksr = dev.read_regs((dev.SSITXFC_ADDR, dev.USBBLKSR_ADDR))
+		else:
+			txfc = dev.read_reg(dev.SSITXFC_ADDR)
+			blksr = 0
+		self.credit_polls += 1
+
+		self._drained += ((txfc - self._txfc_last) & 0xFFFFFFFF) * self.frame_bytes
+		self._txfc_last = txfc
+
+		if(blksr & (self.full_mask or 0)):
+			return 0
+
+		in_bridge = max(0, self.sent - self._drained)
+		return max(0, self.fifo_bytes - in_bridge)
+
+
+	# poll credits with backoff until at least want bytes are free
+	def _wait_credits(self, want):
+		delay = 0.0002
+		last_drained = self._drained
+		progress_t = time.monotonic()
+
+		while True:
+			c = self.credits()
+			if(c >= want):
+				return c
+
+			now = time.monotonic()
+			if(self._drained != last_drained):
+				last_drained = self._drained
+				progress_t = now
+			elif((now - progress_t) * 1000 > self.stall_timeout):
+				self.dev.log.write("ERROR", f"CreditSender: bridge TX stalled, {self.sent - self._drained} bytes pending")
+				raise rei_usb_lib.USB20F_TimeoutError(rei_usb_lib.LIBUSB_ERROR_TIMEOUT, self.dev._EP_BULK_OUT)
+
+			self.waits += 1
+			time.sleep(delay)
+			delay = min(delay * 2, self.max_delay / 1000.0)
+
+
+	#------------------------------------------------------------
+	# Name: send():
+	#
+	# Description:
+	#   Send data, one credit window at a time. Each window is
+	#	streamed with send_stream() so it is still segmented and
+	#	pipelined, and never exceeds the free bridge buffer.
+	#
+	# Parameters:
+	#	data: bytes-like payload
+	#	pad: tail padding policy, see send_stream()
+	#	**kwargs: passed to send_stream()
+	#
+	# Return:
+	#	StreamResult for the whole payload
+	#	Raises USB20F_Error on libusb failure or stall
+	#
+	#------------------------------------------------------------
+	def send(self, data, pad="zero", **kwargs):
+		mv = memoryview(data).cast("B")
+		if(self._txfc_last is None):
+			self.sync()
+
+		t0 = time.perf_counter()
+		off = 0
+		count = 0
+		padded = 0
+
+		while off < len(mv):
+			remaining = len(mv) - off
+			want = min(self.min_credit, remaining + (-remaining % self.pkt))
+			credit = self._wait_credits(want)
+
+			n = min(credit - (credit % self.pkt), remaining)
+			r = self.dev.send_stream(mv[off:off + n], pad=pad, **kwargs)
+
+			off += n
+			self.sent += r.nbytes + r.padded
+			count += r.transfers
+			padded += r.padded
+
+		result = rei_usb_lib.StreamResult(len(mv), padded, count, time.perf_counter() - t0)
+		self.dev.log.write("INFO", f"CreditSender.send(): {result}, credit polls {self.credit_polls}, waits {self.waits}")
+		return result
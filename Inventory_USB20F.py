@@ -0,0 +1,157 @@
+#
+# Title: Inventory_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# Persistent inventory of known bridges for fast reconnect.
+#
+# Each entry is keyed by the bridge's physical location (bus
+# number and hub port path) and holds its serial number, device
+# descriptor fields, string descriptors, endpoint max packet sizes
+# and last known configuration. open_usb(..., inventory=inv)
+# reopens a known bridge without reading the product/manufacturer
+# strings and logging the descriptors again. The cache is validated against the device
+# descriptor libusb already holds, a mismatch (other device on
+# the port, firmware update) drops the entry and falls back to
+# the full open. The serial number string is still read from the
+# bridge (one control transfer) and compared, two units of the
+# same model have identical descriptors and may swap ports.
+#
+#	inv = DeviceInventory()
+#	dev.open_usb(sn="REI00123", inventory=inv)
+#
+#
+# TODO:
+# ----------------------
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# The inventory file is JSON, written atomically (temp file +
+# rename) whenever an entry is added or dropped. Default location
+# is ~/.usb20f_inventory.json.
+#
+
+import os
+import json
+import time
+
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".usb20f_inventory.json")
+
+# device descriptor fields compared against the live device
+_DESC_FIELDS = ("idVendor", "idProduct", "bcdDevice", "bcdUSB", "bMaxPacketSize0",
+				"iManufacturer", "iProduct", "iSerialNumber", "bNumConfigurations")
+
+
+
+
+def _key(bus, port_path):
+	return f"{bus}-{'.'.join(str(p) for p in port_path)}"
+
+
+
+
+#------------------------------------------------------------
+# Name: DeviceInventory():
+#
+# Description:
+#   Bridge inventory cache backed by a JSON file.
+#
+# Parameters:
+#	path: inventory file (default DEFAULT_PATH)
+#	autosave: write the file on every change
+#
+#------------------------------------------------------------
+class DeviceInventory(object):
+	def __init__(self, path=None, autosave=True):
+		self.path = path or DEFAULT_PATH
+		self.autosave = autosave
+		self.bridges = {}
+		self.load()
+
+
+	def load(self):
+		try:
+			with open(self.path, "r") as f:
+				self.bridges = json.load(f).get("bridges", {})
+		except (OSError, ValueError):
+			# missing or unreadable file - start empty
+			self.bridges = {}
+
+
+	def save(self):
+		tmp = f"{self.path}.tmp"
+		with open(tmp, "w") as f:
+			json.dump({"version": 1, "bridges": self.bridges}, f, indent="\t")
+		os.replace(tmp, self.path)
+
+
+	def lookup(self, bus, port_path):
+		return self.bridges.get(_key(bus, port_path))
+
+
+	#------------------------------------------------------------
+	# Name: find():
+	#
+	# Description:
+	#   Entry of the bridge with serial number sn (None if not
+	#	in the inventory).
+	#
+	#------------------------------------------------------------
+	def find(self, sn):
+		for e in self.bridges.values():
+			if(e["serial"] == sn):
+				return e
+		return None
+
+
+	# cheap validation: cached descriptor fields vs libusb's copy
+	def matches(self, entry, desc):
+		cached = entry["descriptor"]
+		return all(cached.get(f) == getattr(desc, f) for f in _DESC_FIELDS)
+
+
+	def forget(self, bus, port_path):
+		if(self.bridges.pop(_key(bus, port_path), None) is not None and self.autosave):
+			self.save()
+
+
+	#------------------------------------------------------------
+	# Name: record():
+	#
+	# Description:
+	#   Add or refresh the entry of an opened USB20F_Device.
+	#	Another location holding the same serial number (bridge
+	#	moved to a different port) is dropped.
+	#
+	#------------------------------------------------------------
+	def record(self, dev):
+		key = _key(dev.bus, dev.port_path)
+		serial = dev.sn_string_d.rstrip("\x00")
+		for k in [k for (k, e) in self.bridges.items() if e["serial"] == serial and k != key]:
+			del self.bridges[k]
+
+		self.bridges[key] = {
+			"serial": serial,
+			"product": dev.pd_string_d.rstrip("\x00"),
+			"manufacturer": dev.mf_string_d.rstrip("\x00"),
+			"bus": dev.bus,
+			"port_path": list(dev.port_path),
+			"descriptor": {f: getattr(dev.desc, f) for f in _DESC_FIELDS},
+			"max_packet": {f"{ep:#04x}": size for (ep, size) in dev.ep_max_packet.items()},
+			"configuration": dev.device_configuration.contents.value,
+			"last_seen": time.time(),
+		}
+		if(self.autosave):
+			self.save()
+
+
+	def __len__(self):
+		return len(self.bridges)
+
+
+	def __repr__(self):
+		return f"DeviceInventory({self.path!r}, {len(self.bridges)} bridges)"
@@ -273,6 +273,12 @@ class LogClass():
         self.console.close()
         self.listener.stop()
 
+        # loggers are global per name - detach this instance's
+        # queue handler, otherwise the next LogClass with the
+        # same name keeps feeding the stopped listener's queue
+        self.root.removeHandler(self.queue_handler)
+        self.handler5.close()
+
         logging.shutdown()
 
 
@@ -0,0 +1,565 @@
+#
+# Title: Loopback_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# SSI loopback link test engine.
+#
+# - deterministic test patterns (PRBS7/9/15/23/31, 8/16/32-bit
+#	counters, walking ones/zeros) generated without per-byte
+#	Python loops
+# - the pattern is sent on BULK OUT by a sender thread while the
+#	calling thread receives BULK IN, so the link runs at full
+#	rate in both directions
+# - received data is compared with the pattern in bulk (numpy
+#	when available, Python long integers otherwise)
+# - reports MB/s, per chunk latency and bit error rate
+#
+# SimLoopbackBridge is a software stand-in for a bridge with its
+# SSI TX wired to SSI RX, for running the engine without hardware.
+#
+#
+# TODO:
+# ----------------------
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# The bridge has to be configured for loopback (SSI TX wired to
+# SSI RX) before running a test, LoopbackTest doesn't touch the
+# bridge configuration.
+#
+# PRBS bit order: bit n of the sequence is bit (n % 8) of byte
+# n // 8. The first p bits of a PRBSp sequence are the seed.
+#
+# Latency is measured per chunk, from the start of its bulk OUT
+# transfer to the bulk IN transfer that completed its last byte,
+# so it includes time spent queued behind earlier chunks.
+#
+
+import sys
+import time
+import random
+import bisect
+import threading
+from array import array
+from USB_SSI_Libs import rei_usb_lib
+
+np = rei_usb_lib.np
+
+
+# PRBS generator polynomials x^p + x^q + 1 as (p, q)
+PRBS_TAPS = {
+	"prbs7": (7, 6),
+	"prbs9": (9, 5),
+	"prbs15": (15, 14),
+	"prbs23": (23, 18),
+	"prbs31": (31, 28),
+}
+
+PATTERNS = tuple(PRBS_TAPS) + ("counter8", "counter16", "counter32", "walk1", "walk0")
+
+if(np is not None):
+	_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+
+
+#------------------------------------------------------------
+# Name: _prbs_bits():
+#
+# Description:
+#   First nbits bits of the PRBS b[n] = b[n-p] ^ b[n-q] as a
+#	Python integer (bit n = sequence bit n).
+#
+#	Squaring the characteristic polynomial over GF(2) gives
+#	b[n] = b[n-p*m] ^ b[n-q*m] for any m = 2^k, so once p*m bits
+#	exist the next q*m bits are one shift/xor of the integer.
+#	The sequence grows geometrically instead of bit by bit.
+#
+#------------------------------------------------------------
+def _prbs_bits(p, q, nbits, seed):
+	s = seed & ((1 << p) - 1)
+	if(s == 0):
+		s = (1 << p) - 1
+	n = p
+
+	while n < nbits:
+		m = 1
+		while p * m * 2 <= n:
+			m *= 2
+		b = min(q * m, nbits - n)
+		s |= (((s >> (n - p * m)) ^ (s >> (n - q * m))) & ((1 << b) - 1)) << n
+		n += b
+
+	return s & ((1 << nbits) - 1)
+
+
+
+
+#------------------------------------------------------------
+# Name: make_pattern():
+#
+# Description:
+#   Generate nbytes of a test pattern.
+#
+# Parameters:
+#	kind: one of PATTERNS
+#		"prbs7" ... "prbs31" - pseudo random bit sequence
+#		"counter8/16/32" - little endian incrementing counter
+#		"walk1" - 0x01, 0x02 ... 0x80 repeating
+#		"walk0" - 0xFE, 0xFD ... 0x7F repeating
+#	nbytes: pattern length in bytes
+#	seed: PRBS start state / counter start value (default 1 for
+#		PRBS, 0 for counters)
+#
+# Return:
+#	bytes
+#
+#------------------------------------------------------------
+def make_pattern(kind, nbytes, seed=None):
+	if(kind in PRBS_TAPS):
+		p, q = PRBS_TAPS[kind]
+		# 8 periods are a whole number of bytes, generate at most
+		# that and repeat it
+		nbits = min(nbytes, (1 << p) - 1) * 8
+		period = _prbs_bits(p, q, nbits, 1 if seed is None else seed).to_bytes(nbits // 8, "little")
+		return _repeat(period, nbytes)
+
+	if(kind.startswith("counter")):
+		width = int(kind[7:] or 8)
+		if(width not in (8, 16, 32)):
+			raise ValueError(f"counter width must be 8, 16 or 32, got <{width}>")
+		return _counter(width, nbytes, 0 if seed is None else seed)
+
+	if(kind == "walk1"):
+		return _repeat(bytes([1 << i for i in range(8)]), nbytes)
+
+	if(kind == "walk0"):
+		return _repeat(bytes([0xFF ^ (1 << i) for i in range(8)]), nbytes)
+
+	raise ValueError(f"unknown pattern <{kind}>, expected one of {PATTERNS}")
+
+
+def _repeat(period, nbytes):
+	return (period * (nbytes // len(period) + 1))[:nbytes]
+
+
+def _counter(width, nbytes, start):
+	size = width // 8
+	count = -(-nbytes // size)
+	wrap = 1 << width
+	start %= wrap
+
+	if(np is not None):
+		words = (np.arange(start, start + count, dtype=np.uint64) % wrap).astype(f"<u{size}")
+		return words.tobytes()[:nbytes]
+
+	code = {8: "B", 16: "H", 32: "I"}[width]
+	if(width < 32):
+		# whole counter period, rotated to start and repeated
+		words = array(code, range(start, wrap))
+		words.extend(range(start))
+		words = array(code, words.tobytes() * (count // wrap + 1))[:count]
+	else:
+		words = array(code, range(start, min(start + count, wrap)))
+		if(start + count > wrap):
+			words.extend(range(start + count - wrap))
+	if(sys.byteorder != "little"):
+		words.byteswap()
+	return words.tobytes()[:nbytes]
+
+
+
+
+#------------------------------------------------------------
+# Name: compare():
+#
+# Description:
+#   Bit exact compare of received data against the reference
+#	pattern, done in blocks of block bytes.
+#
+# Parameters:
+#	rx: received bytes-like object
+#	ref: expected bytes-like object (same length as rx)
+#
+# Return:
+#	(bit errors, byte errors, offset of the first bad byte or
+#	None)
+#
+#------------------------------------------------------------
+def compare(rx, ref, block=1 << 20):
+	a = memoryview(rx).cast("B")
+	b = memoryview(ref).cast("B")
+	if(len(a) != len(b)):
+		raise ValueError(f"compare() length mismatch <{len(a)}> vs <{len(b)}>")
+
+	bit_errors = 0
+	byte_errors = 0
+	first = None
+
+	for off in range(0, len(a), block):
+		x = a[off:off + block]
+		y = b[off:off + block]
+		if(x == y):
+			continue
+
+		if(np is not None):
+			diff = np.bitwise_xor(np.frombuffer(x, np.uint8), np.frombuffer(y, np.uint8))
+			bad = np.flatnonzero(diff)
+			bit_errors += int(_POPCOUNT[diff[bad]].sum(dtype=np.uint64))
+			byte_errors += len(bad)
+			if(first is None):
+				first = off + int(bad[0])
+		else:
+			diff = int.from_bytes(x, "little") ^ int.from_bytes(y, "little")
+			bit_errors += diff.bit_count()
+			byte_errors += len(x) - diff.to_bytes(len(x), "little").count(0)
+			if(first is None):
+				first = off + ((diff & -diff).bit_length() - 1) // 8
+
+	return (bit_errors, byte_errors, first)
+
+
+
+
+#------------------------------------------------------------
+# Name: LoopbackResult():
+#
+# Description:
+#   Slotted result of one loopback test. Latencies in mS,
+#	elapsed in seconds.
+#
+#------------------------------------------------------------
+class LoopbackResult(object):
+	__slots__ = ("pattern", "nbytes", "received", "bit_errors", "byte_errors", "first_error",
+				 "elapsed", "latency_min", "latency_avg", "latency_max")
+
+	def __init__(self, pattern, nbytes, received, bit_errors, byte_errors, first_error, elapsed, latencies):
+		self.pattern = pattern
+		self.nbytes = nbytes
+		self.received = received
+		self.bit_errors = bit_errors
+		self.byte_errors = byte_errors
+		self.first_error = first_error
+		self.elapsed = elapsed
+		if(latencies):
+			self.latency_min = min(latencies)
+			self.latency_avg = sum(latencies) / len(latencies)
+			self.latency_max = max(latencies)
+		else:
+			self.latency_min = self.latency_avg = self.latency_max = None
+
+	@property
+	def missing(self):
+		return max(0, self.nbytes - self.received)
+
+	# bit error rate over the bits actually received
+	@property
+	def ber(self):
+		bits = min(self.received, self.nbytes) * 8
+		return (self.bit_errors / bits) if bits else 0.0
+
+	@property
+	def mbps(self):
+		return (self.received / self.elapsed / 1e6) if self.elapsed > 0 else 0.0
+
+	@property
+	def ok(self):
+		return self.bit_errors == 0 and self.received == self.nbytes
+
+	def __repr__(self):
+		lat = (f"{self.latency_min:.3f}/{self.latency_avg:.3f}/{self.latency_max:.3f} mS"
+				if self.latency_min is not None else "n/a")
+		return (f"LoopbackResult({self.pattern}, {self.received}/{self.nbytes} bytes, {self.mbps:.2f} MB/s, "
+				f"bit errors={self.bit_errors}, BER={self.ber:.3e}, first error={self.first_error}, "
+				f"latency min/avg/max={lat})")
+
+
+
+
+#------------------------------------------------------------
+# Name: LoopbackTest():
+#
+# Description:
+#   Loopback test engine for one bridge.
+#
+#	lb = LoopbackTest(dev)
+#	r = lb.run("prbs31", 16 * 1024 * 1024)
+#	print(r.mbps, r.ber, r.latency_avg)
+#
+# Parameters:
+#	dev: opened USB20F_Device (or SimLoopbackBridge)
+#	chunk: bytes per bulk transfer, multiple of the bulk packet
+#		size (64 bytes full speed, 512 high speed)
+#	timeout: per transfer timeout in mS (default adaptive for
+#		sends, EP_TIMEOUT for receives)
+#
+#------------------------------------------------------------
+class LoopbackTest(object):
+	def __init__(self, dev, chunk=16384, timeout=None):
+		self.pkt = max(dev.packet_size(dev._EP_BULK_OUT), dev.packet_size(dev._EP_BULK_IN))
+		if(chunk % self.pkt):
+			raise ValueError(f"chunk <{chunk}> not a multiple of {self.pkt} bytes!")
+		self.dev = dev
+		self.chunk = chunk
+		self.timeout = timeout
+		self.last = None
+
+
+	#------------------------------------------------------------
+	# Name: run():
+	#
+	# Description:
+	#   Send nbytes of pattern and receive them back. Receiving
+	#	stops once nbytes arrived or a receive times out after
+	#	the sender finished.
+	#
+	# Parameters:
+	#	pattern: pattern name (see make_pattern()) or a bytes-like
+	#		reference to send as is
+	#	nbytes: test length, multiple of the bulk packet size
+	#	seed: pattern seed
+	#
+	# Return:
+	#	LoopbackResult
+	#	Raises USB20F_Error when the sender fails
+	#
+	#------------------------------------------------------------
+	def run(self, pattern="prbs31", nbytes=1048576, seed=None):
+		if(isinstance(pattern, str)):
+			name = pattern
+			ref = make_pattern(pattern, nbytes, seed)
+		else:
+			name = "custom"
+			ref = bytes(pattern)
+			nbytes = len(ref)
+		if(nbytes % self.pkt):
+			raise ValueError(f"nbytes <{nbytes}> not a multiple of {self.pkt} bytes!")
+
+		dev = self.dev
+		chunk = self.chunk
+		timeout = self.timeout
+		tx = memoryview(bytearray(ref))
+		# one spare chunk so every receive can ask for a full chunk
+		rx = bytearray(nbytes + chunk)
+		rxmv = memoryview(rx)
+
+		nchunks = -(-nbytes // chunk)
+		t_tx = [0.0] * nchunks
+		errors = []
+		done = threading.Event()
+
+		def sender():
+			try:
+				for k in range(nchunks):
+					t_tx[k] = time.perf_counter()
+					dev.send_bulk_raw(tx[k * chunk:(k + 1) * chunk], timeout)
+			except rei_usb_lib.USB20F_Error as e:
+				errors.append(e)
+			finally:
+				done.set()
+
+		th = threading.Thread(target=sender, name="LoopbackTest-tx", daemon=True)
+		marks_pos = []
+		marks_t = []
+		pos = 0
+
+		t0 = time.perf_counter()
+		th.start()
+		try:
+			while pos < nbytes:
+				try:
+					n = dev.rec_bulk_into(rxmv[pos:pos + chunk], timeout)
+				except rei_usb_lib.USB20F_TimeoutError:
+					if(done.is_set()):
+						break
+					continue
+				pos += n
+				marks_pos.append(pos)
+				marks_t.append(time.perf_counter())
+		finally:
+			th.join()
+			rxmv.release()
+
+		if(errors):
+			raise errors[0]
+
+		elapsed = (marks_t[-1] if marks_t else time.perf_counter()) - t0
+
+		latencies = []
+		for k in range(nchunks):
+			i = bisect.bisect_left(marks_pos, min((k + 1) * chunk, nbytes))
+			if(i < len(marks_t)):
+				latencies.append((marks_t[i] - t_tx[k]) * 1000.0)
+
+		n = min(pos, nbytes)
+		bit_errors, byte_errors, first = compare(memoryview(rx)[:n], memoryview(ref)[:n])
+
+		self.last = LoopbackResult(name, nbytes, pos, bit_errors, byte_errors, first, elapsed, latencies)
+		dev.log.write("INFO" if self.last.ok else "WARNING", f"LoopbackTest: {self.last}")
+		return self.last
+
+
+	#------------------------------------------------------------
+	# Name: ping():
+	#
+	# Description:
+	#   Round trip latency: count single transfers of size bytes
+	#	(default one bulk packet), each received back before the
+	#	next one is sent.
+	#
+	# Return:
+	#	LoopbackResult (latencies are round trip times)
+	#
+	#------------------------------------------------------------
+	def ping(self, count=100, size=None, pattern="prbs7"):
+		size = size or self.pkt
+		if(size % self.pkt):
+			raise ValueError(f"size <{size}> not a multiple of {self.pkt} bytes!")
+
+		dev = self.dev
+		ref = make_pattern(pattern, size * count)
+		tx = memoryview(bytearray(ref))
+		rx = bytearray(size * count)
+		rxmv = memoryview(rx)
+		latencies = []
+		received = 0
+
+		t0 = time.perf_counter()
+		try:
+			for k in range(count):
+				off = k * size
+				t = time.perf_counter()
+				dev.send_bulk_raw(tx[off:off + size], self.timeout)
+				got = 0
+				while got < size:
+					got += dev.rec_bulk_into(rxmv[off + got:off + size], self.timeout)
+				latencies.append((time.perf_counter() - t) * 1000.0)
+				received += got
+		finally:
+			rxmv.release()
+		elapsed = time.perf_counter() - t0
+
+		bit_errors, byte_errors, first = compare(rx, ref)
+		self.last = LoopbackResult(pattern, size * count, received, bit_errors, byte_errors, first, elapsed, latencies)
+		dev.log.write("INFO" if self.last.ok else "WARNING", f"LoopbackTest.ping(): {self.last}")
+		return self.last
+
+
+
+
+#------------------------------------------------------------
+# Name: SimLoopbackBridge():
+#
+# Description:
+#   Simulated bridge with SSI TX looped back to SSI RX. Data sent
+#	with send_bulk_raw() lands in a bounded FIFO that
+#	rec_bulk_into() reads from, with optional link rate limit
+#	and random bit errors. Only the bulk fast-path methods are
+#	simulated.
+#
+#	dev = SimLoopbackBridge(ber=1e-6)
+#	dev.open_usb()
+#	r = LoopbackTest(dev).run("prbs15", 1 << 20)
+#
+# Parameters:
+#	fifo_bytes: loopback buffer size (multiple of packet)
+#	mbps: link rate limit in MB/s (None - unlimited)
+#	ber: injected bit error rate
+#	seed: error injection random seed
+#	packet: simulated bulk max packet size (64 - full speed,
+#		512 - high speed bridge)
+#
+#------------------------------------------------------------
+class SimLoopbackBridge(rei_usb_lib.USB20F_Device):
+	def __init__(self, quiet=True, name="SimLoopback", fifo_bytes=65536, mbps=None, ber=0.0, seed=1, packet=64):
+		rei_usb_lib.USB20F_Device.__init__(self, quiet, name)
+		self.packet = packet
+		self.fifo_bytes = fifo_bytes
+		self.mbps = mbps
+		self.ber = ber
+		self.injected = 0
+
+		self._fifo = bytearray()
+		self._cv = threading.Condition()
+		self._rng = random.Random(seed)
+		self._next_err = self._err_gap()
+		self._t_link = 0.0
+
+
+	def _err_gap(self):
+		return int(self._rng.expovariate(self.ber)) if self.ber > 0 else None
+
+
+	def open_usb(self, vid=0x1cbf, pid=0x0007, sn=None):
+		self.dev_handle = None
+		self._set_packet_sizes({ep: (self.packet if ep in (self._EP_BULK_OUT, self._EP_BULK_IN) else 64)
+								for ep in self._ENDPOINTS})
+		self.log.write("INFO", f"SimLoopbackBridge opened, fifo <{self.fifo_bytes}> bytes, "
+								f"rate <{self.mbps or 'unlimited'}> MB/s, ber <{self.ber}>")
+		return (0, None)
+
+
+	def close_usb(self):
+		self.log.shutdown_logging()
+
+
+	# flip bits at exponentially distributed gaps, one step per error
+	def _inject(self, block):
+		nbits = len(block) * 8
+		while self._next_err is not None and self._next_err < nbits:
+			block[self._next_err // 8] ^= 1 << (self._next_err % 8)
+			self.injected += 1
+			self._next_err += 1 + self._err_gap()
+		if(self._next_err is not None):
+			self._next_err -= nbits
+
+
+	def _pace(self, n):
+		if(not self.mbps):
+			return
+		now = time.perf_counter()
+		self._t_link = max(now, self._t_link) + n / (self.mbps * 1e6)
+		if(self._t_link > now):
+			time.sleep(self._t_link - now)
+
+
+	def send_bulk_raw(self, data, timeout=None):
+		mv = memoryview(data).cast("B")
+		self._check_packets(len(mv), self._EP_BULK_OUT, "Data passed to send_bulk_raw()")
+
+		self._pace(len(mv))
+		deadline = time.monotonic() + (self.EP_TIMEOUT if timeout is None else timeout) / 1000.0
+		sent = 0
+		with self._cv:
+			while sent < len(mv):
+				room = (self.fifo_bytes - len(self._fifo)) & ~(self.packet - 1)
+				if(room <= 0):
+					if(not self._cv.wait(deadline - time.monotonic())):
+						raise rei_usb_lib.USB20F_TimeoutError(rei_usb_lib.LIBUSB_ERROR_TIMEOUT, self._EP_BULK_OUT, sent)
+					continue
+				block = bytearray(mv[sent:sent + room])
+				self._inject(block)
+				self._fifo += block
+				sent += len(block)
+				self._cv.notify_all()
+		return sent
+
+
+	def rec_bulk_into(self, buf, timeout=None):
+		out = memoryview(buf).cast("B")
+		self._check_packets(len(out), self._EP_BULK_IN, "Buffer passed to rec_bulk_into()")
+
+		deadline = time.monotonic() + (self.EP_TIMEOUT if timeout is None else timeout) / 1000.0
+		with self._cv:
+			while not self._fifo:
+				if(not self._cv.wait(deadline - time.monotonic())):
+					raise rei_usb_lib.USB20F_TimeoutError(rei_usb_lib.LIBUSB_ERROR_TIMEOUT, self._EP_BULK_IN, 0)
+			n = min(len(out), len(self._fifo))
+			out[:n] = self._fifo[:n]
+			del self._fifo[:n]
+			self._cv.notify_all()
+		return n
@@ -0,0 +1,356 @@
+#
+# Title: Messaging_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# Message framing on interface 1 (INT1). Small application
+# messages are length prefixed and packed into 64 byte INT1
+# reports, so many 4-16 byte messages share one report and one
+# transfer instead of costing a full report each.
+#
+# Report layout:
+#
+#	[len][payload ...][len][payload ...] ... [0x00 padding]
+#
+#	len: payload length 1-63, a 0 length byte (or the end of
+#		the report) ends the report
+#
+# Reports are batched by Int1Messenger and sent when flush_size
+# bytes of reports are ready or flush_interval mS after the first
+# queued message, whichever comes first.
+#
+#
+# TODO:
+# ----------------------
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# A message never spans two reports, so the largest message is
+# 63 bytes. Both ends of the link need to use this framing, the
+# bridge passes INT1 reports through unchanged.
+#
+# Reports stay 64 bytes whatever the INT1 max packet size, a
+# transfer is filled up to whole packets with empty reports.
+#
+
+import time
+import threading
+from collections import deque
+from USB_SSI_Libs import rei_usb_lib
+
+
+REPORT_SIZE = 64
+MAX_MESSAGE = REPORT_SIZE - 1
+
+
+
+
+#------------------------------------------------------------
+# Name: pack_reports():
+#
+# Description:
+#   Pack messages into 64 byte reports, a new report is started
+#	whenever the next message doesn't fit the current one.
+#
+# Parameters:
+#	messages: iterable of bytes-like messages, 1-63 bytes each
+#
+# Return:
+#	bytes, a multiple of 64 long
+#
+#------------------------------------------------------------
+def pack_reports(messages):
+	out = bytearray()
+	cur = bytearray()
+	for msg in messages:
+		n = len(msg)
+		if(not 0 < n <= MAX_MESSAGE):
+			raise ValueError(f"INT1 message length must be 1-{MAX_MESSAGE} bytes, got <{n}>")
+		if(len(cur) + 1 + n > REPORT_SIZE):
+			out += cur
+			out += bytes(REPORT_SIZE - len(cur))
+			cur = bytearray()
+		cur.append(n)
+		cur += msg
+	if(cur):
+		out += cur
+		out += bytes(REPORT_SIZE - len(cur))
+	return bytes(out)
+
+
+
+
+#------------------------------------------------------------
+# Name: unpack_reports():
+#
+# Description:
+#   Split received reports back into messages.
+#
+# Parameters:
+#	buf: bytes-like object holding one or more 64 byte reports
+#
+# Return:
+#	list of bytes messages
+#	Raises ValueError on a length byte running past its report
+#
+#------------------------------------------------------------
+def unpack_reports(buf):
+	mv = memoryview(buf).cast("B")
+	msgs = []
+	for base in range(0, len(mv), REPORT_SIZE):
+		end = min(base + REPORT_SIZE, len(mv))
+		pos = base
+		while pos < end:
+			n = mv[pos]
+			if(n == 0):
+				break
+			if(pos + 1 + n > end):
+				raise ValueError(f"INT1 message length <{n}> at offset <{pos - base}> runs past the report end")
+			msgs.append(bytes(mv[pos + 1:pos + 1 + n]))
+			pos += 1 + n
+	return msgs
+
+
+
+
+#------------------------------------------------------------
+# Name: Int1Messenger():
+#
+# Description:
+#   Batched INT1 message sender and receiver for one
+#	USB20F_Device.
+#
+#	with Int1Messenger(dev, flush_interval=2) as m:
+#		m.send(b"\x01\x10\x00\x00")
+#		reply = m.recv(timeout=100)
+#
+# Parameters:
+#	dev: opened USB20F_Device
+#	flush_interval: max mS a queued message waits before it is
+#		sent (None - only size triggered and explicit flushes)
+#	flush_size: send as soon as this many bytes of full reports
+#		are queued (multiple of 64)
+#	timeout: transfer timeout in mS (default adaptive for
+#		sends, EP_TIMEOUT for receives)
+#
+#------------------------------------------------------------
+class Int1Messenger(object):
+	def __init__(self, dev, flush_interval=2.0, flush_size=REPORT_SIZE, timeout=None):
+		if(flush_size % REPORT_SIZE or flush_size <= 0):
+			raise ValueError(f"flush_size <{flush_size}> not a multiple of {REPORT_SIZE} bytes!")
+
+		self.dev = dev
+		self.flush_interval = flush_interval
+		self.flush_size = flush_size
+		self.timeout = timeout
+
+		# statistics
+		self.messages_sent = 0
+		self.reports_sent = 0
+		self.transfers = 0
+		self.send_errors = 0
+		self.messages_received = 0
+		self.reports_received = 0
+
+		self._full = bytearray()	# completed reports
+		self._full_msgs = 0
+		self._cur = bytearray()		# report being filled
+		self._cur_msgs = 0
+		self._first_t = None		# queue time of the oldest pending message
+		self._lock = threading.Lock()
+		self._cv = threading.Condition(self._lock)
+		self._rx = deque()
+		self._rx_lock = threading.Lock()
+		self._running = True
+		self._error = None
+
+		self._thread = None
+		if(flush_interval is not None):
+			self._thread = threading.Thread(target=self._flusher, name="Int1Messenger-flush", daemon=True)
+			self._thread.start()
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+	#------------------------------------------------------------
+	# Name: send():
+	#
+	# Description:
+	#   Queue one message. Sends right away when flush_size bytes
+	#	of reports are complete, otherwise the flusher thread
+	#	sends it within flush_interval mS.
+	#
+	# Parameters:
+	#	msg: bytes-like message, 1-63 bytes
+	#
+	# Return:
+	#	NA
+	#	Raises USB20F_Error when a previous background flush
+	#	failed or this call's flush fails (unsent reports stay
+	#	queued and are retried, see send_errors)
+	#
+	#------------------------------------------------------------
+	def send(self, msg):
+		n = len(msg)
+		if(not 0 < n <= MAX_MESSAGE):
+			raise ValueError(f"INT1 message length must be 1-{MAX_MESSAGE} bytes, got <{n}>")
+
+		with self._cv:
+			self._raise_pending_error()
+			if(len(self._cur) + 1 + n > REPORT_SIZE):
+				self._close_report()
+			self._cur.append(n)
+			self._cur += msg
+			self._cur_msgs += 1
+			if(self._first_t is None):
+				self._first_t = time.monotonic()
+				self._cv.notify()
+
+			if(len(self._full) >= self.flush_size):
+				self._flush_locked(partial=False)
+
+
+	#------------------------------------------------------------
+	# Name: flush():
+	#
+	# Description:
+	#   Send everything queued, including a partly filled report.
+	#
+	#------------------------------------------------------------
+	def flush(self):
+		with self._cv:
+			self._raise_pending_error()
+			self._flush_locked(partial=True)
+
+
+	def _raise_pending_error(self):
+		if(self._error is not None):
+			e, self._error = self._error, None
+			raise e
+
+
+	def _close_report(self):
+		self._full += self._cur
+		self._full += bytes(REPORT_SIZE - len(self._cur))
+		self._full_msgs += self._cur_msgs
+		self._cur = bytearray()
+		self._cur_msgs = 0
+
+
+	# called with self._lock held
+	def _flush_locked(self, partial):
+		if(partial and self._cur):
+			self._close_report()
+		if(not self._full):
+			return
+
+		data, nmsg = self._full, self._full_msgs
+		# whole INT1 OUT packets, bridges with a larger INT1 packet
+		# get empty (all zero) reports as filler
+		fill = (-len(data)) % self.dev.packet_size(self.dev._EP_INT1_OUT)
+		try:
+			self.dev.write_int1_raw(data + bytes(fill) if fill else data, self.timeout)
+		except rei_usb_lib.USB20F_Error as e:
+			# reports that made it out are dropped from the queue, the
+			# rest stays queued and is retried after flush_interval
+			sent = min(e.transferred, len(data)) // REPORT_SIZE * REPORT_SIZE
+			if(sent):
+				nsent = len(unpack_reports(data[:sent]))
+				del self._full[:sent]
+				self._full_msgs -= nsent
+				self.reports_sent += sent // REPORT_SIZE
+				self.messages_sent += nsent
+			self.send_errors += 1
+			self._first_t = time.monotonic()
+			raise
+
+		self._full = bytearray()
+		self._full_msgs = 0
+		# messages left in the open report keep their queue time
+		if(not self._cur_msgs):
+			self._first_t = None
+
+		self.transfers += 1
+		self.reports_sent += len(data) // REPORT_SIZE
+		self.messages_sent += nmsg
+
+
+	def _flusher(self):
+		while True:
+			with self._cv:
+				while self._running and self._first_t is None:
+					self._cv.wait()
+				if(not self._running):
+					return
+
+				wait = self._first_t + self.flush_interval / 1000.0 - time.monotonic()
+				if(wait > 0):
+					self._cv.wait(wait)
+					continue
+
+				try:
+					self._flush_locked(partial=True)
+				except rei_usb_lib.USB20F_Error as e:
+					# surfaced on the next send()/flush()
+					self.dev.log.write("ERROR", f"Int1Messenger background flush failed: {e}")
+					self._error = e
+
+
+	#------------------------------------------------------------
+	# Name: recv():
+	#
+	# Description:
+	#   Return the next received message, reading and unpacking
+	#	another INT1 report when none are buffered.
+	#
+	# Parameters:
+	#	timeout: report read timeout in mS
+	#
+	# Return:
+	#	bytes message
+	#	Raises USB20F_TimeoutError when no report arrives
+	#
+	#------------------------------------------------------------
+	def recv(self, timeout=500):
+		with self._rx_lock:
+			while not self._rx:
+				report = self.dev.read_int1_raw(timeout, view=True)
+				self.reports_received += 1
+				self._rx.extend(unpack_reports(report))
+			self.messages_received += 1
+			return self._rx.popleft()
+
+
+	# messages packed per report so far (1.0 = no coalescing gain)
+	@property
+	def packing_ratio(self):
+		return (self.messages_sent / self.reports_sent) if self.reports_sent else 0.0
+
+
+	#------------------------------------------------------------
+	# Name: close():
+	#
+	# Description:
+	#   Send anything still queued and stop the flusher thread.
+	#
+	#------------------------------------------------------------
+	def close(self):
+		try:
+			self.flush()
+		finally:
+			with self._cv:
+				self._running = False
+				self._cv.notify()
+			if(self._thread is not None):
+				self._thread.join()
+			self.dev.log.write("INFO", f"Int1Messenger closed: {self.messages_sent} messages in {self.reports_sent} "
+										f"reports / {self.transfers} transfers")
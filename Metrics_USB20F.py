@@ -0,0 +1,332 @@
+#
+# Title: Metrics_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# OpenMetrics / Prometheus exporter for bridge and transfer
+# statistics, standard library only.
+#
+# - TransferStats is a trace hook (see add_trace_hook()) that
+#	counts transfers, bytes and libusb error codes and keeps a
+#	fixed bucket latency histogram per operation and endpoint
+# - bridge counters (SSITXEC, SSIRXEC ...) are read by one
+#	sampler thread for all bridges at a fixed rate through
+#	Telemetry_USB20F.CounterSampler
+# - a background HTTP server renders the current values on
+#	/metrics, labeled by serial number
+#
+#	exp = MetricsExporter(port=9464)
+#	exp.add(dev)
+#	exp.start()
+#	...
+#	exp.stop()
+#
+#
+# TODO:
+# ----------------------
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# A scrape only formats values that are already held in memory,
+# it never touches the bus, so its cost depends on the number of
+# bridges/endpoints and not on the transfer rate. The transfer
+# path pays one dict lookup, a bisect and a few adds per transfer.
+#
+# Byte counts are the requested transfer sizes of successful
+# transfers (short IN transfers count their full request size).
+#
+
+import time
+import bisect
+import threading
+import libusb as usb
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from USB_SSI_Libs import rei_usb_lib
+from USB_SSI_Libs import Telemetry_USB20F
+
+
+# latency histogram upper bounds in seconds
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+				   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_BUCKETS_NS = tuple(int(b * 1e9) for b in LATENCY_BUCKETS)
+
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+
+
+#------------------------------------------------------------
+# Name: TransferStats():
+#
+# Description:
+#   Transfer counters of one device, updated from the trace
+#	hook post() call.
+#
+#	stats[(op, ep)] = [count, bytes, latency sum (ns),
+#						bucket counts ... , +Inf count]
+#	errors[(ep, code)] = count
+#
+# Parameters:
+#	skip_threads: idents of threads whose transfers aren't
+#		counted (the exporter's own counter sampler)
+#
+#------------------------------------------------------------
+class TransferStats(object):
+	def __init__(self, skip_threads=frozenset()):
+		self.stats = {}
+		self.errors = {}
+		self.skip_threads = skip_threads
+		self._lock = threading.Lock()
+
+
+	def post(self, dev, op, ep, size, address, status, t_start, t_end):
+		if(threading.get_ident() in self.skip_threads):
+			return
+		dt = t_end - t_start
+		key = (op, ep)
+		with self._lock:
+			st = self.stats.get(key)
+			if(st is None):
+				st = self.stats[key] = [0] * (3 + len(_BUCKETS_NS) + 1)
+			st[0] += 1
+			st[2] += dt
+			st[3 + bisect.bisect_left(_BUCKETS_NS, dt)] += 1
+			if(status < 0):
+				ekey = (ep, status)
+				self.errors[ekey] = self.errors.get(ekey, 0) + 1
+			else:
+				st[1] += size
+
+
+	# consistent copy for rendering
+	def snapshot(self):
+		with self._lock:
+			return ({k: list(v) for (k, v) in self.stats.items()}, dict(self.errors))
+
+
+
+
+def _esc(v):
+	return str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+# the libusb binding returns error names as bytes
+def _error_name(code):
+	name = usb.error_name(code)
+	return name.decode("ascii", "replace") if isinstance(name, bytes) else name
+
+
+def _labels(**kw):
+	return "{" + ",".join(f'{k}="{_esc(v)}"' for (k, v) in kw.items()) + "}"
+
+
+
+
+#------------------------------------------------------------
+# Name: MetricsExporter():
+#
+# Description:
+#   HTTP exporter for any number of bridges.
+#
+# Parameters:
+#	port: TCP port (0 - pick a free one, see self.port)
+#	addr: bind address
+#	sample_hz: bridge counter sample rate (0 - no counters)
+#	counters: bridge counter registers to publish
+#
+#------------------------------------------------------------
+class MetricsExporter(object):
+	def __init__(self, port=9464, addr="", sample_hz=1.0, counters=Telemetry_USB20F.COUNTER_NAMES):
+		self.port = port
+		self.addr = addr
+		self.sample_hz = sample_hz
+		self.counters = tuple(counters)
+		self.scrapes = 0
+
+		self._devs = {}			# serial -> (dev, TransferStats, CounterSampler)
+		self._sampler_threads = set()	# not counted by TransferStats
+		self._lock = threading.Lock()
+		self._stop_evt = threading.Event()
+		self._server = None
+		self._threads = []
+
+
+	@staticmethod
+	def _serial(dev):
+		return dev.sn_string_d.rstrip("\x00")
+
+
+	#------------------------------------------------------------
+	# Name: add() / remove():
+	#
+	# Description:
+	#   Start / stop publishing an opened bridge.
+	#
+	#------------------------------------------------------------
+	def add(self, dev):
+		stats = TransferStats(self._sampler_threads)
+		sampler = Telemetry_USB20F.CounterSampler(dev, size=2, counters=self.counters) if self.sample_hz else None
+		dev.add_trace_hook(stats)
+		with self._lock:
+			self._devs[self._serial(dev)] = (dev, stats, sampler)
+
+
+	def remove(self, dev):
+		with self._lock:
+			entry = self._devs.pop(self._serial(dev), None)
+		if(entry is not None):
+			dev.remove_trace_hook(entry[1])
+
+
+	#------------------------------------------------------------
+	# Name: start() / stop():
+	#
+	# Description:
+	#   Start / stop the HTTP server thread and the counter
+	#	sampler thread.
+	#
+	#------------------------------------------------------------
+	def start(self):
+		exporter = self
+
+		class Handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if(self.path.split("?")[0] != "/metrics"):
+					self.send_error(404)
+					return
+				om = "application/openmetrics-text" in self.headers.get("Accept", "")
+				body = exporter.render(openmetrics=om).encode("utf-8")
+				self.send_response(200)
+				self.send_header("Content-Type", OPENMETRICS_TYPE if om else PROMETHEUS_TYPE)
+				self.send_header("Content-Length", str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self, *args):
+				pass
+
+		self._stop_evt.clear()
+		self._server = ThreadingHTTPServer((self.addr, self.port), Handler)
+		self._server.daemon_threads = True
+		self.port = self._server.server_address[1]
+		self._threads = [threading.Thread(target=self._server.serve_forever, name="MetricsExporter-http", daemon=True)]
+		if(self.sample_hz):
+			self._threads.append(threading.Thread(target=self._sampler, name="MetricsExporter-sampler", daemon=True))
+		for t in self._threads:
+			t.start()
+
+
+	def stop(self):
+		self._stop_evt.set()
+		if(self._server is not None):
+			self._server.shutdown()
+			self._server.server_close()
+			self._server = None
+		for t in self._threads:
+			t.join()
+		self._threads = []
+
+
+	def __enter__(self):
+		self.start()
+		return self
+
+
+	def __exit__(self, *exc):
+		self.stop()
+
+
+	def _sampler(self):
+		# the counter reads are ours, keep them out of the transfer stats
+		self._sampler_threads.add(threading.get_ident())
+		period = 1.0 / self.sample_hz
+		next_t = time.monotonic()
+		while not self._stop_evt.is_set():
+			with self._lock:
+				entries = list(self._devs.values())
+			for (dev, stats, sampler) in entries:
+				try:
+					sampler.sample()
+				except rei_usb_lib.USB20F_Error as e:
+					sampler.errors += 1
+					dev.log.write("WARNING", f"MetricsExporter counter read failed: {e}")
+
+			next_t += period
+			now = time.monotonic()
+			if(next_t < now):
+				next_t = now
+			self._stop_evt.wait(next_t - now)
+
+
+	#------------------------------------------------------------
+	# Name: render():
+	#
+	# Description:
+	#   Text exposition of all metrics, Prometheus 0.0.4 format
+	#	or OpenMetrics 1.0 (openmetrics=True).
+	#
+	#------------------------------------------------------------
+	def render(self, openmetrics=False):
+		self.scrapes += 1
+		with self._lock:
+			entries = sorted(self._devs.items())
+
+		out = []
+
+		def family(name, kind, help_text, samples):
+			total = kind == "counter"
+			fam = name if (openmetrics or not total) else f"{name}_total"
+			out.append(f"# HELP {fam} {help_text}")
+			out.append(f"# TYPE {fam} {kind}")
+			for (suffix, labels, value) in samples:
+				out.append(f"{name}{'_total' if total else suffix}{labels} {value}")
+
+		up = []
+		transfers = []
+		nbytes = []
+		errors = []
+		latency = []
+		counters = []
+		sample_errors = []
+
+		for (sn, (dev, stats, sampler)) in entries:
+			up.append(("", _labels(serial=sn), 1))
+			st, err = stats.snapshot()
+			for ((op, ep), v) in sorted(st.items()):
+				lab = dict(serial=sn, op=op, endpoint=f"{ep:#04x}")
+				transfers.append(("", _labels(**lab), v[0]))
+				nbytes.append(("", _labels(**lab), v[1]))
+				acc = 0
+				for (le, n) in zip(LATENCY_BUCKETS, v[3:]):
+					acc += n
+					latency.append(("_bucket", _labels(**lab, le=repr(le)), acc))
+				latency.append(("_bucket", _labels(**lab, le="+Inf"), v[0]))
+				latency.append(("_count", _labels(**lab), v[0]))
+				latency.append(("_sum", _labels(**lab), v[2] / 1e9))
+			for ((ep, code), n) in sorted(err.items()):
+				errors.append(("", _labels(serial=sn, endpoint=f"{ep:#04x}", code=code,
+										   error=_error_name(code)), n))
+
+			if(sampler is not None):
+				sample_errors.append(("", _labels(serial=sn), sampler.errors))
+				latest = sampler.ring.latest()
+				if(latest is not None):
+					for (name, value) in latest[1].items():
+						counters.append(("", _labels(serial=sn, register=name), value))
+
+		family("usb20f_up", "gauge", "Bridge registered with the exporter.", up)
+		family("usb20f_transfers", "counter", "Transfers and register operations.", transfers)
+		family("usb20f_transfer_bytes", "counter", "Bytes requested by successful transfers.", nbytes)
+		family("usb20f_transfer_errors", "counter", "Failed transfers by libusb error code.", errors)
+		family("usb20f_transfer_latency_seconds", "histogram", "Transfer and register operation latency.", latency)
+		family("usb20f_bridge_counter", "counter", "Bridge frame/error counters (64-bit unwrapped).", counters)
+		family("usb20f_counter_sample_errors", "counter", "Failed bridge counter reads.", sample_errors)
+
+		if(openmetrics):
+			out.append("# EOF")
+		return "\n".join(out) + "\n"
@@ -0,0 +1,485 @@
+#
+# Title: ProcessPool_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# Runs USB20F bridges in worker processes so bulk capture from
+# many bridges isn't limited by one interpreter's GIL.
+#
+# - each worker process owns one or more USB20F_Device objects
+#	(one group of serial numbers per worker)
+# - bulk RX data is written by the worker straight into a
+#	multiprocessing.shared_memory ring per bridge, the parent
+#	reads it from the ring, no pickling of payload data
+# - control calls (read_reg(), write_reg(), any other device
+#	method) are proxied over a multiprocessing Pipe as small
+#	(method, args, kwargs) tuples
+#
+#
+# TODO:
+# ----------------------
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# Workers are started with the "spawn" start method, libusb
+# contexts must not be inherited across fork(). Scripts using
+# BridgePool need the usual if __name__ == "__main__": guard.
+#
+# SharedRing is single producer (worker) / single consumer
+# (parent). Read/write positions are free running 64-bit byte
+# counters stored in the first bytes of the shared block.
+#
+
+import os
+import sys
+import struct
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory, resource_tracker
+from USB_SSI_Libs import rei_usb_lib
+
+
+# ring header: <write_pos:u64><read_pos:u64><dropped:u64>
+_RING_HDR = struct.Struct("<QQQ")
+_RING_HDR_SIZE = 64
+
+# before Python 3.13 attaching to a block registers it with the
+# resource tracker just like creating it (POSIX only)
+_ATTACH_TRACKED = sys.version_info < (3, 13) and os.name == "posix"
+
+
+
+
+#------------------------------------------------------------
+# Name: BridgePoolError():
+#
+# Description:
+#   Raised in the parent when a proxied call fails in a worker
+#	or a worker can't open its bridge.
+#
+#------------------------------------------------------------
+class BridgePoolError(Exception):
+	pass
+
+
+
+
+#------------------------------------------------------------
+# Name: SharedRing():
+#
+# Description:
+#   Single producer / single consumer byte ring in shared
+#	memory.
+#
+# Parameters:
+#	size: data capacity in bytes
+#	name: shared memory block name (attach to an existing ring
+#		when create is False)
+#	create: create a new block (parent) or attach (worker)
+#
+#------------------------------------------------------------
+class SharedRing(object):
+	def __init__(self, size, name=None, create=True):
+		self.size = size
+		if(create):
+			self.shm = shared_memory.SharedMemory(name=name, create=True, size=_RING_HDR_SIZE + size)
+		elif(_ATTACH_TRACKED):
+			# the creator owns the block - keep the worker from
+			# unlinking it again or reporting it as leaked
+			self.shm = shared_memory.SharedMemory(name=name, size=_RING_HDR_SIZE + size)
+			resource_tracker.unregister(self.shm._name, "shared_memory")
+		else:
+			self.shm = shared_memory.SharedMemory(name=name, size=_RING_HDR_SIZE + size, track=False)
+		self.name = self.shm.name
+		self._hdr = self.shm.buf[:_RING_HDR_SIZE]
+		self.data = self.shm.buf[_RING_HDR_SIZE:_RING_HDR_SIZE + size]
+
+		if(create):
+			_RING_HDR.pack_into(self._hdr, 0, 0, 0, 0)
+
+
+	def _positions(self):
+		return _RING_HDR.unpack_from(self._hdr, 0)
+
+
+	def available(self):
+		w, r, d = self._positions()
+		return w - r
+
+
+	def free(self):
+		return self.size - self.available()
+
+
+	def dropped(self):
+		return self._positions()[2]
+
+
+	#------------------------------------------------------------
+	# Name: write_slot():
+	#
+	# Description:
+	#   Producer side. Return a writable memoryview of up to n
+	#	contiguous free bytes (shorter at the end of the ring),
+	#	or None when the ring is full. commit() publishes the
+	#	bytes actually written.
+	#
+	#------------------------------------------------------------
+	def write_slot(self, n):
+		w, r, d = self._positions()
+		free = self.size - (w - r)
+		if(free <= 0):
+			return None
+		idx = w % self.size
+		n = min(n, free, self.size - idx)
+		return self.data[idx:idx + n]
+
+
+	def commit(self, n):
+		w = self._positions()[0]
+		struct.pack_into("<Q", self._hdr, 0, w + n)
+
+
+	def drop(self, n):
+		d = self._positions()[2]
+		struct.pack_into("<Q", self._hdr, 16, d + n)
+
+
+	def write(self, data):
+		mv = memoryview(data).cast("B")
+		if(len(mv) > self.free()):
+			self.drop(len(mv))
+			return False
+
+		off = 0
+		while off < len(mv):
+			slot = self.write_slot(len(mv) - off)
+			slot[:] = mv[off:off + len(slot)]
+			self.commit(len(slot))
+			off += len(slot)
+		return True
+
+
+	#------------------------------------------------------------
+	# Name: readinto():
+	#
+	# Description:
+	#   Consumer side. Copy up to len(buf) available bytes into
+	#	buf and return the count.
+	#
+	#------------------------------------------------------------
+	def readinto(self, buf):
+		out = memoryview(buf).cast("B")
+		w, r, d = self._positions()
+		n = min(len(out), w - r)
+		idx = r % self.size
+		first = min(n, self.size - idx)
+		out[:first] = self.data[idx:idx + first]
+		if(n > first):
+			out[first:n] = self.data[:n - first]
+		struct.pack_into("<Q", self._hdr, 8, r + n)
+		return n
+
+
+	def read(self, n=None):
+		if(n is None):
+			n = self.available()
+		buf = bytearray(min(n, self.available()))
+		n = self.readinto(buf)
+		return bytes(buf[:n])
+
+
+	def close(self):
+		self._hdr.release()
+		self.data.release()
+		self.shm.close()
+
+
+	def unlink(self):
+		self.shm.unlink()
+
+
+	# creator side, after a worker attached: spawned workers share
+	# the parent's resource tracker, so the worker's unregister
+	# dropped the creator's entry as well
+	def retrack(self):
+		if(_ATTACH_TRACKED):
+			resource_tracker.register(self.shm._name, "shared_memory")
+
+
+
+
+#------------------------------------------------------------
+# Name: _worker_main():
+#
+# Description:
+#   Worker process entry point. Opens every bridge of its group,
+#	then serves RPC requests from the parent and, while capture
+#	is enabled, receives bulk data into the bridges' rings.
+#
+#	Requests: ("call", sn, method, args, kwargs)
+#			  ("capture", sn, enable, chunk, timeout)
+#			  ("stop",)
+#	Replies:  (0, result) or (1, error string)
+#
+#------------------------------------------------------------
+def _worker_main(conn, group, rings, vid, pid, quiet):
+	devs = {}
+	attached = {}
+	capture = {}
+
+	# attach every ring first, the parent re-registers them all
+	# once it has the first reply
+	for sn in group:
+		attached[sn] = SharedRing(rings[sn][1], name=rings[sn][0], create=False)
+
+	for sn in group:
+		dev = rei_usb_lib.USB20F_Device(quiet=quiet, name=f"pool-{sn}")
+		r = dev.open_usb(vid, pid, sn=sn)
+		if(r[0]):
+			conn.send((1, f"failed to open bridge <{sn}>, error code <{r[1]}>"))
+			for d in devs.values():
+				d.close_usb()
+			return
+		devs[sn] = dev
+
+	conn.send((0, list(devs)))
+
+	running = True
+	while running:
+		# block on the pipe when idle, only peek while capturing
+		if(conn.poll(0 if capture else None)):
+			req = conn.recv()
+
+			if(req[0] == "stop"):
+				running = False
+				conn.send((0, 0))
+
+			elif(req[0] == "capture"):
+				_, sn, enable, chunk, timeout = req
+				pkt = devs[sn].packet_size(devs[sn]._EP_BULK_IN)
+				if(not enable):
+					capture.pop(sn, None)
+					conn.send((0, 0))
+				elif(chunk <= 0 or chunk % pkt):
+					conn.send((1, f"chunk must be a multiple of {pkt} bytes!"))
+				else:
+					capture[sn] = (chunk, timeout, bytearray(chunk))
+					conn.send((0, 0))
+
+			elif(req[0] == "call"):
+				_, sn, method, args, kwargs = req
+				try:
+					result = getattr(devs[sn], method)(*args, **kwargs)
+					conn.send((0, result))
+				except Exception as e:
+					try:
+						conn.send((1, f"{type(e).__name__}: {e}"))
+					except Exception:
+						conn.send((1, "unpicklable error"))
+
+			else:
+				conn.send((1, f"unknown request <{req[0]}>"))
+
+		for sn in list(capture):
+			chunk, timeout, scratch = capture[sn]
+			ring = attached[sn]
+			slot = ring.write_slot(chunk)
+			try:
+				if(slot is None):
+					# parent isn't keeping up - receive and drop
+					ring.drop(devs[sn].rec_bulk_into(scratch, timeout))
+				elif(len(slot) == chunk):
+					# receive straight into shared memory
+					ring.commit(devs[sn].rec_bulk_into(slot, timeout))
+				else:
+					# free space wraps the ring end, go through scratch
+					n = devs[sn].rec_bulk_into(scratch, timeout)
+					ring.write(memoryview(scratch)[:n])
+			except rei_usb_lib.USB20F_TimeoutError:
+				pass
+			except Exception as e:
+				# stop this capture, the worker keeps serving the others
+				devs[sn].log.write("ERROR", f"capture stopped on <{sn}>: {e}")
+				capture.pop(sn, None)
+			finally:
+				# drop the shared memory export before the next loop
+				if(slot is not None):
+					slot.release()
+
+	for sn in devs:
+		attached[sn].close()
+		devs[sn].close_usb()
+
+
+
+
+#------------------------------------------------------------
+# Name: BridgePool():
+#
+# Description:
+#   Parent side of the process pool. Starts one worker process
+#	per group of bridges, proxies control calls and exposes the
+#	bulk RX rings.
+#
+# Parameters:
+#	groups: list of serial numbers or of tuples of serial
+#		numbers - each element is one worker process
+#	vid/pid: bridge VID/PID
+#	ring_size: shared memory ring size per bridge (bytes)
+#	quiet: worker logging console mode
+#
+#------------------------------------------------------------
+class BridgePool(object):
+	def __init__(self, groups, vid=0x1cbf, pid=0x0007, ring_size=16 * 1024 * 1024, quiet=True):
+		self.groups = [(g,) if isinstance(g, str) else tuple(g) for g in groups]
+		self.vid = vid
+		self.pid = pid
+		self.ring_size = ring_size
+		self.quiet = quiet
+		self.rings = {}
+		self._procs = []
+		self._conn = {}
+		self._locks = {}
+		self._ctx = mp.get_context("spawn")
+
+
+	def __enter__(self):
+		self.start()
+		return self
+
+
+	def __exit__(self, *exc):
+		self.stop()
+
+
+	#------------------------------------------------------------
+	# Name: start():
+	#
+	# Description:
+	#   Create the rings and start the workers. Raises
+	#	BridgePoolError when a worker fails to open a bridge.
+	#
+	#------------------------------------------------------------
+	def start(self):
+		for group in self.groups:
+			for sn in group:
+				self.rings[sn] = SharedRing(self.ring_size)
+
+			parent_conn, child_conn = self._ctx.Pipe()
+			ring_names = {sn: (self.rings[sn].name, self.ring_size) for sn in group}
+			p = self._ctx.Process(target=_worker_main, name=f"BridgePool-{'-'.join(group)}",
+									args=(child_conn, group, ring_names, self.vid, self.pid, self.quiet),
+									daemon=True)
+			p.start()
+			self._procs.append(p)
+
+			lock = threading.Lock()
+			for sn in group:
+				self._conn[sn] = parent_conn
+				self._locks[sn] = lock
+
+			ok, result = parent_conn.recv()
+			for sn in group:
+				self.rings[sn].retrack()
+			if(ok != 0):
+				self.stop()
+				raise BridgePoolError(result)
+
+
+	def _request(self, sn, req):
+		with self._locks[sn]:
+			self._conn[sn].send(req)
+			ok, result = self._conn[sn].recv()
+		if(ok != 0):
+			raise BridgePoolError(f"<{sn}> {result}")
+		return result
+
+
+	#------------------------------------------------------------
+	# Name: call():
+	#
+	# Description:
+	#   Call a USB20F_Device method in the worker owning bridge
+	#	sn. Arguments and the result must be picklable.
+	#
+	#------------------------------------------------------------
+	def call(self, sn, method, *args, **kwargs):
+		return self._request(sn, ("call", sn, method, args, kwargs))
+
+
+	def read_reg(self, sn, address):
+		return self.call(sn, "read_reg", address)
+
+
+	def write_reg(self, sn, address, data, mask=0xFFFFFFFF):
+		self.call(sn, "write_reg", address, data, mask)
+
+
+	#------------------------------------------------------------
+	# Name: start_capture():
+	#
+	# Description:
+	#   Start receiving bulk data into the ring of bridge sn (or
+	#	of every bridge when sn is None). chunk is the bulk
+	#	transfer size and must be a multiple of the bridge's
+	#	bulk packet size (64 bytes full speed, 512 high speed).
+	#
+	#------------------------------------------------------------
+	def start_capture(self, sn=None, chunk=16384, timeout=100):
+		for s in ([sn] if sn is not None else list(self.rings)):
+			self._request(s, ("capture", s, True, chunk, timeout))
+
+
+	def stop_capture(self, sn=None):
+		for s in ([sn] if sn is not None else list(self.rings)):
+			self._request(s, ("capture", s, False, 0, 0))
+
+
+	def readinto(self, sn, buf):
+		return self.rings[sn].readinto(buf)
+
+
+	def read(self, sn, n=None):
+		return self.rings[sn].read(n)
+
+
+	def stats(self, sn):
+		w, r, d = self.rings[sn]._positions()
+		return {"received": w, "consumed": r, "dropped": d, "pending": w - r}
+
+
+	#------------------------------------------------------------
+	# Name: stop():
+	#
+	# Description:
+	#   Stop every worker and release the shared memory rings.
+	#
+	#------------------------------------------------------------
+	def stop(self, timeout=5.0):
+		done = set()
+		for sn, conn in self._conn.items():
+			if(id(conn) in done):
+				continue
+			done.add(id(conn))
+			try:
+				self._request(sn, ("stop",))
+			except (BridgePoolError, EOFError, OSError):
+				pass
+
+		for p in self._procs:
+			p.join(timeout)
+			if(p.is_alive()):
+				p.terminate()
+
+		for ring in self.rings.values():
+			ring.close()
+			ring.unlink()
+
+		self._procs = []
+		self._conn = {}
+		self._locks = {}
+		self.rings = {}
@@ -0,0 +1,236 @@
+#
+# Title: RegDiff_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# Register snapshot compare and watch tools.
+#
+# - diff(a, b) compares two RegSnapshots (USB20F_Device.snapshot())
+#	and decodes every changed register down to its fields
+# - watch() re-reads only the volatile registers at a fixed
+#	interval and reports each change as it happens
+#
+#	a = dev.snapshot()
+#	...
+#	b = dev.snapshot()
+#	for line in format_diff(diff(a, b)):
+#		print(line)
+#
+#
+# TODO:
+# ----------------------
+# 1. Add the named CR1/CR2/status register fields to REG_FIELDS.
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# Fields are decoded from REG_FIELDS. Registers without an entry
+# are decoded bit by bit ("bit0" ... "bit31"). Counter fields
+# (kind "count") report the wrap-safe delta instead of raw bits.
+# Applications can add their own field definitions:
+#
+#	REG_FIELDS["CR1"] = (("enable", 0, 1, "bits"), ("mode", 4, 3, "bits"))
+#
+
+import time
+from USB_SSI_Libs import rei_usb_lib
+
+
+# field definitions: register name -> ((field, shift, width, kind), ...)
+#	kind "bits" - plain bit field, "count" - free running counter
+REG_FIELDS = {n: (("count", 0, 32, "count"),) for n in (
+	"USBBLKRXFC", "USBIF0RXFC", "USBIF1RXFC", "SSITXFC", "SSITXEC", "SSIRXFC", "SSIRXEC", "SIRXFSSCNT")}
+# scratch and counter mode data registers hold whole 32-bit words
+REG_FIELDS.update({n: (("value", 0, 32, "bits"),) for n in
+				   ("SCRTCH1", "SCRTCH2", "SCRTCH3", "SCRTCH4") +
+				   tuple(f"CTRTXDATA{i}" for i in range(8)) + tuple(f"CTRRXDATA{i}" for i in range(8))})
+
+_BIT_FIELDS = tuple((f"bit{i}", i, 1, "bits") for i in range(32))
+
+
+
+
+#------------------------------------------------------------
+# Name: FieldChange():
+#
+# Description:
+#   One changed field of a register. delta is set for counter
+#	fields (wrap-safe new - old), None otherwise.
+#
+#------------------------------------------------------------
+class FieldChange(object):
+	__slots__ = ("field", "old", "new", "delta")
+
+	def __init__(self, field, old, new, delta=None):
+		self.field = field
+		self.old = old
+		self.new = new
+		self.delta = delta
+
+	def __repr__(self):
+		if(self.delta is not None):
+			return f"{self.field}: {self.old} -> {self.new} (+{self.delta})"
+		return f"{self.field}: {self.old:#x} -> {self.new:#x}"
+
+
+
+
+#------------------------------------------------------------
+# Name: RegChange():
+#
+# Description:
+#   One changed register with its decoded field changes.
+#
+#------------------------------------------------------------
+class RegChange(object):
+	__slots__ = ("name", "address", "old", "new", "fields")
+
+	def __init__(self, name, address, old, new, fields):
+		self.name = name
+		self.address = address
+		self.old = old
+		self.new = new
+		self.fields = fields
+
+	def __repr__(self):
+		return (f"RegChange({self.name} @ {self.address:#010x}: {self.old:#010x} -> {self.new:#010x}, "
+				f"{', '.join(repr(f) for f in self.fields)})")
+
+
+
+
+#------------------------------------------------------------
+# Name: decode():
+#
+# Description:
+#   Split a register value into its fields.
+#
+# Return:
+#	{field name: value}
+#
+#------------------------------------------------------------
+def decode(name, value):
+	return {f: (value >> shift) & ((1 << width) - 1)
+			for (f, shift, width, kind) in REG_FIELDS.get(name, _BIT_FIELDS)}
+
+
+def _field_changes(name, old, new):
+	out = []
+	changed = old ^ new
+	for (f, shift, width, kind) in REG_FIELDS.get(name, _BIT_FIELDS):
+		mask = ((1 << width) - 1) << shift
+		if(not changed & mask):
+			continue
+		o = (old & mask) >> shift
+		n = (new & mask) >> shift
+		delta = ((n - o) & ((1 << width) - 1)) if kind == "count" else None
+		out.append(FieldChange(f, o, n, delta))
+	return out
+
+
+
+
+#------------------------------------------------------------
+# Name: diff():
+#
+# Description:
+#   Compare two register snapshots. Registers present in only
+#	one of them are ignored.
+#
+# Parameters:
+#	a: older RegSnapshot
+#	b: newer RegSnapshot
+#	names: optional subset of register names to compare
+#
+# Return:
+#	list of RegChange in address order
+#
+#------------------------------------------------------------
+def diff(a, b, names=None):
+	out = []
+	if(a.names is b.names or a.names == b.names):
+		pairs = zip(a.names, a.addresses, a.values, b.values)
+	else:
+		pairs = ((n, ad, va, b[n]) for (n, ad, va) in zip(a.names, a.addresses, a.values) if n in b)
+
+	for (name, addr, old, new) in pairs:
+		if(old == new or (names is not None and name not in names)):
+			continue
+		out.append(RegChange(name, addr, old, new, _field_changes(name, old, new)))
+	out.sort(key=lambda c: c.address)
+	return out
+
+
+
+
+#------------------------------------------------------------
+# Name: format_diff():
+#
+# Description:
+#   One text line per changed register.
+#
+#------------------------------------------------------------
+def format_diff(changes):
+	return [f"{c.name:<12}{c.address:#010x}  {c.old:#010x} -> {c.new:#010x}  "
+			f"{', '.join(repr(f) for f in c.fields)}" for c in changes]
+
+
+
+
+#------------------------------------------------------------
+# Name: watch():
+#
+# Description:
+#   Take a full snapshot, then re-read only the volatile
+#	registers every interval seconds and report what changed
+#	since the previous read.
+#
+# Parameters:
+#	dev: opened USB20F_Device
+#	interval: poll period in seconds
+#	duration: stop after this many seconds (None - until
+#		KeyboardInterrupt or on_change returns False)
+#	names: registers to re-read (default VOLATILE_REGS)
+#	ignore: registers whose changes aren't reported (e.g.
+#		counters that always run)
+#	on_change: callback(changes, snapshot), default logs the
+#		changes through dev.log
+#
+# Return:
+#	last RegSnapshot
+#
+#------------------------------------------------------------
+def watch(dev, interval=0.1, duration=None, names=None, ignore=(), on_change=None):
+	names = rei_usb_lib.VOLATILE_REGS if names is None else frozenset(names)
+	report = names - frozenset(ignore)
+	snap = dev.snapshot()
+	end = None if duration is None else time.monotonic() + duration
+	next_t = time.monotonic()
+
+	try:
+		while end is None or time.monotonic() < end:
+			next_t += interval
+			delay = next_t - time.monotonic()
+			if(delay > 0):
+				time.sleep(delay)
+			else:
+				next_t = time.monotonic()
+
+			new = dev.snapshot(names, base=snap)
+			changes = diff(snap, new, report)
+			snap = new
+			if(not changes):
+				continue
+
+			if(on_change is not None):
+				if(on_change(changes, snap) is False):
+					break
+			else:
+				for line in format_diff(changes):
+					dev.log.write("INFO", f"watch: {line}")
+	except KeyboardInterrupt:
+		pass
+
+	return snap
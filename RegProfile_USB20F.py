@@ -0,0 +1,215 @@
+#
+# Title: RegProfile_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# Named register profiles. A profile is a set of (value, mask)
+# pairs for the bridge configuration registers. It can be
+# captured from a bridge, saved to / loaded from a JSON file and
+# applied to a bridge.
+#
+# Applying a profile reads the current register values in one
+# batch, computes the minimal set of masked writes (only the bits
+# that differ) and sends them back to back with write_regs(),
+# optionally verified. Registers that already hold the target
+# values cost no writes.
+#
+#	p = RegProfile.capture(dev, "ssi_16bit")
+#	p.save("profiles.json")
+#	...
+#	load_profile("profiles.json", "ssi_16bit").apply(dev, verify=True)
+#
+#
+# TODO:
+# ----------------------
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# Profile file layout (one file can hold many profiles):
+#
+#	{
+#		"ssi_16bit": {
+#			"description": "...",
+#			"registers": {"CR1": {"value": "0x00000015", "mask": "0xffffffff"}, ...}
+#		},
+#		...
+#	}
+#
+# Volatile registers (status, counters) and SKEY are never
+# captured, they aren't configuration. CTRMODECR isn't captured
+# either, it holds the counter mode generator enable, applying a
+# profile would start or stop the generator (see CounterMode).
+#
+
+import os
+import json
+import time
+from USB_SSI_Libs import rei_usb_lib
+
+
+# registers captured by default
+PROFILE_REGS = tuple(n for n in rei_usb_lib.REG_NAMES
+					 if n not in rei_usb_lib.VOLATILE_REGS and n not in ("SKEY", "CTRMODECR"))
+
+
+
+
+#------------------------------------------------------------
+# Name: RegProfile():
+#
+# Description:
+#   One named register profile.
+#
+# Parameters:
+#	name: profile name
+#	registers: {register name: (value, mask)} or
+#		{register name: value} (full 32-bit mask)
+#	description: free text
+#
+#------------------------------------------------------------
+class RegProfile(object):
+	def __init__(self, name, registers, description=""):
+		self.name = name
+		self.description = description
+		self.registers = {}
+		for (reg, v) in registers.items():
+			if(reg not in rei_usb_lib.REG_NAMES):
+				raise ValueError(f"unknown register <{reg}> in profile <{name}>")
+			value, mask = v if isinstance(v, (tuple, list)) else (v, 0xFFFFFFFF)
+			self.registers[reg] = (value & 0xFFFFFFFF, mask & 0xFFFFFFFF)
+
+
+	def __repr__(self):
+		return f"RegProfile({self.name!r}, {len(self.registers)} registers)"
+
+
+	#------------------------------------------------------------
+	# Name: capture():
+	#
+	# Description:
+	#   Build a profile from the current bridge state (one batched
+	#	read of names, default PROFILE_REGS).
+	#
+	#------------------------------------------------------------
+	@classmethod
+	def capture(cls, dev, name, names=None, description=""):
+		snap = dev.snapshot(names if names is not None else PROFILE_REGS)
+		return cls(name, dict(snap.items()), description)
+
+
+	def to_dict(self):
+		return {"description": self.description,
+				"registers": {reg: {"value": f"{v:#010x}", "mask": f"{m:#010x}"}
+							  for (reg, (v, m)) in self.registers.items()}}
+
+
+	@classmethod
+	def from_dict(cls, name, d):
+		regs = {reg: (int(e["value"], 0), int(e.get("mask", "0xffffffff"), 0))
+				for (reg, e) in d["registers"].items()}
+		return cls(name, regs, d.get("description", ""))
+
+
+	#------------------------------------------------------------
+	# Name: save():
+	#
+	# Description:
+	#   Store the profile in a JSON profile file, replacing a
+	#	profile of the same name and keeping the others.
+	#
+	#------------------------------------------------------------
+	def save(self, path):
+		profiles = _read_file(path) if os.path.exists(path) else {}
+		profiles[self.name] = self.to_dict()
+		tmp = f"{path}.tmp"
+		with open(tmp, "w") as f:
+			json.dump(profiles, f, indent="\t")
+		os.replace(tmp, path)
+
+
+	#------------------------------------------------------------
+	# Name: plan():
+	#
+	# Description:
+	#   Minimal writes that bring the bridge to this profile.
+	#
+	# Parameters:
+	#	dev: USB20F_Device (register addresses)
+	#	current: RegSnapshot or {register name: value} holding at
+	#		least the profile's registers
+	#
+	# Return:
+	#	list of (address, data, mask) for write_regs(), the mask
+	#	only covers the bits that differ
+	#
+	#------------------------------------------------------------
+	def plan(self, dev, current):
+		writes = []
+		for (reg, (value, mask)) in self.registers.items():
+			cur = current[reg]
+			bits = (cur ^ value) & mask
+			if(bits):
+				writes.append((getattr(dev, f"{reg}_ADDR"), value, bits))
+		return writes
+
+
+	#------------------------------------------------------------
+	# Name: apply():
+	#
+	# Description:
+	#   Read the profile registers in one batch and write only
+	#	what differs.
+	#
+	# Parameters:
+	#	dev: opened USB20F_Device
+	#	verify: read back the written registers
+	#
+	# Return:
+	#	list of (address, data, mask) writes issued
+	#	Raises USB20F_VerifyError when verify fails
+	#
+	#------------------------------------------------------------
+	def apply(self, dev, verify=False):
+		t0 = time.perf_counter()
+		current = dev.snapshot(tuple(self.registers))
+		writes = self.plan(dev, current)
+		if(writes):
+			dev.write_regs(writes, verify=verify)
+		dev.log.write("INFO", f"profile <{self.name}> applied: {len(writes)} of {len(self.registers)} registers "
+								f"written in {(time.perf_counter() - t0) * 1000:.3f} mS")
+		return writes
+
+
+
+
+def _read_file(path):
+	with open(path, "r") as f:
+		return json.load(f)
+
+
+
+
+#------------------------------------------------------------
+# Name: load_profile():
+#
+# Description:
+#   Load one profile by name from a profile file. name may be
+#	omitted when the file holds a single profile.
+#
+#------------------------------------------------------------
+def load_profile(path, name=None):
+	profiles = _read_file(path)
+	if(name is None):
+		if(len(profiles) != 1):
+			raise ValueError(f"<{path}> holds {len(profiles)} profiles, pass a name: {sorted(profiles)}")
+		name = next(iter(profiles))
+	if(name not in profiles):
+		raise KeyError(f"no profile <{name}> in <{path}>, available: {sorted(profiles)}")
+	return RegProfile.from_dict(name, profiles[name])
+
+
+def list_profiles(path):
+	return sorted(_read_file(path))
@@ -0,0 +1,349 @@
+#
+# Title: Scheduler_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# Per-device command scheduler for mixed control and bulk
+# traffic on one USB20F_Device handle.
+#
+# - one worker thread per bridge interface (INT0 registers, INT1
+#	messages, BULK data), so a long bulk transfer never blocks a
+#	register access and each interface is used by one thread only
+# - per interface priority queue: lower priority class value runs
+#	first, earliest deadline first within a class, FIFO otherwise
+# - optional deadlines: a request still queued when its deadline
+#	passes is failed with DeadlineExceeded instead of being run
+# - queueing delay statistics per priority class
+#
+#
+# TODO:
+# ----------------------
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# Requests return concurrent.futures.Future objects. Bulk payloads
+# submitted through send_stream() are split into bulk_chunk sized
+# requests so higher priority bulk work can run in between.
+#
+# Only the fast-path device methods (read_reg(), send_stream() ...)
+# are proxied. The legacy methods (read_InternalReg(), send_bulk()
+# ...) share self.EP_SIZE and self.ep_data_in/out across interfaces
+# and are not safe to run on two interface workers at the same
+# time, call() rejects them.
+#
+
+import time
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+
+
+# priority classes
+PRIO_CONTROL = 0
+PRIO_MESSAGE = 1
+PRIO_BULK = 2
+
+PRIO_NAMES = {PRIO_CONTROL: "control", PRIO_MESSAGE: "message", PRIO_BULK: "bulk"}
+
+# interfaces
+IF_INT0 = 0
+IF_INT1 = 1
+IF_BULK = 2
+
+# interface used by each proxied device method
+_METHOD_IF = {
+	"read_reg": IF_INT0, "read_reg_packet": IF_INT0, "write_reg": IF_INT0,
+	"read_regs": IF_INT0, "write_regs": IF_INT0, "wait_for": IF_INT0, "wait_for_all": IF_INT0,
+	"read_int1_into": IF_INT1, "read_int1_raw": IF_INT1, "write_int1_raw": IF_INT1,
+	"send_bulk_raw": IF_BULK, "rec_bulk_into": IF_BULK,
+	"rec_bulk_array": IF_BULK, "send_stream": IF_BULK, "send_file": IF_BULK, "capture_to_file": IF_BULK,
+}
+
+
+
+
+#------------------------------------------------------------
+# Name: DeadlineExceeded():
+#
+# Description:
+#   Set on a request's Future when its deadline passed before
+#	it could be started.
+#
+#------------------------------------------------------------
+class DeadlineExceeded(Exception):
+	pass
+
+
+
+
+#------------------------------------------------------------
+# Name: ClassStats():
+#
+# Description:
+#   Queueing delay statistics of one priority class (seconds).
+#
+#------------------------------------------------------------
+class ClassStats(object):
+	__slots__ = ("count", "expired", "total_delay", "max_delay")
+
+	def __init__(self):
+		self.count = 0
+		self.expired = 0
+		self.total_delay = 0.0
+		self.max_delay = 0.0
+
+	def add(self, delay):
+		self.count += 1
+		self.total_delay += delay
+		if(delay > self.max_delay):
+			self.max_delay = delay
+
+	@property
+	def mean_delay(self):
+		return (self.total_delay / self.count) if self.count else 0.0
+
+	def __repr__(self):
+		return (f"ClassStats(count={self.count}, expired={self.expired}, "
+				f"mean={self.mean_delay * 1000:.3f} mS, max={self.max_delay * 1000:.3f} mS)")
+
+
+
+
+#------------------------------------------------------------
+# Name: _InterfaceWorker():
+#
+# Description:
+#   Worker thread serving one interface's priority queue.
+#
+#------------------------------------------------------------
+class _InterfaceWorker(threading.Thread):
+	def __init__(self, sched, iface):
+		threading.Thread.__init__(self, name=f"USB20F-sched-if{iface}", daemon=True)
+		self.sched = sched
+		self.iface = iface
+		self.heap = []
+		self.cv = threading.Condition()
+		self.running = True
+
+
+	def put(self, entry):
+		with self.cv:
+			heapq.heappush(self.heap, entry)
+			self.cv.notify()
+
+
+	def stop(self):
+		with self.cv:
+			self.running = False
+			self.cv.notify()
+
+
+	def run(self):
+		while True:
+			with self.cv:
+				while self.running and not self.heap:
+					self.cv.wait()
+				if(not self.heap):
+					return
+				prio, deadline, seq, t_queued, fut, fn, args, kwargs = heapq.heappop(self.heap)
+
+			if(deadline == float("inf")):
+				deadline = None
+
+			if(not fut.set_running_or_notify_cancel()):
+				continue
+
+			now = time.monotonic()
+			if(deadline is not None and now > deadline):
+				self.sched._expired(prio)
+				fut.set_exception(DeadlineExceeded(f"deadline passed {(now - deadline) * 1000:.3f} mS before start"))
+				continue
+
+			self.sched._record(prio, now - t_queued)
+			try:
+				fut.set_result(fn(*args, **kwargs))
+			except BaseException as e:
+				fut.set_exception(e)
+
+
+
+
+#------------------------------------------------------------
+# Name: CommandScheduler():
+#
+# Description:
+#   Priority scheduler in front of one USB20F_Device.
+#
+#	sched = CommandScheduler(dev)
+#	v = sched.read_reg(dev.SR1_ADDR).result()
+#	f = sched.send_stream(payload)
+#	sched.call("write_reg", dev.CR1_ADDR, 1, mask=1, deadline=5)
+#
+# Parameters:
+#	dev: opened USB20F_Device
+#	bulk_chunk: send_stream() split size in bytes (multiple of the
+#		bulk packet size)
+#
+#------------------------------------------------------------
+class CommandScheduler(object):
+	def __init__(self, dev, bulk_chunk=65536):
+		pkt = dev.packet_size(dev._EP_BULK_OUT)
+		if(bulk_chunk <= 0 or bulk_chunk % pkt):
+			raise ValueError(f"bulk_chunk must be a multiple of {pkt} bytes!")
+
+		self.dev = dev
+		self.bulk_chunk = bulk_chunk
+		self.stats = {p: ClassStats() for p in PRIO_NAMES}
+		self._seq = itertools.count()
+		self._stats_lock = threading.Lock()
+		self._workers = {i: _InterfaceWorker(self, i) for i in (IF_INT0, IF_INT1, IF_BULK)}
+		for w in self._workers.values():
+			w.start()
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+	def _record(self, prio, delay):
+		with self._stats_lock:
+			self.stats.setdefault(prio, ClassStats()).add(delay)
+
+
+	def _expired(self, prio):
+		with self._stats_lock:
+			self.stats.setdefault(prio, ClassStats()).expired += 1
+
+
+	#------------------------------------------------------------
+	# Name: submit():
+	#
+	# Description:
+	#   Queue fn(*args, **kwargs) on interface iface.
+	#
+	# Parameters:
+	#	iface: IF_INT0, IF_INT1 or IF_BULK
+	#	priority: priority class, lower runs first
+	#	deadline: optional, mS from now by which the request must
+	#		have started
+	#
+	# Return:
+	#	concurrent.futures.Future
+	#
+	#------------------------------------------------------------
+	def submit(self, iface, fn, *args, priority=PRIO_CONTROL, deadline=None, **kwargs):
+		now = time.monotonic()
+		dl = None if deadline is None else now + deadline / 1000.0
+		fut = Future()
+		# deadline-less requests sort after any deadline in the class
+		key = dl if dl is not None else float("inf")
+		self._workers[iface].put((priority, key, next(self._seq), now, fut, fn, args, kwargs))
+		return fut
+
+
+	#------------------------------------------------------------
+	# Name: call():
+	#
+	# Description:
+	#   Queue a USB20F_Device method by name on the interface it
+	#	uses. Default priority: control for INT0, message for
+	#	INT1, bulk for BULK.
+	#
+	#------------------------------------------------------------
+	def call(self, method, *args, priority=None, deadline=None, **kwargs):
+		if(method not in _METHOD_IF):
+			raise ValueError(f"{method}() can't be scheduled, use the fast-path methods!")
+		iface = _METHOD_IF[method]
+		if(priority is None):
+			priority = (PRIO_CONTROL, PRIO_MESSAGE, PRIO_BULK)[iface]
+		return self.submit(iface, getattr(self.dev, method), *args, priority=priority, deadline=deadline, **kwargs)
+
+
+	def read_reg(self, address, **kwargs):
+		return self.call("read_reg", address, **kwargs)
+
+
+	def write_reg(self, address, data, mask=0xFFFFFFFF, **kwargs):
+		return self.call("write_reg", address, data, mask, **kwargs)
+
+
+	def write_int1_raw(self, data, **kwargs):
+		return self.call("write_int1_raw", data, **kwargs)
+
+
+	#------------------------------------------------------------
+	# Name: send_stream():
+	#
+	# Description:
+	#   Queue a bulk payload as bulk_chunk sized send_stream()
+	#	requests. The returned Future resolves to the total
+	#	StreamResult once every chunk has been sent, or to the
+	#	first chunk's exception (chunks not yet started are
+	#	then cancelled).
+	#
+	#------------------------------------------------------------
+	def send_stream(self, data, priority=PRIO_BULK, deadline=None, **kwargs):
+		mv = memoryview(data).cast("B")
+		chunk = self.bulk_chunk
+		parts = [mv[off:off + chunk] for off in range(0, len(mv), chunk)] or [mv]
+		futs = [self.submit(IF_BULK, self.dev.send_stream, p, priority=priority, deadline=deadline, **kwargs)
+				for p in parts]
+
+		total = Future()
+		pending = [len(futs)]
+		lock = threading.Lock()
+
+		def done(f):
+			with lock:
+				pending[0] -= 1
+				if(total.done() or f.cancelled()):
+					return
+				failed = f.exception() is not None
+				if(failed):
+					total.set_exception(f.exception())
+				elif(pending[0] == 0):
+					res = [x.result() for x in futs]
+					total.set_result(type(res[0])(sum(r.nbytes for r in res), sum(r.padded for r in res),
+													sum(r.transfers for r in res), sum(r.elapsed for r in res)))
+			# outside the lock - cancel() runs this callback for the
+			# cancelled futures
+			if(failed):
+				for x in futs:
+					x.cancel()
+
+		for f in futs:
+			f.add_done_callback(done)
+		return total
+
+
+	# {class name: ClassStats} snapshot of the queueing delays
+	def queue_delays(self):
+		with self._stats_lock:
+			out = {}
+			for (p, s) in self.stats.items():
+				c = ClassStats()
+				c.count, c.expired, c.total_delay, c.max_delay = s.count, s.expired, s.total_delay, s.max_delay
+				out[PRIO_NAMES.get(p, p)] = c
+			return out
+
+
+	#------------------------------------------------------------
+	# Name: close():
+	#
+	# Description:
+	#   Finish queued requests and stop the worker threads.
+	#
+	#------------------------------------------------------------
+	def close(self, timeout=None):
+		for w in self._workers.values():
+			w.stop()
+		for w in self._workers.values():
+			w.join(timeout)
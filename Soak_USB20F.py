@@ -0,0 +1,584 @@
+#
+# Title: Soak_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# Soak test harness for long runs against real or simulated
+# bridges.
+#
+# One worker thread per bridge drives a mixed workload (fast
+# path and legacy register access, INT1 reports, bulk blocks)
+# while the main thread samples the process every interval
+# seconds: RSS, Python and OS thread count, open file
+# descriptors, live Python objects, log file size and ops/sec.
+# At the end a least squares trend is fitted to every metric
+# (warmup excluded) and the run fails when a resource keeps
+# growing or the op rate degrades.
+#
+#	soak = SoakTest([lambda: SimSoakBridge(name="Soak0")], duration=8 * 3600)
+#	r = soak.run()
+#	r.save_csv("soak.csv")
+#	sys.exit(0 if r.ok else 1)
+#
+#
+# TODO:
+# ----------------------
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# What the metrics catch:
+# - rss / objects: ctypes buffers or device lists that are never
+#	freed, per-call allocations kept alive by references
+# - threads / os_threads: logging listener threads or helper
+#	threads that outlive close_usb()
+# - fds: log file handlers and device handles left open
+# - log_bytes: log files growing without bound (report only
+#	unless a limit is given, the legacy API logs every call)
+#
+# Set reopen to close and reopen every bridge periodically, that
+# exercises open_usb()/close_usb() and LogClass setup/teardown,
+# where most per-open resources live.
+#
+# RSS, thread and fd sampling read /proc (Linux). Elsewhere RSS
+# falls back to the peak RSS from resource.getrusage() and the
+# OS thread / fd metrics are not sampled.
+#
+
+import os
+import gc
+import sys
+import csv
+import time
+import struct
+import threading
+import ctypes as ct
+from collections import deque, Counter
+from USB_SSI_Libs import rei_usb_lib
+from USB_SSI_Libs import Loopback_USB20F
+
+
+OPS = ("reg", "regs", "int1", "bulk", "legacy")
+
+DEFAULT_MIX = {"reg": 8, "regs": 2, "int1": 4, "bulk": 2, "legacy": 1}
+
+# metric: (max growth per hour, growth over the run below which
+# a trend is treated as noise), None - report only
+DEFAULT_LIMITS = {
+	"rss": (16 << 20, 4 << 20),
+	"threads": (0, 1),
+	"os_threads": (0, 1),
+	"fds": (0, 1),
+	"objects": (50000, 10000),
+	"log_bytes": None,
+}
+
+SAMPLE_FIELDS = ("t", "rss", "threads", "os_threads", "fds", "objects", "log_bytes", "ops", "errors", "ops_per_sec")
+
+try:
+	_PAGE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+	_PAGE = 4096
+
+
+
+
+def _rss():
+	try:
+		with open("/proc/self/statm", "r") as f:
+			return int(f.read().split()[1]) * _PAGE
+	except (OSError, ValueError, IndexError):
+		pass
+	try:
+		import resource
+	except ImportError:
+		return None
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# bytes on macOS, KB elsewhere
+	return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _count_dir(path):
+	try:
+		return len(os.listdir(path))
+	except OSError:
+		return None
+
+
+def _file_size(path):
+	try:
+		return os.path.getsize(path)
+	except (TypeError, OSError):
+		return 0
+
+
+def _fds():
+	n = _count_dir("/proc/self/fd")
+	return n if n is not None else _count_dir("/dev/fd")
+
+
+# least squares slope of vs over ts
+def _slope(ts, vs):
+	n = len(ts)
+	mt = sum(ts) / n
+	mv = sum(vs) / n
+	den = sum((t - mt) ** 2 for t in ts)
+	if(not den):
+		return 0.0
+	return sum((t - mt) * (v - mv) for (t, v) in zip(ts, vs)) / den
+
+
+# op names in proportion to their weights, evenly interleaved
+def _schedule(mix):
+	slots = []
+	for (op, w) in mix.items():
+		if(op not in OPS):
+			raise ValueError(f"unknown soak op <{op}>, expected one of {OPS}")
+		slots += [((k + 0.5) / w, op) for k in range(int(w))]
+	if(not slots):
+		raise ValueError("soak mix has no ops")
+	return [op for (pos, op) in sorted(slots)]
+
+
+
+
+#------------------------------------------------------------
+# Name: SoakSample():
+#
+# Description:
+#   One process sample. Metrics that can't be read on this
+#	platform are None.
+#
+#------------------------------------------------------------
+class SoakSample(object):
+	__slots__ = SAMPLE_FIELDS
+
+	def __init__(self, *values):
+		for (name, v) in zip(SAMPLE_FIELDS, values):
+			setattr(self, name, v)
+
+
+	def __repr__(self):
+		return (f"SoakSample(t={self.t:.0f}s, rss={self.rss}, threads={self.threads}, fds={self.fds}, "
+				f"objects={self.objects}, ops/s={self.ops_per_sec:.0f})")
+
+
+
+
+#------------------------------------------------------------
+# Name: SoakTrend():
+#
+# Description:
+#   Fitted trend of one metric over the samples after warmup.
+#	growth is the mean of the last quarter minus the mean of
+#	the first quarter.
+#
+#------------------------------------------------------------
+class SoakTrend(object):
+	__slots__ = ("metric", "first", "last", "per_hour", "growth", "limit", "failed")
+
+	def __init__(self, metric, first, last, per_hour, growth, limit, failed):
+		self.metric = metric
+		self.first = first
+		self.last = last
+		self.per_hour = per_hour
+		self.growth = growth
+		self.limit = limit
+		self.failed = failed
+
+
+	def __repr__(self):
+		return (f"SoakTrend({self.metric}: {self.first} -> {self.last}, {self.per_hour:+.1f}/h, "
+				f"growth {self.growth:+.1f}{', FAILED' if self.failed else ''})")
+
+
+
+
+#------------------------------------------------------------
+# Name: SoakResult():
+#
+# Description:
+#   Outcome of a soak run.
+#
+#------------------------------------------------------------
+class SoakResult(object):
+	__slots__ = ("ok", "failures", "trends", "samples", "elapsed", "ops", "errors", "reopens")
+
+	def __init__(self, ok, failures, trends, samples, elapsed, ops, errors, reopens):
+		self.ok = ok
+		self.failures = failures
+		self.trends = trends
+		self.samples = samples
+		self.elapsed = elapsed
+		self.ops = ops
+		self.errors = errors
+		self.reopens = reopens
+
+
+	def __repr__(self):
+		return (f"SoakResult(ok={self.ok}, {self.elapsed:.0f}s, ops={self.ops}, errors={sum(self.errors.values())}, "
+				f"reopens={self.reopens}, failures={self.failures})")
+
+
+	def save_csv(self, path):
+		with open(path, "w", newline="") as f:
+			w = csv.writer(f)
+			w.writerow(SAMPLE_FIELDS)
+			for s in self.samples:
+				w.writerow([getattr(s, name) for name in SAMPLE_FIELDS])
+
+
+
+
+#------------------------------------------------------------
+# Name: SimSoakBridge():
+#
+# Description:
+#   SimLoopbackBridge that also answers INT0 register commands
+#	from an in-memory register file and echoes INT1 reports,
+#	so the whole fast path and legacy register path (buffers,
+#	recovery bookkeeping, trace hooks, logging) runs without
+#	hardware. Only usb.bulk_transfer() and interface claims are
+#	replaced.
+#
+# Parameters:
+#	see SimLoopbackBridge
+#
+#------------------------------------------------------------
+class SimSoakBridge(Loopback_USB20F.SimLoopbackBridge):
+	def __init__(self, quiet=True, name="SimSoak", **kwargs):
+		Loopback_USB20F.SimLoopbackBridge.__init__(self, quiet, name, **kwargs)
+		self.regs = {}
+		self._int0_rsp = (0, 0)
+		self._int1_q = deque(maxlen=64)
+
+
+	def _claim(self, n):
+		self._claimed.add(n)
+		return 0
+
+
+	def _release(self, n):
+		self._claimed.discard(n)
+		return 0
+
+
+	def _transfer_once(self, ep, buf, size, xfer_len, timeout):
+		if(ep == self._EP_INT0_OUT):
+			cmd, address, mask, data = rei_usb_lib._INT0_CMD.unpack_from(buf, 0)
+			value = self.regs.get(address, 0)
+			if(cmd == rei_usb_lib.INT0_CMD_WRITE):
+				value = self.regs[address] = (value & ~mask) | (data & mask)
+			self._int0_rsp = (0, value)
+		elif(ep == self._EP_INT0_IN):
+			ct.memset(buf, 0, size)
+			rei_usb_lib._INT0_RSP.pack_into(buf, 0, *self._int0_rsp)
+		elif(ep == self._EP_INT1_OUT):
+			self._int1_q.append(bytes(buf[:size]))
+		elif(ep == self._EP_INT1_IN):
+			if(not self._int1_q):
+				xfer_len.contents.value = 0
+				return rei_usb_lib.LIBUSB_ERROR_TIMEOUT
+			report = self._int1_q.popleft()
+			size = min(size, len(report))
+			ct.memmove(buf, report, size)
+		else:
+			return rei_usb_lib.LIBUSB_ERROR_NOT_SUPPORTED
+		xfer_len.contents.value = size
+		return size
+
+
+
+
+#------------------------------------------------------------
+# Name: _Worker():
+#
+# Description:
+#   Workload thread of one bridge. Runs the op schedule until
+#	stopped, reopening the bridge every reopen seconds.
+#
+#------------------------------------------------------------
+class _Worker(object):
+	def __init__(self, soak, factory, index):
+		self.soak = soak
+		self.factory = factory
+		self.index = index
+		self.dev = None
+		self.ops = 0
+		self.errors = Counter()
+		self.reopens = 0
+		self.log_bytes = 0		# size of the log files of closed bridges
+		self.failed = None
+		self.thread = threading.Thread(target=self._run, name=f"Soak-{index}", daemon=True)
+
+
+	def _run(self):
+		soak = self.soak
+		schedule = _schedule(soak.mix)
+		seq = 0
+		try:
+			self.dev = self.factory()
+			t_open = time.monotonic()
+			while not soak._stop_evt.is_set():
+				if(soak.reopen and time.monotonic() - t_open >= soak.reopen):
+					# LogClass truncates the log file on open, keep
+					# what the closed bridge wrote
+					path = self._log_path(self.dev)
+					self.dev.close_usb()
+					self.dev = None
+					self.log_bytes += _file_size(path)
+					self.dev = self.factory()
+					self.reopens += 1
+					t_open = time.monotonic()
+
+				for op in schedule:
+					seq += 1
+					try:
+						getattr(self, f"_op_{op}")(self.dev, seq)
+					except rei_usb_lib.USB20F_Error as e:
+						self.errors[f"{op}:{e.__class__.__name__}:{e.code}"] += 1
+					self.ops += 1
+		except Exception as e:
+			# anything other than a transfer error ends the run
+			self.failed = f"worker {self.index}: {e.__class__.__name__}: {e}"
+			soak._stop_evt.set()
+		finally:
+			if(self.dev is not None):
+				self.dev.close_usb()
+				self.dev = None
+
+
+	@staticmethod
+	def _log_path(dev):
+		try:
+			return dev.log.handler5.baseFilename
+		except AttributeError:
+			return None
+
+
+	def _verify(self, op, ok):
+		if(not ok):
+			self.errors[f"{op}:verify"] += 1
+
+
+	def _op_reg(self, dev, seq):
+		value = (seq * 0x9E3779B1) & 0xFFFFFFFF
+		dev.write_reg(dev.SCRTCH1_ADDR, value)
+		self._verify("reg", dev.read_reg(dev.SCRTCH1_ADDR) == value)
+
+
+	def _op_regs(self, dev, seq):
+		dev.read_regs(self.soak._reg_block(dev))
+
+
+	def _op_int1(self, dev, seq):
+		pkt = dev.packet_size(dev._EP_INT1_OUT)
+		report = struct.pack("<I", seq & 0xFFFFFFFF) * (pkt // 4)
+		dev.write_int1_raw(report)
+		if(self.soak.loopback):
+			self._verify("int1", dev.read_int1_raw() == report)
+
+
+	def _op_bulk(self, dev, seq):
+		soak = self.soak
+		block = soak._bulk_block
+		dev.send_bulk_raw(block)
+		if(soak.loopback):
+			got = 0
+			mv = memoryview(soak._bulk_rx[self.index])
+			while got < len(block):
+				got += dev.rec_bulk_into(mv[got:])
+			self._verify("bulk", mv == block)
+
+
+	def _op_legacy(self, dev, seq):
+		value = seq & 0xFFFFFFFF
+		r = dev.write_InternalReg(dev.SCRTCH2_ADDR, 0xFFFFFFFF, value)
+		if(r[0]):
+			self.errors["legacy:write"] += 1
+			return
+		r = dev.read_InternalReg(dev.SCRTCH2_ADDR)
+		if(r[0]):
+			self.errors["legacy:read"] += 1
+
+
+
+
+#------------------------------------------------------------
+# Name: SoakTest():
+#
+# Description:
+#   Soak test over one or more bridges.
+#
+# Parameters:
+#	factories: one callable per bridge returning an opened
+#		USB20F_Device (called again on every reopen)
+#	duration: run time in seconds
+#	interval: sample period in seconds
+#	warmup: seconds excluded from the trend fits (capped at a
+#		quarter of the run)
+#	mix: op weights, see DEFAULT_MIX
+#	loopback: read back and verify INT1 reports and bulk
+#		blocks (SSI loopback wired or simulated bridges)
+#	bulk_bytes: bytes per bulk op
+#	reopen: close and reopen every bridge after this many
+#		seconds (0 - never)
+#	limits: per metric overrides of DEFAULT_LIMITS
+#	max_slowdown: allowed drop of the ops/sec rate, last
+#		quarter vs first quarter
+#	on_sample: called with every SoakSample
+#
+#------------------------------------------------------------
+class SoakTest(object):
+	def __init__(self, factories, duration=3600.0, interval=10.0, warmup=300.0, mix=None, loopback=False,
+				 bulk_bytes=4096, reopen=0, limits=None, max_slowdown=0.2, on_sample=None):
+		self.duration = duration
+		self.interval = interval
+		self.warmup = warmup
+		self.mix = dict(mix or DEFAULT_MIX)
+		self.loopback = loopback
+		self.reopen = reopen
+		self.limits = dict(DEFAULT_LIMITS)
+		self.limits.update(limits or {})
+		self.max_slowdown = max_slowdown
+		self.on_sample = on_sample
+		self.samples = []
+
+		_schedule(self.mix)
+		self._bulk_block = bytes((i * 7 + 3) & 0xFF for i in range(bulk_bytes))
+		self._bulk_rx = [bytearray(bulk_bytes) for f in factories]
+		self._workers = [_Worker(self, f, i) for (i, f) in enumerate(factories)]
+		self._stop_evt = threading.Event()
+		self._t0 = None
+
+
+	def _reg_block(self, dev):
+		return (dev.SR1_ADDR, dev.SCRTCH1_ADDR, dev.SCRTCH2_ADDR, dev.SCRTCH3_ADDR, dev.SCRTCH4_ADDR)
+
+
+	def _log_bytes(self):
+		total = 0
+		for w in self._workers:
+			total += w.log_bytes + _file_size(w._log_path(w.dev))
+		return total
+
+
+	#------------------------------------------------------------
+	# Name: sample():
+	#
+	# Description:
+	#   Take one SoakSample (collects garbage first, so objects
+	#	and RSS only count what is really kept alive).
+	#
+	#------------------------------------------------------------
+	def sample(self, last=None):
+		gc.collect()
+		t = time.monotonic() - self._t0
+		ops = sum(w.ops for w in self._workers)
+		errors = sum(sum(w.errors.values()) for w in self._workers)
+		if(last is not None and t > last.t):
+			rate = (ops - last.ops) / (t - last.t)
+		else:
+			rate = 0.0
+		s = SoakSample(t, _rss(), threading.active_count(), _count_dir("/proc/self/task"), _fds(),
+					   len(gc.get_objects()), self._log_bytes(), ops, errors, rate)
+		self.samples.append(s)
+		return s
+
+
+	def stop(self):
+		self._stop_evt.set()
+
+
+	#------------------------------------------------------------
+	# Name: run():
+	#
+	# Description:
+	#   Run the workload for duration seconds (or until stop()
+	#	or KeyboardInterrupt), then evaluate the samples.
+	#
+	# Return:
+	#	SoakResult
+	#
+	#------------------------------------------------------------
+	def run(self):
+		self.samples = []
+		self._stop_evt.clear()
+		self._t0 = time.monotonic()
+		last = self.sample()
+		for w in self._workers:
+			w.thread.start()
+
+		try:
+			next_t = self._t0 + self.interval
+			end = self._t0 + self.duration
+			while not self._stop_evt.is_set():
+				now = time.monotonic()
+				if(now >= end):
+					break
+				if(self._stop_evt.wait(min(next_t, end) - now)):
+					break
+				if(time.monotonic() >= next_t):
+					last = self.sample(last)
+					next_t += self.interval
+					if(self.on_sample is not None):
+						self.on_sample(last)
+		except KeyboardInterrupt:
+			pass
+		finally:
+			self._stop_evt.set()
+			for w in self._workers:
+				w.thread.join()
+
+		return self.evaluate()
+
+
+	def _trend(self, metric, points):
+		ts = [t for (t, v) in points]
+		vs = [v for (t, v) in points]
+		q = max(1, len(vs) // 4)
+		growth = sum(vs[-q:]) / q - sum(vs[:q]) / q
+		per_hour = _slope(ts, vs) * 3600.0
+		limit = self.limits.get(metric)
+		failed = limit is not None and per_hour > limit[0] and growth >= limit[1]
+		return SoakTrend(metric, vs[0], vs[-1], per_hour, growth, limit, failed)
+
+
+	#------------------------------------------------------------
+	# Name: evaluate():
+	#
+	# Description:
+	#   Fit trends to the samples after warmup and collect the
+	#	failures. Needs at least 8 samples after warmup, shorter
+	#	runs only fail on worker errors.
+	#
+	#------------------------------------------------------------
+	def evaluate(self):
+		elapsed = self.samples[-1].t if self.samples else 0.0
+		errors = Counter()
+		for w in self._workers:
+			errors.update(w.errors)
+		failures = [w.failed for w in self._workers if w.failed]
+		trends = {}
+
+		warmup = min(self.warmup, elapsed / 4)
+		steady = [s for s in self.samples if s.t >= warmup and s.ops_per_sec]
+		if(len(steady) >= 8):
+			for metric in ("rss", "threads", "os_threads", "fds", "objects", "log_bytes"):
+				points = [(s.t, getattr(s, metric)) for s in steady if getattr(s, metric) is not None]
+				if(len(points) < 8):
+					continue
+				tr = trends[metric] = self._trend(metric, points)
+				if(tr.failed):
+					failures.append(f"{metric} grows {tr.per_hour:+.1f}/h ({tr.first} -> {tr.last})")
+
+			q = len(steady) // 4
+			first = sum(s.ops_per_sec for s in steady[:q]) / q
+			final = sum(s.ops_per_sec for s in steady[-q:]) / q
+			if(final < first * (1.0 - self.max_slowdown)):
+				failures.append(f"ops/sec dropped from {first:.0f} to {final:.0f}")
+
+		return SoakResult(not failures, failures, trends, self.samples, elapsed,
+						  sum(w.ops for w in self._workers), errors, sum(w.reopens for w in self._workers))
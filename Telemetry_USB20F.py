@@ -0,0 +1,242 @@
+#
+# Title: Telemetry_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# Background sampler for the USB20F bridge frame/error counters.
+# Counters are read over INT0 at a fixed rate from a worker thread,
+# unwrapped from 32-bit to 64-bit and stored with a timestamp in a
+# fixed size ring backed by array.array, so rates (frames/s,
+# errors/s) can be read live while the bulk data path keeps
+# running on its own interface.
+#
+#
+# TODO:
+# ----------------------
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# Only the INT0 interface is used by the sampler. INT0 accesses
+# are serialized by USB20F_Device._int0_lock so register calls from
+# the application thread stay safe while the sampler runs.
+#
+
+import time
+import threading
+from array import array
+from USB_SSI_Libs import rei_usb_lib
+
+
+# counters sampled by default (register name without _ADDR)
+COUNTER_NAMES = ("SSITXFC", "SSITXEC", "SSIRXFC", "SSIRXEC",
+				 "USBBLKRXFC", "USBIF0RXFC", "USBIF1RXFC", "SIRXFSSCNT")
+
+
+
+
+#------------------------------------------------------------
+# Name: CounterRing():
+#
+# Description:
+#   Fixed size ring of timestamped counter samples. Timestamps
+#	are stored in an array('d'), counter values in one flat
+#	array('Q') (size * len(names)), so appending a sample does
+#	not allocate once the ring is built.
+#
+# Parameters:
+#	names: counter names, one column each
+#	size: number of samples kept
+#
+#------------------------------------------------------------
+class CounterRing(object):
+	def __init__(self, names, size=1024):
+		self.names = tuple(names)
+		self.width = len(self.names)
+		self.size = size
+		self.count = 0
+		self._head = 0
+		self._col = {n: i for (i, n) in enumerate(self.names)}
+		self._t = array('d', bytes(8 * size))
+		self._v = array('Q', bytes(8 * size * self.width))
+		self._lock = threading.Lock()
+
+
+	def append(self, t, values):
+		with self._lock:
+			h = self._head
+			self._t[h] = t
+			self._v[h * self.width:(h + 1) * self.width] = array('Q', values)
+			self._head = (h + 1) % self.size
+			if(self.count < self.size):
+				self.count += 1
+
+
+	def clear(self):
+		with self._lock:
+			self._head = 0
+			self.count = 0
+
+
+	# ring index of the i'th newest sample (0 = newest)
+	def _idx(self, i):
+		return (self._head - 1 - i) % self.size
+
+
+	#------------------------------------------------------------
+	# Name: latest():
+	#
+	# Description:
+	#   Return the newest sample as (t, {name: value}) or None
+	#	when the ring is empty.
+	#
+	#------------------------------------------------------------
+	def latest(self):
+		with self._lock:
+			if(self.count == 0):
+				return None
+			h = self._idx(0)
+			row = self._v[h * self.width:(h + 1) * self.width]
+			return (self._t[h], dict(zip(self.names, row)))
+
+
+	#------------------------------------------------------------
+	# Name: series():
+	#
+	# Description:
+	#   Return (timestamps, values) for one counter, oldest
+	#	first, as two arrays.
+	#
+	#------------------------------------------------------------
+	def series(self, name):
+		c = self._col[name]
+		with self._lock:
+			t = array('d')
+			v = array('Q')
+			for i in range(self.count - 1, -1, -1):
+				h = self._idx(i)
+				t.append(self._t[h])
+				v.append(self._v[h * self.width + c])
+			return (t, v)
+
+
+	#------------------------------------------------------------
+	# Name: rates():
+	#
+	# Description:
+	#   Per second rate of every counter between the newest
+	#	sample and the oldest sample inside window seconds
+	#	(window=None uses the whole ring).
+	#
+	# Return:
+	#	{name: rate} or {} when fewer than 2 samples are held
+	#
+	#------------------------------------------------------------
+	def rates(self, window=None):
+		with self._lock:
+			if(self.count < 2):
+				return {}
+
+			new = self._idx(0)
+			t_new = self._t[new]
+			old = new
+			for i in range(1, self.count):
+				h = self._idx(i)
+				if(window is not None and (t_new - self._t[h]) > window):
+					break
+				old = h
+
+			dt = t_new - self._t[old]
+			if(dt <= 0):
+				return {}
+
+			w = self.width
+			return {n: (self._v[new * w + c] - self._v[old * w + c]) / dt
+					for (n, c) in self._col.items()}
+
+
+	def rate(self, name, window=None):
+		return self.rates(window).get(name, 0.0)
+
+
+
+
+#------------------------------------------------------------
+# Name: CounterSampler():
+#
+# Description:
+#   Background thread reading the bridge counters at rate_hz
+#	with one batched read_regs() call per sample. 32-bit
+#	wraparound is handled by accumulating modulo 2^32 deltas
+#	into 64-bit totals. Transfer errors are counted and logged,
+#	the sampler keeps running.
+#
+# Parameters:
+#	dev: opened USB20F_Device
+#	rate_hz: sample rate
+#	size: number of samples held by the ring
+#	counters: register names to sample (see COUNTER_NAMES)
+#
+#------------------------------------------------------------
+class CounterSampler(threading.Thread):
+	def __init__(self, dev, rate_hz=10.0, size=1024, counters=COUNTER_NAMES):
+		threading.Thread.__init__(self, name="CounterSampler", daemon=True)
+		self.dev = dev
+		self.period = 1.0 / rate_hz
+		self.counters = tuple(counters)
+		self.addresses = [getattr(dev, n + "_ADDR") for n in self.counters]
+		self.ring = CounterRing(self.counters, size)
+		self.errors = 0
+		self._last = None
+		self._totals = [0] * len(self.counters)
+		self._stop_evt = threading.Event()
+
+
+	#------------------------------------------------------------
+	# Name: sample():
+	#
+	# Description:
+	#   Take one sample now (also used by run()).
+	#
+	#------------------------------------------------------------
+	def sample(self):
+		raw = self.dev.read_regs(self.addresses)
+		t = time.monotonic()
+
+		if(self._last is not None):
+			for i in range(len(raw)):
+				self._totals[i] += (raw[i] - self._last[i]) & 0xFFFFFFFF
+		else:
+			self._totals = list(raw)
+		self._last = raw
+
+		self.ring.append(t, self._totals)
+
+
+	def run(self):
+		next_t = time.monotonic()
+		while not self._stop_evt.is_set():
+			try:
+				self.sample()
+			except rei_usb_lib.USB20F_Error as e:
+				self.errors += 1
+				self.dev.log.write("WARNING", f"CounterSampler read failed: {e}")
+
+			# fixed rate schedule, skip missed slots instead of bursting
+			next_t += self.period
+			now = time.monotonic()
+			if(next_t < now):
+				next_t = now
+			self._stop_evt.wait(next_t - now)
+
+
+	def stop(self, timeout=None):
+		self._stop_evt.set()
+		if(self.is_alive()):
+			self.join(timeout)
+
+
+	def rates(self, window=1.0):
+		return self.ring.rates(window)
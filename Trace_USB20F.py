@@ -0,0 +1,277 @@
+#
+# Title: Trace_USB20F
+#
+#
+# Module Description:
+# ----------------------
+# Tracing hooks for USB20F_Device.add_trace_hook().
+#
+# - ChromeTrace records every transfer and register operation
+#	as a Chrome trace event ("X" complete events) and writes a
+#	JSON file that chrome://tracing or ui.perfetto.dev open.
+#	Register operations nest their INT0 transfers, so the gap
+#	between the two is Python overhead. Optionally log.write()
+#	calls are traced too.
+# - SamplingProfiler samples the Python stacks of the threads
+#	using the bridge at a fixed interval and tags each sample
+#	with the USB operation in progress ("usb:transfer:0x83" =
+#	time on the wire). Output is collapsed stack text for
+#	flamegraph.pl / speedscope.
+#
+#	trace = ChromeTrace(trace_logging=True)
+#	trace.attach(dev)
+#	...
+#	trace.detach(dev)
+#	trace.save("usb_trace.json")
+#
+#
+# TODO:
+# ----------------------
+#
+#
+# ----------------------------------------------------------------
+# Notes:
+# ----------------------------------------------------------------
+# Hooks run inside the transfer path of the calling thread, both
+# classes only append to preallocated/bounded structures there.
+#
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter
+
+
+_OP_CAT = {"transfer": "usb", "async": "usb", "read_reg": "reg", "write_reg": "reg"}
+
+
+
+
+#------------------------------------------------------------
+# Name: ChromeTrace():
+#
+# Description:
+#   Chrome trace-event recorder.
+#
+# Parameters:
+#	max_events: events kept, later ones are counted in
+#		self.dropped
+#	trace_logging: also trace dev.log.write() calls of
+#		attached devices
+#
+#------------------------------------------------------------
+class ChromeTrace(object):
+	def __init__(self, max_events=1000000, trace_logging=False):
+		self.max_events = max_events
+		self.trace_logging = trace_logging
+		self.events = []
+		self.dropped = 0
+		self.pid = os.getpid()
+		self._threads = {}
+		self._log_write = {}
+
+
+	#------------------------------------------------------------
+	# Name: attach() / detach():
+	#
+	# Description:
+	#   Register / remove the hook on a device (and wrap /
+	#	restore its log.write() when trace_logging is set).
+	#
+	#------------------------------------------------------------
+	def attach(self, dev):
+		dev.add_trace_hook(self)
+		if(self.trace_logging and id(dev) not in self._log_write):
+			orig = dev.log.write
+			self._log_write[id(dev)] = vars(dev.log).get("write")
+
+			def write(level, msg, *args, **kwargs):
+				t0 = time.monotonic_ns()
+				try:
+					return orig(level, msg, *args, **kwargs)
+				finally:
+					self._add("log", "log", t0, time.monotonic_ns(), {"level": level})
+
+			dev.log.write = write
+
+
+	def detach(self, dev):
+		dev.remove_trace_hook(self)
+		if(id(dev) in self._log_write):
+			orig = self._log_write.pop(id(dev))
+			if(orig is None):
+				del dev.log.write
+			else:
+				dev.log.write = orig
+
+
+	def _add(self, name, cat, t0, t1, args):
+		if(len(self.events) >= self.max_events):
+			self.dropped += 1
+			return
+		tid = threading.get_ident()
+		if(tid not in self._threads):
+			self._threads[tid] = threading.current_thread().name
+		self.events.append({"name": name, "cat": cat, "ph": "X", "ts": t0 / 1000.0, "dur": (t1 - t0) / 1000.0,
+							"pid": self.pid, "tid": tid, "args": args})
+
+
+	def post(self, dev, op, ep, size, address, status, t_start, t_end):
+		if(address is None):
+			name = f"{op} {ep:#04x}"
+			args = {"ep": f"{ep:#04x}", "size": size, "status": status}
+		else:
+			name = f"{op} {address:#06x}"
+			args = {"address": f"{address:#010x}", "status": status}
+		args["bridge"] = getattr(dev, "sn_string_d", "").rstrip("\x00")
+		self._add(name, _OP_CAT[op], t_start, t_end, args)
+
+
+	#------------------------------------------------------------
+	# Name: to_dict() / save():
+	#
+	# Description:
+	#   Trace in Chrome JSON object format, including thread
+	#	name metadata.
+	#
+	#------------------------------------------------------------
+	def to_dict(self):
+		meta = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+				for (tid, name) in self._threads.items()]
+		return {"traceEvents": meta + self.events, "displayTimeUnit": "ns",
+				"otherData": {"dropped": self.dropped}}
+
+
+	def save(self, path):
+		with open(path, "w") as f:
+			json.dump(self.to_dict(), f)
+
+
+	def clear(self):
+		self.events = []
+		self.dropped = 0
+
+
+
+
+#------------------------------------------------------------
+# Name: SamplingProfiler():
+#
+# Description:
+#   Statistical profiler for bridge traffic. A sampler thread
+#	takes the stacks of every thread that has used an attached
+#	device each interval seconds. Samples taken while a thread
+#	is inside a USB operation get the operation as leaf frame.
+#
+#	prof = SamplingProfiler(interval=0.001)
+#	prof.attach(dev)
+#	prof.start()
+#	...
+#	prof.stop()
+#	prof.save("usb.folded")
+#
+# Parameters:
+#	interval: sample period in seconds
+#	max_depth: Python frames kept per sample
+#
+#------------------------------------------------------------
+class SamplingProfiler(object):
+	def __init__(self, interval=0.001, max_depth=64):
+		self.interval = interval
+		self.max_depth = max_depth
+		self.samples = Counter()
+		self.nsamples = 0
+		self._ops = {}			# thread id -> list of operations in progress
+		self._thread = None
+		self._running = False
+
+
+	def attach(self, dev):
+		dev.add_trace_hook(self)
+
+
+	def detach(self, dev):
+		dev.remove_trace_hook(self)
+
+
+	def pre(self, dev, op, ep, size, address, t_start):
+		tid = threading.get_ident()
+		stack = self._ops.get(tid)
+		if(stack is None):
+			stack = self._ops[tid] = []
+		stack.append(f"usb:{op}:{ep:#04x}" if address is None else f"usb:{op}:{address:#06x}")
+
+
+	def post(self, dev, op, ep, size, address, status, t_start, t_end):
+		stack = self._ops.get(threading.get_ident())
+		if(stack):
+			stack.pop()
+
+
+	def start(self):
+		self._running = True
+		self._thread = threading.Thread(target=self._sampler, name="SamplingProfiler", daemon=True)
+		self._thread.start()
+
+
+	def stop(self):
+		self._running = False
+		if(self._thread is not None):
+			self._thread.join()
+			self._thread = None
+
+
+	def _sampler(self):
+		while self._running:
+			time.sleep(self.interval)
+			frames = sys._current_frames()
+			for (tid, ops) in list(self._ops.items()):
+				frame = frames.get(tid)
+				if(frame is None):
+					continue
+				stack = []
+				while frame is not None and len(stack) < self.max_depth:
+					code = frame.f_code
+					stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+					frame = frame.f_back
+				stack.reverse()
+				# operations in progress become the leaf frames
+				key = ";".join(stack + list(ops))
+				self.samples[key] += 1
+				self.nsamples += 1
+
+
+	#------------------------------------------------------------
+	# Name: folded() / save():
+	#
+	# Description:
+	#   Collapsed stack lines "frame;frame;... count", most
+	#	frequent first.
+	#
+	#------------------------------------------------------------
+	def folded(self):
+		return [f"{stack} {n}" for (stack, n) in self.samples.most_common()]
+
+
+	def save(self, path):
+		with open(path, "w") as f:
+			f.write("\n".join(self.folded()) + "\n")
+
+
+	#------------------------------------------------------------
+	# Name: summary():
+	#
+	# Description:
+	#   Share of samples per USB operation tag, "python" for
+	#	samples outside any operation.
+	#
+	#------------------------------------------------------------
+	def summary(self):
+		out = Counter()
+		for (stack, n) in self.samples.items():
+			leaf = stack.rsplit(";", 1)[-1]
+			out[leaf if leaf.startswith("usb:") else "python"] += n
+		total = sum(out.values()) or 1
+		return {k: v / total for (k, v) in out.most_common()}
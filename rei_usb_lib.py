@@ -14,9 +14,7 @@
 #
 # TODO:
 # ----------------------
-# 1. Add option to allow caller to pass SN in string format
-#	for appropriate methods. Right now you can't select based
-#	on SN.
+# 1. 
 #
 # 2. Set default VID/PID to 0x0451/0x0309
 #
@@ -46,14 +44,773 @@
 # the inclusion of this disclaimer and no modifications.
 # ----------------------------------------------------------------
 
+import os
 import sys
+import mmap
+import queue
 import ctypes as ct
 import libusb as usb
 import time
+import struct
+import threading
 import logging
+from array import array
+from collections import deque
 from logging.handlers import QueueHandler, QueueListener
 from USB_SSI_Libs import LoggingUtils_USB20F
 
+# numpy is optional, the array helpers fall back to pure Python
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+
+
+#------------------------------------------------------------
+# libusb return codes (enum libusb_error) used to classify
+# transfer failures raised by the fast-path API.
+#------------------------------------------------------------
+LIBUSB_ERROR_IO = -1
+LIBUSB_ERROR_INVALID_PARAM = -2
+LIBUSB_ERROR_ACCESS = -3
+LIBUSB_ERROR_NO_DEVICE = -4
+LIBUSB_ERROR_NOT_FOUND = -5
+LIBUSB_ERROR_BUSY = -6
+LIBUSB_ERROR_TIMEOUT = -7
+LIBUSB_ERROR_OVERFLOW = -8
+LIBUSB_ERROR_PIPE = -9
+LIBUSB_ERROR_INTERRUPTED = -10
+LIBUSB_ERROR_NO_MEM = -11
+LIBUSB_ERROR_NOT_SUPPORTED = -12
+LIBUSB_ERROR_OTHER = -99
+
+# async transfer completion status (enum libusb_transfer_status)
+# and the libusb_error each one is reported as
+LIBUSB_TRANSFER_COMPLETED = 0
+LIBUSB_TRANSFER_ERROR = 1
+LIBUSB_TRANSFER_TIMED_OUT = 2
+LIBUSB_TRANSFER_CANCELLED = 3
+LIBUSB_TRANSFER_STALL = 4
+LIBUSB_TRANSFER_NO_DEVICE = 5
+LIBUSB_TRANSFER_OVERFLOW = 6
+
+_TRANSFER_STATUS_ERR = {
+	LIBUSB_TRANSFER_ERROR: LIBUSB_ERROR_IO,
+	LIBUSB_TRANSFER_TIMED_OUT: LIBUSB_ERROR_TIMEOUT,
+	LIBUSB_TRANSFER_CANCELLED: LIBUSB_ERROR_INTERRUPTED,
+	LIBUSB_TRANSFER_STALL: LIBUSB_ERROR_PIPE,
+	LIBUSB_TRANSFER_NO_DEVICE: LIBUSB_ERROR_NO_DEVICE,
+	LIBUSB_TRANSFER_OVERFLOW: LIBUSB_ERROR_OVERFLOW,
+}
+
+# INT0 command packet: <cmd:u8><address:u32><mask:u32><data:u32>
+_INT0_CMD = struct.Struct("<BIII")
+# INT0 response packet: <status:u16><value:u32>
+_INT0_RSP = struct.Struct("<HI")
+
+INT0_CMD_READ = 0x24
+INT0_CMD_WRITE = 0x42
+
+# register space in address order (USB20F_Device.<name>_ADDR)
+REG_NAMES = ("CR1", "CR2", "SR1", "SR2", "ASR", "SKEY", "USBBLKSR", "USBINT0SR", "USBINT1SR",
+			 "USBFBRXSR", "USBFBTXSR", "USBBLKRXFC", "USBIF0RXFC", "USBIF1RXFC", "NVMEMSR",
+			 "SSITXFC", "SSITXEC", "SSIRXFC", "SSIRXEC", "SCRTCH1", "SCRTCH2", "SCRTCH3", "SCRTCH4",
+			 "SSITXLGSTS", "SSIRXLGSTS", "SIRXFSSCNT") + \
+			tuple(f"CTRTXDATA{i}" for i in range(8)) + tuple(f"CTRRXDATA{i}" for i in range(8)) + ("CTRMODECR",)
+
+# registers changed by the bridge itself (status, counters, RX data)
+VOLATILE_REGS = frozenset(("SR1", "SR2", "ASR", "USBBLKSR", "USBINT0SR", "USBINT1SR", "USBFBRXSR",
+						   "USBFBTXSR", "USBBLKRXFC", "USBIF0RXFC", "USBIF1RXFC", "NVMEMSR", "SSITXFC",
+						   "SSITXEC", "SSIRXFC", "SSIRXEC", "SSITXLGSTS", "SSIRXLGSTS", "SIRXFSSCNT") +
+						  tuple(f"CTRRXDATA{i}" for i in range(8)))
+
+# numpy view of a stream of 64 byte INT0 response packets
+if(np is not None):
+	_INT0_RSP_DTYPE = np.dtype({"names": ["status", "value"], "formats": ["<u2", "<u4"],
+								"offsets": [0, 2], "itemsize": 64})
+
+
+
+
+#------------------------------------------------------------
+# Name: USB20F_Error():
+#
+# Description:
+#   Exception raised by the fast-path API (read_reg(),
+#	write_reg(), *_into() etc.) when a libusb transfer fails.
+#	The legacy methods keep returning (1, <error code>).
+#
+# Parameters:
+#	code: libusb return code (negative int)
+#	endpoint: endpoint address of the failed transfer
+#	transferred: bytes moved before the failure
+#
+#------------------------------------------------------------
+class USB20F_Error(Exception):
+	def __init__(self, code, endpoint=None, transferred=0):
+		self.code = code
+		self.endpoint = endpoint
+		self.transferred = transferred
+		ep = "n/a" if endpoint is None else f"{endpoint:#04x}"
+		Exception.__init__(self, f"libusb ret code <{code}> <{usb.error_name(code)}> on endpoint <{ep}>")
+
+
+class USB20F_TimeoutError(USB20F_Error):
+	pass
+
+
+
+
+#------------------------------------------------------------
+# Name: USB20F_StatusError():
+#
+# Description:
+#   Raised by the fast-path register API when the transfers
+#	succeeded but the bridge rejected the command (nonzero
+#	status in the INT0 response).
+#
+# Parameters:
+#	status: response status word
+#	address: register address of the command
+#
+#------------------------------------------------------------
+class USB20F_StatusError(USB20F_Error):
+	def __init__(self, status, address):
+		self.code = status
+		self.status = status
+		self.address = address
+		self.endpoint = None
+		self.transferred = 0
+		Exception.__init__(self, f"bridge status <{status:#06x}> for register <{address:#010x}>")
+
+
+
+
+#------------------------------------------------------------
+# Name: USB20F_VerifyError():
+#
+# Description:
+#   Raised when a register read back after a verified write
+#	doesn't hold the written bits.
+#
+# Parameters:
+#	mismatches: list of (address, mask, expected, read value)
+#
+#------------------------------------------------------------
+class USB20F_VerifyError(Exception):
+	def __init__(self, mismatches):
+		self.mismatches = mismatches
+		desc = ", ".join(f"{a:#010x}: mask {m:#010x} expected {e:#010x} read {v:#010x}"
+							for (a, m, e, v) in mismatches)
+		Exception.__init__(self, f"register verify failed: {desc}")
+
+
+def _usb_error(code, endpoint=None, transferred=0):
+	if(code == LIBUSB_ERROR_TIMEOUT):
+		return USB20F_TimeoutError(code, endpoint, transferred)
+	return USB20F_Error(code, endpoint, transferred)
+
+
+
+
+#------------------------------------------------------------
+# Name: RegPacket():
+#
+# Description:
+#   Slotted result of an INT0 register read. raw is only
+#	populated when the caller asks for it (bytes copy or a
+#	memoryview onto the device's reusable receive buffer,
+#	which is overwritten by the next INT0 access).
+#
+#------------------------------------------------------------
+class RegPacket(object):
+	__slots__ = ("address", "value", "status", "raw")
+
+	def __init__(self, address, value, status, raw=None):
+		self.address = address
+		self.value = value
+		self.status = status
+		self.raw = raw
+
+	def __repr__(self):
+		return f"RegPacket(address={self.address:#010x}, value={self.value:#010x}, status={self.status:#06x})"
+
+
+
+
+#------------------------------------------------------------
+# Name: WaitResult():
+#
+# Description:
+#   Slotted result of wait_for()/wait_for_all().
+#	met: True when all conditions held before the deadline
+#	values: {address: last value read}
+#	polls: number of poll rounds issued
+#	elapsed: wait duration in seconds
+#
+#------------------------------------------------------------
+class WaitResult(object):
+	__slots__ = ("met", "values", "polls", "elapsed")
+
+	def __init__(self, met, values, polls, elapsed):
+		self.met = met
+		self.values = values
+		self.polls = polls
+		self.elapsed = elapsed
+
+	def __bool__(self):
+		return self.met
+
+	def __repr__(self):
+		vals = ", ".join(f"{a:#010x}: {v:#010x}" for (a, v) in self.values.items())
+		return f"WaitResult(met={self.met}, polls={self.polls}, elapsed={self.elapsed * 1000:.3f} mS, values={{{vals}}})"
+
+
+
+
+#------------------------------------------------------------
+# Name: StreamResult():
+#
+# Description:
+#   Slotted result of the streaming transfer methods.
+#	nbytes: payload bytes transferred
+#	padded: pad bytes appended to the last transfer
+#	transfers: number of bulk transfers issued
+#	elapsed: duration in seconds
+#
+#------------------------------------------------------------
+class StreamResult(object):
+	__slots__ = ("nbytes", "padded", "transfers", "elapsed")
+
+	def __init__(self, nbytes, padded, transfers, elapsed):
+		self.nbytes = nbytes
+		self.padded = padded
+		self.transfers = transfers
+		self.elapsed = elapsed
+
+	@property
+	def mbps(self):
+		return (self.nbytes / self.elapsed / 1e6) if self.elapsed > 0 else 0.0
+
+	def __repr__(self):
+		return (f"StreamResult(nbytes={self.nbytes}, padded={self.padded}, transfers={self.transfers}, "
+				f"elapsed={self.elapsed:.3f} s, {self.mbps:.3f} MB/s)")
+
+
+
+
+#------------------------------------------------------------
+# Name: RecoveryEvent():
+#
+# Description:
+#   Slotted record of one automatic recovery attempt (see
+#	USB20F_Device.recovery_stats()).
+#	t: time.time() the fault was detected
+#	action: "clear_halt", "reset" or "reopen"
+#	endpoint: endpoint of the failed transfer
+#	code: libusb return code that triggered the recovery
+#	ok: recovery succeeded
+#	elapsed: recovery time in seconds
+#
+#------------------------------------------------------------
+class RecoveryEvent(object):
+	__slots__ = ("t", "action", "endpoint", "code", "ok", "elapsed")
+
+	def __init__(self, t, action, endpoint, code, ok, elapsed):
+		self.t = t
+		self.action = action
+		self.endpoint = endpoint
+		self.code = code
+		self.ok = ok
+		self.elapsed = elapsed
+
+	def __repr__(self):
+		return (f"RecoveryEvent({self.action} on {self.endpoint:#04x} after <{self.code}>, "
+				f"{'ok' if self.ok else 'FAILED'}, {self.elapsed * 1000:.3f} mS)")
+
+
+
+
+#------------------------------------------------------------
+# Name: _HandleGate():
+#
+# Description:
+#   Guards the device handle against being closed under a
+#	running transfer. Transfers enter()/leave() around their
+#	libusb calls; exclusive() blocks new transfers and waits
+#	until the running ones left, after which the handle can be
+#	closed and replaced. The exclusive owner's own transfers
+#	(register restore) pass straight through.
+#
+#------------------------------------------------------------
+class _HandleGate(object):
+	def __init__(self):
+		self._cv = threading.Condition(threading.Lock())
+		self._users = 0
+		self._owner = None
+
+
+	def enter(self):
+		me = threading.get_ident()
+		with self._cv:
+			if(self._owner == me):
+				return
+			while self._owner is not None:
+				self._cv.wait()
+			self._users += 1
+
+
+	def leave(self):
+		with self._cv:
+			if(self._owner == threading.get_ident()):
+				return
+			self._users -= 1
+			if(not self._users):
+				self._cv.notify_all()
+
+
+	# True once no transfer is running, False (gate reopened)
+	# when that takes longer than timeout seconds
+	def exclusive(self, timeout):
+		deadline = time.monotonic() + timeout
+		with self._cv:
+			while self._owner is not None:
+				self._cv.wait()
+			self._owner = threading.get_ident()
+			while self._users:
+				remaining = deadline - time.monotonic()
+				if(remaining <= 0):
+					self._owner = None
+					self._cv.notify_all()
+					return False
+				self._cv.wait(remaining)
+			return True
+
+
+	def release(self):
+		with self._cv:
+			self._owner = None
+			self._cv.notify_all()
+
+
+
+
+#------------------------------------------------------------
+# Name: RegSnapshot():
+#
+# Description:
+#   Register space image returned by USB20F_Device.snapshot().
+#	Values are held in an array('I') in the order of names,
+#	names/addresses tuples are shared between snapshots.
+#
+#	snap["SR1"], snap.get("CR2"), dict(snap.items())
+#
+# Parameters:
+#	names: register names (without _ADDR)
+#	addresses: register addresses, same order
+#	values: array('I') of register values, same order
+#	t: capture time (time.time())
+#
+#------------------------------------------------------------
+class RegSnapshot(object):
+	__slots__ = ("names", "addresses", "values", "t", "_index")
+
+	def __init__(self, names, addresses, values, t):
+		self.names = names
+		self.addresses = addresses
+		self.values = values
+		self.t = t
+		self._index = None
+
+	def index(self, name):
+		if(self._index is None):
+			self._index = {n: i for (i, n) in enumerate(self.names)}
+		return self._index[name]
+
+	def __getitem__(self, name):
+		return self.values[self.index(name)]
+
+	def get(self, name, default=None):
+		try:
+			return self[name]
+		except KeyError:
+			return default
+
+	def __contains__(self, name):
+		return self.get(name) is not None
+
+	def __len__(self):
+		return len(self.names)
+
+	def items(self):
+		return zip(self.names, self.values)
+
+	def __repr__(self):
+		return f"RegSnapshot({len(self.names)} registers, t={self.t:.3f})"
+
+
+
+
+#------------------------------------------------------------
+# Name: RegTransaction():
+#
+# Description:
+#   Context manager returned by USB20F_Device.transaction().
+#	While open, write_reg() calls from the owning thread are
+#	queued instead of sent: masked writes to the same register
+#	are merged into one (mask, data) pair, and all registers
+#	are written back to back by write_regs() on exit. Each
+#	thread has its own open transaction, writes from other
+#	threads are never queued or reordered by it. Any
+#	read_reg()/read_regs() inside the transaction flushes the
+#	pending writes first so reads see them. Leaving the block
+#	with an exception discards the pending writes.
+#
+# Parameters:
+#	dev: USB20F_Device
+#	verify: read back and check every register on flush
+#
+#------------------------------------------------------------
+class RegTransaction(object):
+	def __init__(self, dev, verify=False):
+		self.dev = dev
+		self.verify = verify
+		self.pending = {}
+		self.owner = None
+		self._outer = None
+
+
+	def __enter__(self):
+		self._outer = self.dev._txn
+		if(self._outer is not None):
+			# nested - join the outer transaction
+			self._outer.verify = self._outer.verify or self.verify
+			return self._outer
+
+		self.owner = threading.get_ident()
+		self.dev._txn = self
+		return self
+
+
+	def __exit__(self, exc_type, exc, tb):
+		if(self.owner is None):
+			return False
+
+		self.dev._txn = self._outer
+		if(exc_type is not None):
+			if(self.pending):
+				self.dev.log.write("WARNING", f"transaction aborted, {len(self.pending)} register write(s) discarded")
+			self.pending = {}
+			return False
+
+		self.flush()
+		return False
+
+
+	def write(self, address, data, mask):
+		m, d = self.pending.get(address, (0, 0))
+		mask &= 0xFFFFFFFF
+		self.pending[address] = (m | mask, (d & ~mask) | (data & mask))
+
+
+	def flush(self):
+		if(self.pending):
+			writes = [(a, d, m) for (a, (m, d)) in self.pending.items()]
+			self.pending = {}
+			self.dev.write_regs(writes, verify=self.verify, _direct=True)
+
+
+
+
+#------------------------------------------------------------
+# Name: AdaptiveTimeout():
+#
+# Description:
+#   Transfer timeout estimator in the style of the TCP RTO
+#	(RFC 6298). Keeps a smoothed latency (srtt) and its mean
+#	deviation (rttvar) and returns srtt + 4 * rttvar, clamped
+#	to [floor, ceiling]. A timeout doubles the current value
+#	until the next successful sample.
+#
+# Parameters:
+#	initial: timeout in mS used before the first sample
+#	floor: minimum timeout in mS
+#	ceiling: maximum timeout in mS
+#
+#------------------------------------------------------------
+class AdaptiveTimeout(object):
+	__slots__ = ("initial", "floor", "ceiling", "srtt", "rttvar", "rto", "samples", "timeouts")
+
+	ALPHA = 0.125
+	BETA = 0.25
+	K = 4
+
+	def __init__(self, initial, floor, ceiling):
+		self.initial = initial
+		self.floor = floor
+		self.ceiling = ceiling
+		self.srtt = None
+		self.rttvar = None
+		self.rto = float(initial)
+		self.samples = 0
+		self.timeouts = 0
+
+
+	def sample(self, rtt):
+		if(self.srtt is None):
+			self.srtt = rtt
+			self.rttvar = rtt / 2.0
+		else:
+			self.rttvar += self.BETA * (abs(self.srtt - rtt) - self.rttvar)
+			self.srtt += self.ALPHA * (rtt - self.srtt)
+		self.samples += 1
+		self.rto = min(max(self.srtt + max(1.0, self.K * self.rttvar), self.floor), self.ceiling)
+
+
+	def backoff(self):
+		self.timeouts += 1
+		self.rto = min(max(self.rto * 2, self.floor), self.ceiling)
+
+
+	def timeout(self):
+		return int(self.rto + 0.5)
+
+
+	def __repr__(self):
+		srtt = "n/a" if self.srtt is None else f"{self.srtt:.3f}"
+		rttvar = "n/a" if self.rttvar is None else f"{self.rttvar:.3f}"
+		return f"AdaptiveTimeout(rto={self.rto:.1f} mS, srtt={srtt}, rttvar={rttvar}, samples={self.samples}, timeouts={self.timeouts})"
+
+
+
+
+#------------------------------------------------------------
+# Name: as_words():
+#
+# Description:
+#   View a byte buffer as little-endian 16 or 32-bit words
+#	without copying (numpy uint16/uint32 array when numpy is
+#	available, memoryview otherwise). Trailing bytes that don't
+#	fill a whole word are ignored.
+#
+# Parameters:
+#	buf: bytes-like object or numpy uint8 array
+#	bits: 16 or 32
+#
+# Return:
+#	numpy array or memoryview (array.array copy on big-endian
+#	hosts without numpy)
+#
+#------------------------------------------------------------
+def as_words(buf, bits=16):
+	if(bits not in (16, 32)):
+		raise ValueError(f"bits must be 16 or 32, got <{bits}>")
+
+	mv = memoryview(buf).cast("B")
+	size = bits // 8
+	mv = mv[:len(mv) - (len(mv) % size)]
+
+	if(np is not None):
+		return np.frombuffer(mv, dtype="<u2" if bits == 16 else "<u4")
+
+	code = "H" if bits == 16 else "I"
+	if(sys.byteorder == "little"):
+		return mv.cast(code)
+
+	words = array(code, mv)
+	words.byteswap()
+	return words
+
+
+
+
+#------------------------------------------------------------
+# Name: decode_int0_responses():
+#
+# Description:
+#   Decode a run of 64 byte INT0 response packets (same layout
+#	read_InternalReg() parses: status in bytes 0-1, register
+#	value in bytes 2-5) in one step.
+#
+# Parameters:
+#	buf: bytes-like object or numpy uint8 array holding
+#		N * 64 bytes
+#
+# Return:
+#	(status, value) - numpy uint16/uint32 arrays (views onto buf)
+#	or array('H')/array('I') without numpy
+#
+#------------------------------------------------------------
+def decode_int0_responses(buf):
+	mv = memoryview(buf).cast("B")
+	if(len(mv) % 64):
+		raise ValueError(f"INT0 response buffer not 64 byte packets, mod result <{len(mv) % 64}>!")
+
+	if(np is not None):
+		rsp = np.frombuffer(mv, dtype=_INT0_RSP_DTYPE)
+		return (rsp["status"], rsp["value"])
+
+	status = array("H")
+	value = array("I")
+	for (st, val) in (_INT0_RSP.unpack_from(mv, off) for off in range(0, len(mv), 64)):
+		status.append(st)
+		value.append(val)
+	return (status, value)
+
+
+
+
+#------------------------------------------------------------
+# Name: _as_cbuf():
+#
+# Description:
+#   Wrap a bytes-like object as a ctypes c_ubyte array for
+#	usb.bulk_transfer(). Writable buffers (bytearray, mmap,
+#	writable memoryview, ctypes arrays) are shared without a
+#	copy, read-only ones are copied once.
+#
+#------------------------------------------------------------
+def _as_cbuf(data, writable=False):
+	mv = memoryview(data)
+	n = mv.nbytes
+	try:
+		return (ct.c_ubyte*n).from_buffer(mv), n
+	except TypeError:
+		if(writable):
+			raise
+		return (ct.c_ubyte*n).from_buffer_copy(mv), n
+
+
+
+#------------------------------------------------------------
+# Name: BridgeInfo():
+#
+# Description:
+#   Slotted description of one attached bridge, returned by
+#	list_bridges().
+#	port_path: tuple of hub port numbers from the root hub,
+#		stable for a given physical connection
+#
+#------------------------------------------------------------
+class BridgeInfo(object):
+	__slots__ = ("vid", "pid", "serial", "bus", "address", "port_path")
+
+	def __init__(self, vid, pid, serial, bus, address, port_path):
+		self.vid = vid
+		self.pid = pid
+		self.serial = serial
+		self.bus = bus
+		self.address = address
+		self.port_path = port_path
+
+	@property
+	def location(self):
+		return f"{self.bus}-{'.'.join(str(p) for p in self.port_path)}"
+
+	def __repr__(self):
+		return (f"BridgeInfo({self.vid:04x}:{self.pid:04x}, serial={self.serial}, bus={self.bus}, "
+				f"address={self.address}, port={self.location})")
+
+
+
+
+#------------------------------------------------------------
+# Name: _read_serial():
+#
+# Description:
+#   Read the serial number string of a (not yet opened)
+#	device using a temporary handle.
+#
+# Return:
+#	serial number string, None if it can't be read
+#
+#------------------------------------------------------------
+def _read_serial(dev, desc):
+	handle = ct.POINTER(usb.device_handle)()
+	if(usb.open(dev, handle) < 0):
+		return None
+
+	sn = _handle_serial(handle, desc)
+	usb.close(handle)
+	return sn
+
+
+# serial number string of an opened device (one control transfer)
+def _handle_serial(handle, desc):
+	buf = (ct.c_ubyte*64)()
+	r = usb.get_string_descriptor(handle, desc.iSerialNumber, 0x409, buf, 64)
+	if(r < 2):
+		return None
+
+	return bytes(buf)[2:r].decode("utf-16")
+
+
+
+
+# (bus number, hub port path tuple) of a libusb device
+def _location(dev):
+	ports = (ct.c_uint8*7)()
+	n = usb.get_port_numbers(dev, ports, len(ports))
+	return (usb.get_bus_number(dev), tuple(ports[:max(n, 0)]))
+
+
+
+
+#------------------------------------------------------------
+# Name: list_bridges():
+#
+# Description:
+#   Enumerate attached bridges with a matching VID/PID. Each
+#	bridge is opened briefly to read its serial number string.
+#
+# Return:
+#	list of BridgeInfo
+#
+#------------------------------------------------------------
+def list_bridges(vid=0x1cbf, pid=0x0007):
+	if(usb.init(None) < 0):
+		return []
+
+	found = []
+	devs = ct.POINTER(ct.POINTER(usb.device))()
+	if(usb.get_device_list(None, ct.byref(devs)) < 0):
+		usb.exit(None)
+		return found
+
+	try:
+		i = 0
+		while devs[i]:
+			dev = devs[i]
+			i += 1
+			desc = usb.device_descriptor()
+			if(usb.get_device_descriptor(dev, ct.byref(desc)) < 0):
+				continue
+			if(desc.idVendor != vid or desc.idProduct != pid):
+				continue
+
+			bus, port_path = _location(dev)
+			found.append(BridgeInfo(vid, pid, _read_serial(dev, desc), bus, usb.get_device_address(dev), port_path))
+	finally:
+		usb.free_device_list(devs, 1)
+		# balance the usb.init() above (the default context is
+		# reference counted)
+		usb.exit(None)
+
+	return found
+
+
+
+
+# status reported to trace hooks for register operations
+def _flag_status(res):
+	return 0 if res[0] == 0 else res[1]
+
+
+def _rsp_status(res):
+	return res[0]
+
+
 
 
 #------------------------------------------------------------
@@ -75,6 +832,53 @@ class USB20F_Device(object):
 		self.NAME = name + "(rei_usb_lib)"
 		self.DESCRIPTION = ""
 		self.EP_TIMEOUT = 250 #mS
+
+		# adaptive transfer timeouts (see timeout_for())
+		# - EP_TIMEOUT is the initial value and the fixed value
+		#	when ADAPTIVE_TIMEOUT is False
+		# - receive endpoints (BULK IN, INT1 IN) always use
+		#	EP_TIMEOUT, their latency is data arrival, not link
+		self.ADAPTIVE_TIMEOUT = True
+		self.EP_TIMEOUT_FLOOR = 50 #mS
+		self.EP_TIMEOUT_CEILING = 2000 #mS
+		self.ep_timeouts = {}
+
+		# automatic fault recovery (see _recover())
+		# - LIBUSB_ERROR_PIPE: clear the halt and retry the transfer
+		# - RECOVER_TIMEOUTS consecutive timeouts on an endpoint
+		#	that must answer (OUT endpoints, INT0 IN): reset the
+		#	bridge
+		# - LIBUSB_ERROR_NO_DEVICE: reopen by serial number for up
+		#	to RECOVER_REOPEN_WAIT seconds, restore interface
+		#	claims and written registers, retry the transfer
+		self.RECOVERY = True
+		self.RECOVER_TIMEOUTS = 3
+		self.RECOVER_REOPEN_WAIT = 5.0 #S
+		self.recoveries = deque(maxlen=256)
+		self._recover_lock = threading.Lock()
+		self._gate = _HandleGate()
+		self._generation = 0
+		self._ep_timeouts_run = {}
+		self._claimed = set()
+		self._reg_shadow = {}
+		self._inventory = None
+
+		# transfer tracing hooks (see add_trace_hook())
+		self._tracing = False
+		self._trace_hooks = ()
+		self._pre_hooks = ()
+		self._post_hooks = ()
+
+		# send_stream() defaults
+		# - transfer size in bytes (multiple of the bulk packet
+		#	size, 64 full speed / 512 high speed)
+		# - number of bulk transfers kept in flight
+		self.STREAM_XFER_SIZE = 16384
+		self.STREAM_DEPTH = 4
+
+		# capture_to_file() writer buffers (count) when the
+		# capture size isn't known up front
+		self.CAPTURE_BUFFERS = 8
 		self.EP_SIZE = 64
 		self.bulk_transferred = ct.POINTER(ct.c_int)()
 		self.bulk_transferred.contents = ct.c_int(0)
@@ -87,15 +891,41 @@ class USB20F_Device(object):
 		self._EP_INT1_OUT = 0x02
 		self._EP_BULK_IN = 0x83
 		self._EP_BULK_OUT = 0x03
+		self._ENDPOINTS = (self._EP_INT0_OUT, self._EP_INT0_IN, self._EP_INT1_OUT,
+						   self._EP_INT1_IN, self._EP_BULK_OUT, self._EP_BULK_IN)
+
+		# filled in by open_usb(): {endpoint: max packet size},
+		# bus number and hub port path of the opened bridge
+		self.ep_max_packet = {}
+		self.bus = None
+		self.port_path = ()
 
 		self.EPOUT_ACTIVE = self._EP_INT0_OUT
 		self.EPIN_ACTIVE = self._EP_INT0_IN
 		
 		self.ep_data_out = (ct.c_ubyte*(self.EP_SIZE))()
-		self.ep_data_in = (ct.c_ubyte*(self.EP_SIZE))()		
+		self.ep_data_in = (ct.c_ubyte*(self.EP_SIZE))()
 
-		# return status
-		self.r = 0
+		# fast-path buffers, allocated once and reused by every call
+		self._int0_out = (ct.c_ubyte*64)()
+		self._int0_in = (ct.c_ubyte*64)()
+		self._int1_in = (ct.c_ubyte*64)()
+		# one transferred-bytes counter per endpoint address (IN and OUT
+		# separately) so each endpoint can be driven from its own thread
+		self._xfer_len_p = {ep: ct.pointer(ct.c_int(0)) for ep in self._ENDPOINTS}
+
+		# serializes INT0 command/response pairs between threads
+		self._int0_lock = threading.RLock()
+
+		# open write_reg() coalescing transaction of each thread (see
+		# transaction() and the _txn property)
+		self._txn_local = threading.local()
+
+		# result of the last wait_for()/wait_for_all() call
+		self.last_wait = None
+
+		# return status
+		self.r = 0
 
 		# setup register addresses
 		self.CR1_ADDR = 0x00000000
@@ -167,6 +997,11 @@ class USB20F_Device(object):
 	# Parameters:
 	#	VID: hex vid value
 	#	PID: hex pid value
+	#	sn: serial number string, selects one bridge when several
+	#		share the VID/PID (default None - first match)
+	#	inventory: optional Inventory_USB20F.DeviceInventory, a
+	#		bridge already in the inventory is opened without the
+	#		descriptor reads, new bridges are added to it
 	#
 	# Return:
 	#	- returns tuple with (<pass/fail flag>, <error_code or data>)
@@ -174,7 +1009,7 @@ class USB20F_Device(object):
 	#	Failure: (1, <error code>)
 	#
 	#------------------------------------------------------------
-	def open_usb(self, vid=0x1cbf, pid=0x0007):
+	def open_usb(self, vid=0x1cbf, pid=0x0007, sn=None, inventory=None):
 		self.log.write("DEBUG", "--> Enter open_usb()")
 		#
 		# callback vars
@@ -209,6 +1044,14 @@ class USB20F_Device(object):
 			self.log.write("ERROR", f'get device list failure: {cnt}')
 			return (1, 2)
 
+		self._inventory = inventory
+
+		# known bridge - skip descriptor reads and logging
+		if(inventory is not None):
+			r = self._open_from_inventory(inventory, sn)
+			if(r is not None):
+				return r
+
 		self.log.write("INFO", '\n')
 		self.log.write("INFO", "/* Getting USB device list */")
 
@@ -217,202 +1060,1540 @@ class USB20F_Device(object):
 		while self.devs[i]:
 			self.dev = self.devs[i]
 
-			self.desc = usb.device_descriptor()
-			self.r = usb.get_device_descriptor(self.dev, ct.byref(self.desc))
+			self.desc = usb.device_descriptor()
+			self.r = usb.get_device_descriptor(self.dev, ct.byref(self.desc))
+
+			if self.r < 0:
+				self.log.write("ERROR", f'failed to get device descriptor: {self.r}')
+				return (1, 3)
+
+			self.log.write("INFO", "{:04x}:{:04x} (bus {:d}, device {:d})".format(
+				  self.desc.idVendor, self.desc.idProduct, 
+				  usb.get_bus_number(self.dev), usb.get_device_address(self.dev)))
+
+
+			if(self.desc.idVendor == self.vid) and (self.desc.idProduct == self.pid):
+				# skip bridges with a different serial number
+				if(sn is not None) and (self._get_serial(self.dev, self.desc) != sn):
+					i += 1
+					continue
+
+				self.log.write("INFO", '\n')
+				self.log.write("INFO", '/* Descriptor Inforamtion */')
+				self.log.write("INFO", f"{'bLength: ':.<30}{f'{self.desc.bLength:#02x}':.>20}")
+				self.log.write("INFO", f"{'bDescriptorType: ':.<30}{f'{self.desc.bDescriptorType:#02x}':.>20}")
+				self.log.write("INFO", f"{'bcdUSB: ':.<30}{f'{self.desc.bcdUSB:#04x}':.>20}")
+				self.log.write("INFO", f"{'bDeviceClass: ':.<30}{f'{self.desc.bDeviceClass:#02x}':.>20}")
+				self.log.write("INFO", f"{'bDeviceSubClass: ':.<30}{f'{self.desc.bDeviceSubClass:#02x}':.>20}")
+				self.log.write("INFO", f"{'bDeviceProtocol: ':.<30}{f'{self.desc.bDeviceProtocol:#02x}':.>20}")
+				self.log.write("INFO", f"{'bMaxPacketSize0: ':.<30}{f'{self.desc.bMaxPacketSize0:#02x}':.>20}")
+				self.log.write("INFO", f"{'idVendor: ':.<30}{f'{self.desc.idVendor:#02x}':.>20}")
+				self.log.write("INFO", f"{'idProduct: ':.<30}{f'{self.desc.idProduct:#02x}':.>20}")
+				self.log.write("INFO", f"{'bcdDevice: ':.<30}{f'{self.desc.bcdDevice:#02x}':.>20}")
+				self.log.write("INFO", f"{'iManufacturer: ':.<30}{f'{self.desc.iManufacturer:#02x}':.>20}")
+				self.log.write("INFO", f"{'iProduct: ':.<30}{f'{self.desc.iProduct:#02x}':.>20}")
+				self.log.write("INFO", f"{'iSerialNumber: ':.<30}{f'{self.desc.iSerialNumber:#02x}':.>20}")
+				self.log.write("INFO", f"{'bNumConfigurations: ':.<30}{f'{self.desc.bNumConfigurations:#02x}':.>20}")				
+				self.dev_found  = True		
+				break
+
+			i += 1
+
+
+		#
+		# open device if matching vid/pid was found
+		#
+		if(self.dev_found  == True):
+			self.r = usb.open(self.dev, self.dev_handle)
+			if self.r < 0:
+				self.log.write("ERROR", f"ret val: {self.r} - {usb.strerror(self.r)}")
+				self.log.write("ERROR", "failed to open device!")
+				return (1, 4)
+
+
+			# DEBUG: Get ep size info and configuration
+			self.r = usb.get_string_descriptor(self.dev_handle, self.desc.iSerialNumber, 0x409, self.sn_string, 18)
+			self.r = usb.get_string_descriptor(self.dev_handle, self.desc.iProduct, 0x409, self.pd_string, 30)
+			self.r = usb.get_string_descriptor(self.dev_handle, self.desc.iManufacturer, 0x409, self.mf_string, 26)
+			
+			self.sn_string_d = bytes(self.sn_string)[2:].decode("utf-16") # type - string
+			self.pd_string_d = bytes(self.pd_string)[2:].decode("utf-16") # type - string
+			self.mf_string_d = bytes(self.mf_string)[2:].decode("utf-16") # type - string		
+
+			# utf-16 decoding
+			# skip first two bytes b/c they are USB protocol stuff not SN
+			# - don't really need the below for loop for manual decoding anymore
+			self.log.write("INFO", '\n')
+			self.log.write("INFO", "/* String descriptor info */")
+			self.log.write("INFO", f"{'Manufacturer Description: ':.<30}{self.mf_string_d:.>20}")		
+			self.log.write("INFO", f"{'Product Description: ':.<30}{self.pd_string_d:.>20}")
+			self.log.write("INFO", f"{'Serial Number: ':.<30}{self.sn_string_d:.>20}")
+
+			if self.r < 0:
+				self.log.write("ERROR", f"ret val: {self.r} - {usb.strerror(self.r)}")
+				self.log.write("ERROR", "failed to open device", file=sys.stdout)
+				return (1, 5)
+
+			# get device info for debugging
+			self.log.write("INFO", '\n')
+			self.log.write("INFO", "/* Endpoint Sizes */")
+			self.ep_size = usb.get_max_packet_size(self.dev, 0x01)
+			self.log.write("INFO", f"ep_out_size: {self.ep_size}")
+			self.ep_size = usb.get_max_packet_size(self.dev, 0x81)
+			self.log.write("INFO", f"ep_in_size: {self.ep_size}")
+			self.r = usb.get_configuration(self.dev_handle, self.device_configuration)
+			self.log.write("INFO", f"r: {self.r}, configuration: {self.device_configuration.contents}")
+
+			self._set_packet_sizes({ep: usb.get_max_packet_size(self.dev, ep) for ep in self._ENDPOINTS})
+			self.bus, self.port_path = _location(self.dev)
+			if(inventory is not None):
+				inventory.record(self)
+
+			# success - return usb device handle
+			return (0, self.dev_handle)
+
+		# ERROR: Failed to find vid/pid
+		else:
+			self.log.write("ERROR", f'ERROR: failed to find vid: {self.vid}, pid: {self.vid}, sn: {sn}')
+			return (1, 6)
+
+		self.log.write("DEBUG", "<-- Exit open_usb()")
+
+
+
+
+
+	#------------------------------------------------------------
+	# Name: _get_serial():
+	#
+	# Description:
+	#   Read the serial number string of a (not yet opened)
+	#	device using a temporary handle.
+	#
+	# Return:
+	#	serial number string, None if it can't be read
+	#
+	#------------------------------------------------------------
+	def _get_serial(self, dev, desc):
+		return _read_serial(dev, desc)
+
+
+
+
+
+
+	#------------------------------------------------------------
+	# Name: _open_from_inventory():
+	#
+	# Description:
+	#   open_usb() fast path. Finds a VID/PID match whose bus/port
+	#	path is in the inventory and whose device descriptor
+	#	(held by libusb, no bus traffic) still matches the cached
+	#	one, then opens it and checks its serial number string
+	#	(one control transfer, identical bridges can swap ports).
+	#	The product/manufacturer strings, max packet sizes and
+	#	configuration are restored from the cache.
+	#
+	# Return:
+	#	(0, usb_dev_handle), None when no cached bridge matched
+	#
+	#------------------------------------------------------------
+	def _open_from_inventory(self, inventory, sn):
+		i = 0
+		while self.devs[i]:
+			dev = self.devs[i]
+			i += 1
+			desc = usb.device_descriptor()
+			if(usb.get_device_descriptor(dev, ct.byref(desc)) < 0):
+				continue
+			if(desc.idVendor != self.vid) or (desc.idProduct != self.pid):
+				continue
+
+			bus, port_path = _location(dev)
+			entry = inventory.lookup(bus, port_path)
+			if(entry is None) or (sn is not None and entry["serial"] != sn):
+				continue
+			if(not inventory.matches(entry, desc)):
+				inventory.forget(bus, port_path)
+				continue
+
+			if(usb.open(dev, self.dev_handle) < 0):
+				return None
+			if(_handle_serial(self.dev_handle, desc) != entry["serial"]):
+				# another unit of the same model on this port
+				usb.close(self.dev_handle)
+				inventory.forget(bus, port_path)
+				continue
+
+			self.dev = dev
+			self.desc = desc
+			self.dev_found = True
+			self.bus, self.port_path = bus, port_path
+			self.sn_string_d = entry["serial"]
+			self.pd_string_d = entry["product"]
+			self.mf_string_d = entry["manufacturer"]
+			self._set_packet_sizes({int(ep, 0): size for (ep, size) in entry["max_packet"].items()})
+			self.device_configuration.contents = ct.c_int(entry["configuration"])
+			self.log.write("INFO", f"opened bridge <{self.sn_string_d}> at {bus}-{'.'.join(map(str, port_path))} "
+									f"from inventory")
+			return (0, self.dev_handle)
+
+		return None
+
+
+
+
+
+	#------------------------------------------------------------
+	# Name: _set_packet_sizes():
+	#
+	# Description:
+	#   Take over the endpoint max packet sizes of the opened
+	#	bridge (64 bytes on full speed bridges, 512 byte bulk
+	#	packets on high speed variants). Sizes libusb couldn't
+	#	report fall back to 64. The INT1 IN buffer is resized to
+	#	its endpoint and STREAM_XFER_SIZE is rounded up to a
+	#	whole number of bulk packets.
+	#
+	#------------------------------------------------------------
+	def _set_packet_sizes(self, sizes):
+		self.ep_max_packet = {}
+		for (ep, size) in sizes.items():
+			if(size <= 0 or size & (size - 1)):
+				self.log.write("WARNING", f"endpoint {ep:#04x} max packet size <{size}> invalid, using 64")
+				size = 64
+			self.ep_max_packet[ep] = size
+		self.log.write("INFO", "max packet sizes: " +
+						", ".join(f"{ep:#04x}={size}" for (ep, size) in sorted(self.ep_max_packet.items())))
+
+		int1 = self.packet_size(self._EP_INT1_IN)
+		if(len(self._int1_in) != int1):
+			self._int1_in = (ct.c_ubyte*int1)()
+
+		bulk = max(self.packet_size(self._EP_BULK_OUT), self.packet_size(self._EP_BULK_IN))
+		if(self.STREAM_XFER_SIZE % bulk):
+			size = self.STREAM_XFER_SIZE + bulk - (self.STREAM_XFER_SIZE % bulk)
+			self.log.write("WARNING", f"STREAM_XFER_SIZE <{self.STREAM_XFER_SIZE}> not a multiple of the "
+										f"{bulk} byte bulk packet, using {size}")
+			self.STREAM_XFER_SIZE = size
+
+
+	#------------------------------------------------------------
+	# Name: packet_size():
+	#
+	# Description:
+	#   Max packet size of endpoint ep as detected by open_usb()
+	#	(64 before the bridge is opened).
+	#
+	#------------------------------------------------------------
+	def packet_size(self, ep):
+		return self.ep_max_packet.get(ep, 64)
+
+
+	# raise ValueError when n isn't a whole number of ep packets
+	def _check_packets(self, n, ep, what):
+		size = self.packet_size(ep)
+		if(n % size):
+			raise ValueError(f"{what} not {size} byte blocks, mod result <{n % size}>!")
+		return size
+
+
+
+
+
+	#------------------------------------------------------------
+	# Name: dump_descriptors():
+	#
+	# Description:
+	#   This method prints all USB descriptor information for the 
+	#	bridge USB interface.
+	#
+	# Parameters:
+	#	<TBD>
+	#
+	# Return:
+	#	- returns tuple with (<pass/fail flag>, <error_code or data>)
+	#	Success: (0, 0)
+	#	Failure: (1, <error code>)
+	#
+	#------------------------------------------------------------
+	def dump_descriptors(self, vid=0x1cbf, pid=0x0007):
+		self.log.write("DEBUG", "--> Enter open_usb()")
+		#
+		# callback vars
+		#
+		#self.dev = None
+		#self.sn_string = (ct.c_ubyte* 18)()	# sn string
+		#self.pd_string = (ct.c_ubyte* 30)()	# product string
+		#self.mf_string = (ct.c_ubyte* 26)()	# manf string
+		#self.device_configuration = ct.POINTER(ct.c_int)()	
+		#self.dev_handle = ct.POINTER(usb.device_handle)() # creates device handle (not device obj)
+		#self.desc = None
+		#self.r = None
+		#self.vid = vid
+		#self.pid = pid
+
+
+		#
+		# inits
+		#
+		#self.device_configuration.contents = ct.c_int(0)
+
+		# open usb device
+		#self.r = usb.init(None)
+		#if self.r < 0:
+		#	self.log.write("ERROR", f'usb init failure: {self.r}')
+		#	return (1, 1)
+
+		#self.devs = ct.POINTER(ct.POINTER(usb.device))() # creates device structure
+		#cnt = usb.get_device_list(None, ct.byref(self.devs))
+
+		#if cnt < 0:
+		#	self.log.write("ERROR", f'get device list failure: {cnt}')
+		#	return (1, 2)
+
+		#self.log.write("INFO", '\n')
+		#self.log.write("INFO", "/* Getting USB device list */")
+
+		self.desc = usb.device_descriptor()
+		self.r = usb.get_device_descriptor(self.dev, ct.byref(self.desc))
+
+		if self.r < 0:
+			self.log.write("ERROR", f'failed to get device descriptor: {self.r}')
+			return (1, 3)
+
+		self.log.write("INFO", "{:04x}:{:04x} (bus {:d}, device {:d})".format(
+			  self.desc.idVendor, self.desc.idProduct, 
+			  usb.get_bus_number(self.dev), usb.get_device_address(self.dev)))
+
+
+		if(self.desc.idVendor == self.vid) and (self.desc.idProduct == self.pid):
+			print('\n')
+			print('/* Descriptor Inforamtion */')
+			print(f"{'bLength: ':.<30}{f'{self.desc.bLength:#02x}':.>20}")
+			print(f"{'bDescriptorType: ':.<30}{f'{self.desc.bDescriptorType:#02x}':.>20}")
+			print(f"{'bcdUSB: ':.<30}{f'{self.desc.bcdUSB:#04x}':.>20}")
+			print(f"{'bDeviceClass: ':.<30}{f'{self.desc.bDeviceClass:#02x}':.>20}")
+			print(f"{'bDeviceSubClass: ':.<30}{f'{self.desc.bDeviceSubClass:#02x}':.>20}")
+			print(f"{'bDeviceProtocol: ':.<30}{f'{self.desc.bDeviceProtocol:#02x}':.>20}")
+			print(f"{'bMaxPacketSize0: ':.<30}{f'{self.desc.bMaxPacketSize0:#02x}':.>20}")
+			print(f"{'idVendor: ':.<30}{f'{self.desc.idVendor:#02x}':.>20}")
+			print(f"{'idProduct: ':.<30}{f'{self.desc.idProduct:#02x}':.>20}")
+			print(f"{'bcdDevice: ':.<30}{f'{self.desc.bcdDevice:#02x}':.>20}")
+			print(f"{'iManufacturer: ':.<30}{f'{self.desc.iManufacturer:#02x}':.>20}")
+			print(f"{'iProduct: ':.<30}{f'{self.desc.iProduct:#02x}':.>20}")
+			print(f"{'iSerialNumber: ':.<30}{f'{self.desc.iSerialNumber:#02x}':.>20}")
+			print(f"{'bNumConfigurations: ':.<30}{f'{self.desc.bNumConfigurations:#02x}':.>20}")				
+			#self.log.write("INFO", '\n')
+			#self.log.write("INFO", '/* Descriptor Inforamtion */')
+			#self.log.write("INFO", f"{'bLength: ':.<30}{f'{self.desc.bLength:#02x}':.>20}")
+			#self.log.write("INFO", f"{'bDescriptorType: ':.<30}{f'{self.desc.bDescriptorType:#02x}':.>20}")
+			#self.log.write("INFO", f"{'bcdUSB: ':.<30}{f'{self.desc.bcdUSB:#04x}':.>20}")
+			#self.log.write("INFO", f"{'bDeviceClass: ':.<30}{f'{self.desc.bDeviceClass:#02x}':.>20}")
+			#self.log.write("INFO", f"{'bDeviceSubClass: ':.<30}{f'{self.desc.bDeviceSubClass:#02x}':.>20}")
+			#self.log.write("INFO", f"{'bDeviceProtocol: ':.<30}{f'{self.desc.bDeviceProtocol:#02x}':.>20}")
+			#self.log.write("INFO", f"{'bMaxPacketSize0: ':.<30}{f'{self.desc.bMaxPacketSize0:#02x}':.>20}")
+			#self.log.write("INFO", f"{'idVendor: ':.<30}{f'{self.desc.idVendor:#02x}':.>20}")
+			#self.log.write("INFO", f"{'idProduct: ':.<30}{f'{self.desc.idProduct:#02x}':.>20}")
+			#self.log.write("INFO", f"{'bcdDevice: ':.<30}{f'{self.desc.bcdDevice:#02x}':.>20}")
+			#self.log.write("INFO", f"{'iManufacturer: ':.<30}{f'{self.desc.iManufacturer:#02x}':.>20}")
+			#self.log.write("INFO", f"{'iProduct: ':.<30}{f'{self.desc.iProduct:#02x}':.>20}")
+			#self.log.write("INFO", f"{'iSerialNumber: ':.<30}{f'{self.desc.iSerialNumber:#02x}':.>20}")
+			#self.log.write("INFO", f"{'bNumConfigurations: ':.<30}{f'{self.desc.bNumConfigurations:#02x}':.>20}")
+			return (0, 0)
+		else:
+			print(f'ERROR: Cannot find VID or PID expected, VID={vid}, PID={pid}, found VID={self.desc.idVendor}, PID={self.desc.idProduct}')
+			return (1, 1)
+
+
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: write_InternalReg():
+	#
+	# Description:
+	#   Setup and execute a register write to the usb bridge
+	#	using the INT0 command/control interface. This function 
+	#	will auto read the response received from the bridge
+	#	when a register access operation is performed. Each
+	#	access has an associated status response from the USB
+	#	bridge. 
+	#
+	# Parameters:
+	#	address: 32-bit hex value for register address
+	#	mask: 32-bit hex value for data mask
+	#	data: 32-bit value to be written to register
+	#	timeout: timeout in mS (default adaptive, see timeout_for())
+	#
+	# Return:
+	#	- returns tuple with (<pass/fail flag>, <error_code or data>)
+	#	Success: (0, <received response>)
+	#	Failure: (1, <error information>)
+	#
+	#------------------------------------------------------------
+	def write_InternalReg(self, address, mask, data, timeout=None):
+		if(self._tracing):
+			return self._trace_call("write_reg", address, _flag_status, self._write_InternalReg,
+									address, mask, data, timeout)
+		return self._write_InternalReg(address, mask, data, timeout)
+
+
+	def _write_InternalReg(self, address, mask, data, timeout=None):
+		self.log.write("DEBUG", "--> Enter write_InternalReg()")
+
+		with self._int0_lock:
+			self.EPOUT_ACTIVE = self._EP_INT0_OUT
+			self.EPIN_ACTIVE = self._EP_INT0_IN
+			# send single packet
+			self.EP_SIZE = 64
+			# create new buffers
+			self.ep_data_out = (ct.c_ubyte*(self.EP_SIZE))()
+			self.ep_data_in = (ct.c_ubyte*(self.EP_SIZE))()
+
+			# --------------------------------------
+			# Setup first write packet
+			# --------------------------------------	
+
+			# setup rd/wr command
+			self.ep_data_out[0] = 0x42 & 0xFF
+			# setup address data
+			self.ep_data_out[1] = address & 0xFF
+			self.ep_data_out[2] = (address >> 8) & 0xFF
+			self.ep_data_out[3] = (address >> 16) & 0xFF
+			self.ep_data_out[4] = (address >> 24) & 0xFF
+			# setup mask data
+			self.ep_data_out[5] = mask & 0xFF
+			self.ep_data_out[6] = (mask >> 8) & 0xFF
+			self.ep_data_out[7] = (mask >> 16) & 0xFF
+			self.ep_data_out[8] = (mask >> 24) & 0xFF
+			# setup data
+			self.ep_data_out[9] = data & 0xFF
+			self.ep_data_out[10] = (data >> 8) & 0xFF
+			self.ep_data_out[11] = (data >> 16) & 0xFF
+			self.ep_data_out[12] = (data >> 24) & 0xFF
+
+			self._claim(0)
+
+			# --------------------------------------
+			# Handle Transmit Case
+			# --------------------------------------
+			self.log.write("INFO", f"INT1 TX, EPIN_ACTIVE: {hex(self.EPIN_ACTIVE)}, len: {len(self.ep_data_in)}")
+
+			r = self._bulk_transfer(self.EPOUT_ACTIVE, self.ep_data_out, 
+									self.EP_SIZE, self.bulk_transferred, timeout)
+
+			self.log.write("INFO", f"Write xfer {self.bulk_transferred.contents} bytes!")
+
+			if (r < 0):
+				self.log.write("ERROR", f"Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
+				self.log.write("ERROR", f"Expected to xfer <{self.EPIN_ACTIVE}> bytes!")
+				self.log.write("ERROR", f"bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
+				return (1, r)
+			else:	
+				self.log.write("INFO", f"Sent {self.bulk_transferred.contents} bytes!")
+
+
+			# --------------------------------------
+			# Handle Receive Case
+			# --------------------------------------
+			self.log.write("INFO", f"INT1 RX, EPIN_ACTIVE: {hex(self.EPIN_ACTIVE)}, len: {len(self.ep_data_in)}")
+
+			# send test data
+			r = self._bulk_transfer(self.EPIN_ACTIVE, self.ep_data_in, 
+									self.EP_SIZE, self.bulk_transferred, timeout)	
+
+			if (r < 0):
+				self.log.write("ERROR", f"Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
+				self.log.write("ERROR", f"Expected to xfer <{self.EPIN_ACTIVE}> bytes!")
+				self.log.write("ERROR", f"bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
+				return (1, r)
+			else:	
+				self.log.write("INFO", f"Read xfer {self.bulk_transferred.contents} bytes!")
+
+			self.log.writeUSBPacket("INFO", self.ep_data_in)
+
+
+			self._release(0)
+
+			self.log.write("DEBUG", "<-- Exit write_InternalReg()")
+			return (0, list(self.ep_data_in))
+
+
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: read_InternalReg():
+	#
+	# Description:
+	#   Read internal register (INT0 interface) and return error
+	#	or register read result. 
+	#
+	# Parameters:
+	#	address: 32-bit hex value for register address
+	#	timeout: timeout in mS (default adaptive, see timeout_for())
+	#
+	# Return:
+	#	- returns tuple with (<pass/fail flag>, <error_code or data>)
+	#	Success: (0, (reg hex data, raw usb packet))
+	#	Failure: (1, <error information>)
+	#
+	#------------------------------------------------------------
+	def read_InternalReg(self, address, timeout=None):
+		if(self._tracing):
+			return self._trace_call("read_reg", address, _flag_status, self._read_InternalReg, address, timeout)
+		return self._read_InternalReg(address, timeout)
+
+
+	def _read_InternalReg(self, address, timeout=None):
+		self.log.write("DEBUG", "--> Enter read_InternalReg()")
+
+		with self._int0_lock:
+			self.EPOUT_ACTIVE = self._EP_INT0_OUT
+			self.EPIN_ACTIVE = self._EP_INT0_IN
+			# send single packet
+			self.EP_SIZE = 64
+			# create new buffers
+			self.ep_data_out = (ct.c_ubyte*(self.EP_SIZE))()
+			self.ep_data_in = (ct.c_ubyte*(self.EP_SIZE))()
+
+			# --------------------------------------
+			# Setup first write packet
+			# --------------------------------------	
+
+			# setup rd/wr command
+			self.ep_data_out[0] = 0x24 & 0xFF
+			# setup address data
+			self.ep_data_out[1] = address & 0xFF
+			self.ep_data_out[2] = (address >> 8) & 0xFF
+			self.ep_data_out[3] = (address >> 16) & 0xFF
+			self.ep_data_out[4] = (address >> 24) & 0xFF
+
+
+			self._claim(0)
+
+			# --------------------------------------
+			# Handle Transmit Case
+			# --------------------------------------
+			self.log.write("INFO", f"INT1 TX, EPIN_ACTIVE: {hex(self.EPIN_ACTIVE)}, len: {len(self.ep_data_in)}")
+
+			r = self._bulk_transfer(self.EPOUT_ACTIVE, self.ep_data_out, 
+									self.EP_SIZE, self.bulk_transferred, timeout)
+
+			self.log.write("INFO", f"Write xfer {self.bulk_transferred.contents} bytes!")
+
+			if (r < 0):
+				self.log.write("ERROR", f"Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
+				self.log.write("ERROR", f"Expected to xfer <{self.EPIN_ACTIVE}> bytes!")
+				self.log.write("ERROR", f"bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
+				return (1, r)
+			else:	
+				self.log.write("INFO", f"Sent {self.bulk_transferred.contents} bytes!")
+
+
+			# --------------------------------------
+			# Handle Receive Case
+			# --------------------------------------
+			self.log.write("INFO", f"INT1 RX, EPIN_ACTIVE: {hex(self.EPIN_ACTIVE)}, len: {len(self.ep_data_in)}")
+
+			# send test data
+			r = self._bulk_transfer(self.EPIN_ACTIVE, self.ep_data_in, 
+									self.EP_SIZE, self.bulk_transferred, timeout)	
+
+			if (r < 0):
+				self.log.write("ERROR", f"Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
+				self.log.write("ERROR", f"Expected to xfer <{self.EPIN_ACTIVE}> bytes!")
+				self.log.write("ERROR", f"bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
+				return (1, r)
+			else:	
+				self.log.write("INFO", f"Read xfer {self.bulk_transferred.contents} bytes!")
+
+			self.log.writeUSBPacket("INFO", self.ep_data_in)
+
+			# parse return value
+			hex_value = self.ep_data_in[2]
+			hex_value += (self.ep_data_in[3] << 8)
+			hex_value += (self.ep_data_in[4] << 16)
+			hex_value += (self.ep_data_in[5] << 24)
+
+
+			self._release(0)
+
+			self.log.write("DEBUG", "<-- Exit read_InternalReg()")
+			return (0, (f"0x{hex_value:08x}", list(self.ep_data_in)))
+
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: read_int1():
+	#
+	# Description:
+	#    read one USB packet (endpoint max packet size, 64 bytes
+	#	on full speed bridges) from interrupt interface 1.
+	#
+	# Parameters:
+	#	timeout: Amount of time in mS to wait for packet to be
+	#		received
+	#
+	# Return:
+	#	- returns tuple with (<pass/fail flag>, <error_code or data>)
+	#	Success: (0, <data received>)
+	#	Failure: (1, <error information>)
+	#
+	#------------------------------------------------------------
+	def read_int1(self, timeout=500):
+		self.log.write("DEBUG", "--> Enter read_int1()")
+
+		self.EPOUT_ACTIVE = self._EP_INT1_OUT
+		self.EPIN_ACTIVE = self._EP_INT1_IN
+		self.EP_SIZE = self.packet_size(self._EP_INT1_IN)
+		self.ep_data_out = (ct.c_ubyte*(self.EP_SIZE))()
+		self.ep_data_in = (ct.c_ubyte*(self.EP_SIZE))()
+
+		self._claim(1)
+
+
+		# --------------------------------------
+		# Handle Receive Case
+		# --------------------------------------
+		self.log.write("INFO", "-------- INT1 Report -----------")
+		self.log.write("INFO", f"EP1IN_SIZE: {self.EP_SIZE}, len: {len(self.ep_data_in)}")
+
+		# receive data
+		r = self._bulk_transfer(self.EPIN_ACTIVE, self.ep_data_in, 
+								self.EP_SIZE, self.bulk_transferred, timeout)	
+
+		if (r < 0):
+			self.log.write("ERROR", f"Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
+			self.log.write("ERROR", f"Endpoint <{hex(self.EPIN_ACTIVE)}> bytes!")
+			self.log.write("ERROR", f"bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
+			return (1, r)
+		else:
+			self.log.write("INFO", f"Read xfer {self.bulk_transferred.contents} bytes!")
+
+
+		self.log.writeUSBPacket("INFO", self.ep_data_in)
+
+		self._release(1)
+
+		self.log.write("DEBUG", "<-- Exit read_int1()")
+		return (0, list(self.ep_data_in))
+
+
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: write_int1():
+	#
+	# Description:
+	#    write USB packets to interrupt interface 1.
+	#
+	# Parameters:
+	#	data: data to be sent. Must be in blocks of the INT1 OUT
+	#		max packet size (64 bytes on full speed bridges).
+	#	timeout: Amount of time in mS to wait for packet to be
+	#		transmitted (default adaptive, see timeout_for())
+	#
+	# Return:
+	#	- returns tuple with (<pass/fail flag>, <error_code>)
+	#	Success: (0, <0 - no data>)
+	#	Failure: (1, <error information>)
+	#
+	#------------------------------------------------------------
+	def write_int1(self, data=False, timeout=None):
+		self.log.write("DEBUG", "--> Enter write_int1()")
+
+		self.EPOUT_ACTIVE = self._EP_INT1_OUT
+		self.EPIN_ACTIVE = self._EP_INT1_IN
+		self.EP_SIZE = self.packet_size(self._EP_INT1_OUT)
+		self.ep_data_out = (ct.c_ubyte*(self.EP_SIZE))()
+		self.ep_data_in = (ct.c_ubyte*(self.EP_SIZE))()
+		pkt = self.EP_SIZE
+
+		self._claim(1)
+
+
+		# --------------------------------------
+		# Handle Transmist Case
+		# --------------------------------------
+		self.log.write("INFO", "-------- INT1 Report -----------")
+
+		# make sure data is of type 'list'
+		if(isinstance(data, list)):
+			pass
+		else:
+			self.log.write("ERROR", "Data is not of type list")
+
+
+		# send data over int 1 when payload is passed into function
+		if(data != False):
+
+			# check to ensure data is in whole packets!
+			if(len(data) % pkt):
+				# error - data isn't in blocks of the packet size
+				self.log.write("ERROR", f"Data passed to function is not in {pkt} byte blocks!")
+				return (1, 100)
+
+			self.EP_SIZE = len(data)
+			data_s = (ct.c_ubyte*len(data))(*data)
+
+			self.log.write("INFO", f"EP1IN_SIZE: {self.EP_SIZE}, len: {len(data_s)}, timeout: {timeout}")
+
+			# send data
+			r = self._bulk_transfer(self.EPOUT_ACTIVE, data_s, 
+									self.EP_SIZE, self.bulk_transferred, timeout)	
+
+			if (r < 0):
+				self.log.write("ERROR", f"Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
+				self.log.write("ERROR", f"Endpoint <{hex(self.EPOUT_ACTIVE)}> bytes!")
+				self.log.write("ERROR", f"bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
+				return (1, r)
+			else:
+				self.log.write("INFO", f"Write xfer {self.bulk_transferred.contents} bytes!")
+
+
+		# send data over int 1 when payload isn't passed into function
+		else:
+			# error - no data was passed in to function 
+			return (1, 200)
+
+
+
+		
+		self._release(1)
+
+		self.log.write("DEBUG", "<-- Exit write_int1()")
+		return (0, 0)
+
+
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: send_bulk():
+	#
+	# Description:
+	#	Send a bulk data transfer. Data size must be in increments
+	#	of the bulk OUT max packet size (64 bytes on full speed
+	#	bridges, 512 on high speed variants).
+	#
+	# Parameters:
+	#	data: data payload to be transmitted over USB link via
+	#	BULK interface (interface 3).
+	#	timeout: timeout in mS (default adaptive, see timeout_for())
+	#
+	# Return:
+	#	- returns tuple with (<pass/fail flag>, <error_code or data>)
+	#	Success: (0, 0) {no data returned}
+	#	Failure: (1, <error information>)
+	#
+	#------------------------------------------------------------
+	def send_bulk(self, data=False, timeout=None, verbose=False, log=False):
+		self.log.write("DEBUG", "--> Enter send_bulk()")
+
+		self.EPOUT_ACTIVE = self._EP_BULK_OUT
+		self.EPIN_ACTIVE = self._EP_BULK_IN
+
+
+		self._claim(2)
+		
+		if(data != False):
+			# ensure data in whole bulk packets
+			pkt = self.packet_size(self.EPOUT_ACTIVE)
+			if(len(data) % pkt):
+				self.log.write("ERROR", f"Data passed to send_bulk() not {pkt} byte blocks, mod result <{len(data) % pkt}>!")
+				return (1, 1)
+
+			self.EP_SIZE = len(data)
+			data_s = (ct.c_ubyte*len(data))(*data)
+
+			# send bulk data
+			r = self._bulk_transfer(self.EPOUT_ACTIVE, data_s, 
+									self.EP_SIZE, self.bulk_transferred, timeout)
+			# error check
+			if (r < 0):
+				self.log.write("ERROR", f"ERROR: Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
+				self.log.write("ERROR", f"ERROR: Expected to xfer <{self.EP_SIZE}> bytes!")
+				self.log.write("ERROR", f"ERROR: bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
+				return (1, r)
+			else:	
+				self.log.write("INFO", f"transferred {self.bulk_transferred.contents} bytes!")
+
+			
+		else:
+			self.EP_SIZE = self.packet_size(self.EPOUT_ACTIVE)
+			if(len(self.ep_data_out) != self.EP_SIZE):
+				self.ep_data_out = (ct.c_ubyte*(self.EP_SIZE))()
+			# send bulk data
+			r = self._bulk_transfer(self.EPOUT_ACTIVE, self.ep_data_out, 
+									self.EP_SIZE, self.bulk_transferred, timeout)		
+
+			# error check
+			if (r < 0):
+				self.log.write("ERROR", f"ERROR: Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
+				self.log.write("ERROR", f"ERROR: Expected to xfer <{self.EP_SIZE}> bytes!")
+				self.log.write("ERROR", f"ERROR: bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
+				return (1, r)
+			else:	
+				self.log.write("INFO", f"transferred {self.bulk_transferred.contents} bytes!")
+
+		self._release(2)
+
+		self.log.write("DEBUG", "<-- Exit send_bulk()")
+		return (0, 0)
+
+
+
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: rec_bulk():
+	#
+	# Description:
+	#   Receive a bulk data transfer. Endpoint size must be in
+	#	blocks of the bulk IN max packet size (64 bytes on full
+	#	speed bridges, 512 on high speed variants).
+	#
+	# Parameters:
+	#	timeout: timeout for reception in mS (default
+	#		EP_TIMEOUT)
+	#	ep_size: endpoint size/data transfer size (default one
+	#		packet, must be in whole packets). Data is transferred
+	#		over interface 3.
+	#	
+	#
+	# Return:
+	#	- returns tuple with (<pass/fail flag>, <error_code or data>)
+	#	Success: (0, received data)
+	#	Failure: (1, error flag)
+	#
+	#------------------------------------------------------------
+	def rec_bulk(self, timeout=None, ep_size=None):
+		self.log.write("DEBUG", "--> Enter rec_bulk()")
+
+		self.EPOUT_ACTIVE = self._EP_BULK_OUT
+		self.EPIN_ACTIVE = self._EP_BULK_IN
+
+		# adjust endpoint size and buffer if needed
+		pkt = self.packet_size(self.EPIN_ACTIVE)
+		if(ep_size is None):
+			ep_size = pkt
+		elif(ep_size % pkt):
+			self.log.write("ERROR", f"ep_size <{ep_size}> not a multiple of the {pkt} byte bulk packet!")
+			return (1, 1)
+		self.EP_SIZE = ep_size
+		self.ep_data_in = (ct.c_ubyte*(self.EP_SIZE))()
+
+		self._claim(2)
+		
+
+		# read bulk data
+		r = self._bulk_transfer(self.EPIN_ACTIVE, self.ep_data_in, 
+									self.EP_SIZE, self.bulk_transferred, timeout)	
+		# error check
+		if (r < 0):
+			self.log.write("ERROR", f"ERROR: Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
+			self.log.write("ERROR", f"ERROR: Expected to xfer <{self.EP_SIZE}> bytes!")
+			self.log.write("ERROR", f"ERROR: bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
+			return (1, r)
+		else:
+			self.log.write("INFO", f"Received {self.bulk_transferred.contents} bytes!")	
+
+
+		self._release(2)
+
+		self.log.write("DEBUG", "<-- Exit rec_bulk()")
+
+		return (0, list(self.ep_data_in))
+
+
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: timeout_for():
+	#
+	# Description:
+	#   Current adaptive timeout in mS for a transfer of size
+	#	bytes on endpoint ep. One estimator is kept per endpoint
+	#	and power-of-two size class so 64 byte register packets
+	#	and multi-KB bulk transfers don't share an estimate.
+	#	Only OUT endpoints and the INT0 response adapt, receive
+	#	endpoints wait for data the far side sends whenever it
+	#	likes. Returns EP_TIMEOUT for those and when
+	#	ADAPTIVE_TIMEOUT is False.
+	#
+	#------------------------------------------------------------
+	def timeout_for(self, ep, size):
+		if(not self._adaptive(ep)):
+			return self.EP_TIMEOUT
+		return self._ep_timeout(ep, size).timeout()
+
+
+	def _adaptive(self, ep):
+		return self.ADAPTIVE_TIMEOUT and (not (ep & 0x80) or ep == self._EP_INT0_IN)
+
+
+	def _ep_timeout(self, ep, size):
+		key = (ep, size.bit_length())
+		est = self.ep_timeouts.get(key)
+		if(est is None):
+			est = AdaptiveTimeout(self.EP_TIMEOUT, self.EP_TIMEOUT_FLOOR, self.EP_TIMEOUT_CEILING)
+			self.ep_timeouts[key] = est
+		return est
+
+
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: _bulk_transfer():
+	#
+	# Description:
+	#   Every usb.bulk_transfer() call goes through here. Resolves
+	#	the timeout (timeout=None selects the adaptive value) and
+	#	feeds the measured latency back to the endpoint's
+	#	estimator. Explicit timeouts are per-call overrides, they
+	#	still contribute latency samples but a timeout under an
+	#	override doesn't back the estimate off.
+	#
+	#	Failed transfers are handed to _recover() when RECOVERY is
+	#	set, a transfer is retried once after a successful clear
+	#	halt or reopen.
+	#
+	# Return:
+	#	libusb return code
+	#
+	#------------------------------------------------------------
+	def _bulk_transfer(self, ep, buf, size, xfer_len, timeout=None):
+		r = self._transfer_once(ep, buf, size, xfer_len, timeout)
+
+		if(r < 0 and self.RECOVERY and self._recover(r, ep)):
+			r = self._transfer_once(ep, buf, size, xfer_len, timeout)
+
+		if(r >= 0):
+			if(self._ep_timeouts_run.get(ep)):
+				self._ep_timeouts_run[ep] = 0
+			# written registers are restored after a reopen
+			if(ep == self._EP_INT0_OUT and buf[0] == INT0_CMD_WRITE):
+				self._shadow_write(buf)
+
+		return r
+
+
+	def _transfer_once(self, ep, buf, size, xfer_len, timeout):
+		est = self._ep_timeout(ep, size) if self._adaptive(ep) else None
+
+		if(timeout is None):
+			tmo = est.timeout() if est is not None else self.EP_TIMEOUT
+		else:
+			tmo = timeout
+
+		t0 = time.perf_counter()
+		self._gate.enter()
+		try:
+			if(self._tracing):
+				ns0 = time.monotonic_ns()
+				for h in self._pre_hooks:
+					h(self, "transfer", ep, size, None, ns0)
+				r = usb.bulk_transfer(self.dev_handle, ep, buf, size, xfer_len, tmo)
+				ns1 = time.monotonic_ns()
+				for h in self._post_hooks:
+					h(self, "transfer", ep, size, None, r, ns0, ns1)
+			else:
+				r = usb.bulk_transfer(self.dev_handle, ep, buf, size, xfer_len, tmo)
+		finally:
+			self._gate.leave()
+
+		if(est is not None):
+			if(r >= 0):
+				est.sample((time.perf_counter() - t0) * 1000.0)
+			elif(r == LIBUSB_ERROR_TIMEOUT and timeout is None):
+				est.backoff()
+
+		return r
+
+
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: _xfer():
+	#
+	# Description:
+	#   Single usb.bulk_transfer() call used by the fast-path API.
+	#	No per-call logging or allocation, errors are logged and
+	#	raised as USB20F_Error.
+	#
+	# Parameters:
+	#	ep: endpoint address
+	#	buf: ctypes c_ubyte array
+	#	size: number of bytes to transfer
+	#	timeout: timeout in mS (None selects the adaptive timeout)
+	#
+	# Return:
+	#	number of bytes transferred
+	#
+	#------------------------------------------------------------
+	def _xfer(self, ep, buf, size, timeout):
+		xfer_len = self._xfer_len_p[ep]
+		r = self._bulk_transfer(ep, buf, size, xfer_len, timeout)
+		if (r < 0):
+			self.log.write("ERROR", f"bulk_transfer() ret code <{r}> <{usb.error_name(r)}> on endpoint <{ep:#04x}>, "
+									f"transferred <{xfer_len.contents.value}> of <{size}> bytes!")
+			raise _usb_error(r, ep, xfer_len.contents.value)
+		return xfer_len.contents.value
+
+
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: add_trace_hook():
+	#
+	# Description:
+	#   Register a tracing hook. hook.pre and/or hook.post are
+	#	called around every usb.bulk_transfer() call, every
+	#	async transfer and every register operation (legacy and
+	#	fast path):
+	#
+	#	pre(dev, op, ep, size, address, t_start)
+	#	post(dev, op, ep, size, address, status, t_start, t_end)
+	#
+	#	op: "transfer", "async", "read_reg" or "write_reg"
+	#	ep: endpoint address (INT0 OUT for register operations)
+	#	size: bytes requested
+	#	address: register address, None for transfers
+	#	status: libusb return code for transfers, bridge
+	#		response status (or libusb error code) for register
+	#		operations
+	#	t_start/t_end: time.monotonic_ns() timestamps
+	#
+	#	Hooks run on the calling thread inside the transfer path
+	#	and must be fast. See Trace_USB20F for implementations.
+	#
+	#------------------------------------------------------------
+	def add_trace_hook(self, hook):
+		if(hook not in self._trace_hooks):
+			self._set_trace_hooks(self._trace_hooks + (hook,))
+
+
+	def remove_trace_hook(self, hook):
+		self._set_trace_hooks(tuple(h for h in self._trace_hooks if h is not hook))
+
+
+	def _set_trace_hooks(self, hooks):
+		self._pre_hooks = tuple(h.pre for h in hooks if getattr(h, "pre", None) is not None)
+		self._post_hooks = tuple(h.post for h in hooks if getattr(h, "post", None) is not None)
+		self._trace_hooks = hooks
+		self._tracing = bool(hooks)
+
+
+	# run fn(*args) as traced register operation op
+	def _trace_call(self, op, address, status_of, fn, *args):
+		ep = self._EP_INT0_OUT
+		t0 = time.monotonic_ns()
+		for h in self._pre_hooks:
+			h(self, op, ep, 64, address, t0)
+		status = LIBUSB_ERROR_OTHER
+		try:
+			res = fn(*args)
+			status = status_of(res)
+			return res
+		except USB20F_Error as e:
+			status = e.code
+			raise
+		finally:
+			t1 = time.monotonic_ns()
+			for h in self._post_hooks:
+				h(self, op, ep, 64, address, status, t0, t1)
+
+
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: _claim() / _release():
+	#
+	# Description:
+	#   Claim / release an interface, claimed interfaces are
+	#	claimed again after a reset or reopen.
+	#
+	#------------------------------------------------------------
+	def _claim(self, n):
+		self._claimed.add(n)
+		return usb.claim_interface(self.dev_handle, n)
+
+
+	def _release(self, n):
+		self._claimed.discard(n)
+		return usb.release_interface(self.dev_handle, n)
+
+
+	# record a successful INT0 register write (value and mask)
+	def _shadow_write(self, buf):
+		cmd, address, mask, data = _INT0_CMD.unpack_from(buf, 0)
+		value, known = self._reg_shadow.get(address, (0, 0))
+		self._reg_shadow[address] = ((value & ~mask) | (data & mask), known | mask)
+
+
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: _recover():
+	#
+	# Description:
+	#   Recovery policy for a failed transfer on endpoint ep:
+	#	- LIBUSB_ERROR_PIPE: clear the endpoint halt
+	#	- LIBUSB_ERROR_TIMEOUT: after RECOVER_TIMEOUTS timeouts in
+	#		a row on an endpoint that must answer, reset the
+	#		bridge. IN endpoints that only deliver data when
+	#		there is some (INT1 IN, BULK IN) never count.
+	#	- LIBUSB_ERROR_NO_DEVICE: reopen the bridge by serial
+	#		number (reset falls back to this as well when the
+	#		bridge re-enumerates)
+	#	Every attempt is recorded as a RecoveryEvent in
+	#	self.recoveries and logged.
+	#
+	# Parameters:
+	#	code: libusb return code of the failed transfer
+	#	ep: endpoint address
+	#
+	# Return:
+	#	True when the transfer should be retried
+	#
+	#------------------------------------------------------------
+	def _recover(self, code, ep):
+		if(code == LIBUSB_ERROR_TIMEOUT):
+			if(ep in (self._EP_INT1_IN, self._EP_BULK_IN)):
+				return False
+			run = self._ep_timeouts_run.get(ep, 0) + 1
+			self._ep_timeouts_run[ep] = run
+			if(run < self.RECOVER_TIMEOUTS):
+				return False
+		elif(code not in (LIBUSB_ERROR_PIPE, LIBUSB_ERROR_NO_DEVICE)):
+			return False
+
+		gen = self._generation
+		if(code == LIBUSB_ERROR_PIPE):
+			with self._recover_lock:
+				# another thread reset or reopened the bridge meanwhile
+				if(gen != self._generation):
+					return True
+				t0 = time.perf_counter()
+				ok = usb.clear_halt(self.dev_handle, ep) >= 0
+				self._recovered("clear_halt", ep, code, ok, t0)
+			return ok
+
+		# reset/reopen replay register writes over INT0: keep other
+		# threads' INT0 commands (lock taken before _recover_lock, a
+		# failing INT0 command already holds it) and every transfer
+		# on the handle (gate) out of the middle of it
+		with self._int0_lock, self._recover_lock:
+			if(gen != self._generation):
+				return code != LIBUSB_ERROR_TIMEOUT
+
+			t0 = time.perf_counter()
+			action = "reset" if code == LIBUSB_ERROR_TIMEOUT else "reopen"
+			if(not self._gate.exclusive(self.RECOVER_REOPEN_WAIT)):
+				self.log.write("ERROR", f"{action}: transfers still running on the handle, not touching it")
+				ok = False
+			else:
+				try:
+					if(action == "reset"):
+						self._ep_timeouts_run.clear()
+						r = usb.reset_device(self.dev_handle)
+						if(r in (LIBUSB_ERROR_NOT_FOUND, LIBUSB_ERROR_NO_DEVICE)):
+							action = "reopen"
+							ok = self._reopen()
+						else:
+							self._generation += 1
+							ok = r >= 0 and self._restore_state()
+					else:
+						ok = self._reopen()
+				finally:
+					self._gate.release()
+
+			self._recovered(action, ep, code, ok, t0)
+
+		# a reopened bridge lost the INT0 command the response
+		# belonged to, don't wait for it again
+		return ok and action != "reset" and not (action == "reopen" and ep == self._EP_INT0_IN)
+
+
+	def _recovered(self, action, ep, code, ok, t0):
+		ev = RecoveryEvent(time.time(), action, ep, code, ok, time.perf_counter() - t0)
+		self.recoveries.append(ev)
+		self.log.write("WARNING" if ok else "ERROR", f"recovery: {ev}")
+
+
+	#------------------------------------------------------------
+	# Name: _reopen():
+	#
+	# Description:
+	#   Close the lost handle and reopen the bridge with the same
+	#	serial number, retrying until RECOVER_REOPEN_WAIT seconds
+	#	passed. Called by _recover() with the gate held
+	#	exclusively, so no transfer runs on the handle.
+	#
+	#------------------------------------------------------------
+	def _reopen(self):
+		sn = self.sn_string_d.rstrip("\x00")
+		usb.close(self.dev_handle)
+		deadline = time.monotonic() + self.RECOVER_REOPEN_WAIT
+		while not self._open_serial(sn):
+			if(time.monotonic() >= deadline):
+				return False
+			time.sleep(0.05)
+		self._generation += 1
+		return self._restore_state()
+
+
+	#------------------------------------------------------------
+	# Name: _open_serial():
+	#
+	# Description:
+	#   Lightweight reopen: find the VID/PID match with serial
+	#	number sn and open it into self.dev_handle. No descriptor
+	#	logging, the device list is freed again. Packet sizes and
+	#	string descriptors are kept from the first open.
+	#
+	# Return:
+	#	True when the bridge was opened
+	#
+	#------------------------------------------------------------
+	def _open_serial(self, sn):
+		devs = ct.POINTER(ct.POINTER(usb.device))()
+		if(usb.get_device_list(None, ct.byref(devs)) < 0):
+			return False
+
+		try:
+			i = 0
+			while devs[i]:
+				dev = devs[i]
+				i += 1
+				desc = usb.device_descriptor()
+				if(usb.get_device_descriptor(dev, ct.byref(desc)) < 0):
+					continue
+				if(desc.idVendor != self.vid) or (desc.idProduct != self.pid):
+					continue
+				if(usb.open(dev, self.dev_handle) < 0):
+					continue
+				if(_handle_serial(self.dev_handle, desc) != sn):
+					usb.close(self.dev_handle)
+					continue
+
+				# the open handle keeps its own reference to dev
+				self.dev = dev
+				self.desc = desc
+				self.bus, self.port_path = _location(dev)
+				return True
+		finally:
+			usb.free_device_list(devs, 1)
+
+		return False
+
+
+	#------------------------------------------------------------
+	# Name: _restore_state():
+	#
+	# Description:
+	#   Claim the interfaces that were claimed before the fault
+	#	and write back every register written since open_usb()
+	#	(volatile status/counter registers excluded), in the
+	#	order they were first written. Runs from _recover() with
+	#	_int0_lock and the gate held, on its own buffers.
+	#
+	#------------------------------------------------------------
+	def _restore_state(self):
+		for n in sorted(self._claimed):
+			if(usb.claim_interface(self.dev_handle, n) < 0):
+				return False
+
+		volatile = {getattr(self, f"{n}_ADDR") for n in VOLATILE_REGS}
+		out = (ct.c_ubyte*64)()
+		rsp = (ct.c_ubyte*64)()
+		xfer_len = ct.pointer(ct.c_int(0))
+		for (address, (value, mask)) in list(self._reg_shadow.items()):
+			if(address in volatile):
+				continue
+			_INT0_CMD.pack_into(out, 0, INT0_CMD_WRITE, address, mask, value)
+			r = self._transfer_once(self._EP_INT0_OUT, out, 64, xfer_len, None)
+			if(r >= 0):
+				r = self._transfer_once(self._EP_INT0_IN, rsp, 64, xfer_len, None)
+			if(r < 0):
+				self.log.write("ERROR", f"register restore failed at {address:#010x}: <{r}> <{usb.error_name(r)}>")
+				return False
+		return True
+
+
+	#------------------------------------------------------------
+	# Name: recovery_stats():
+	#
+	# Description:
+	#   Recovery metrics per action.
+	#
+	# Return:
+	#	{action: {"count", "ok", "failed", "avg_ms", "max_ms"}}
+	#
+	#------------------------------------------------------------
+	def recovery_stats(self):
+		out = {}
+		for ev in list(self.recoveries):
+			st = out.setdefault(ev.action, {"count": 0, "ok": 0, "failed": 0, "avg_ms": 0.0, "max_ms": 0.0})
+			st["count"] += 1
+			st["ok" if ev.ok else "failed"] += 1
+			st["avg_ms"] += ev.elapsed * 1000.0
+			st["max_ms"] = max(st["max_ms"], ev.elapsed * 1000.0)
+		for st in out.values():
+			st["avg_ms"] /= st["count"]
+		return out
+
+
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: _int0_cmd():
+	#
+	# Description:
+	#   Send one INT0 command packet and read back the bridge
+	#	response into self._int0_in.
+	#
+	# Return:
+	#	(status, value) parsed from the response packet
+	#
+	#------------------------------------------------------------
+	def _int0_cmd(self, cmd, address, mask=0, data=0, timeout=None):
+		if(self._tracing):
+			return self._trace_call("write_reg" if cmd == INT0_CMD_WRITE else "read_reg", address, _rsp_status,
+									self._int0_cmd_raw, cmd, address, mask, data, timeout)
+		return self._int0_cmd_raw(cmd, address, mask, data, timeout)
+
+
+	# _int0_cmd() returning the value, raises on a nonzero status
+	def _int0_check(self, cmd, address, mask=0, data=0, timeout=None):
+		status, value = self._int0_cmd(cmd, address, mask, data, timeout)
+		if(status):
+			self.log.write("ERROR", f"INT0 command <{cmd:#04x}> on <{address:#010x}> returned status <{status:#06x}>")
+			raise USB20F_StatusError(status, address)
+		return value
+
+
+	def _int0_cmd_raw(self, cmd, address, mask, data, timeout):
+		with self._int0_lock:
+			_INT0_CMD.pack_into(self._int0_out, 0, cmd, address & 0xFFFFFFFF,
+								mask & 0xFFFFFFFF, data & 0xFFFFFFFF)
+
+			self._claim(0)
+			self._xfer(self._EP_INT0_OUT, self._int0_out, 64, timeout)
+			self._xfer(self._EP_INT0_IN, self._int0_in, 64, timeout)
+
+			return _INT0_RSP.unpack_from(self._int0_in, 0)
+
+
+
+
+
+
+	# open transaction of the calling thread
+	@property
+	def _txn(self):
+		return getattr(self._txn_local, "txn", None)
+
+
+	@_txn.setter
+	def _txn(self, txn):
+		self._txn_local.txn = txn
 
-			if self.r < 0:
-				self.log.write("ERROR", f'failed to get device descriptor: {self.r}')
-				return (1, 3)
 
-			self.log.write("INFO", "{:04x}:{:04x} (bus {:d}, device {:d})".format(
-				  self.desc.idVendor, self.desc.idProduct, 
-				  usb.get_bus_number(self.dev), usb.get_device_address(self.dev)))
+	# flush pending transaction writes of the calling thread
+	def _txn_flush(self):
+		txn = self._txn
+		if(txn is not None):
+			txn.flush()
 
 
-			if(self.desc.idVendor == self.vid) and (self.desc.idProduct == self.pid):
-				self.log.write("INFO", '\n')
-				self.log.write("INFO", '/* Descriptor Inforamtion */')
-				self.log.write("INFO", f"{'bLength: ':.<30}{f'{self.desc.bLength:#02x}':.>20}")
-				self.log.write("INFO", f"{'bDescriptorType: ':.<30}{f'{self.desc.bDescriptorType:#02x}':.>20}")
-				self.log.write("INFO", f"{'bcdUSB: ':.<30}{f'{self.desc.bcdUSB:#04x}':.>20}")
-				self.log.write("INFO", f"{'bDeviceClass: ':.<30}{f'{self.desc.bDeviceClass:#02x}':.>20}")
-				self.log.write("INFO", f"{'bDeviceSubClass: ':.<30}{f'{self.desc.bDeviceSubClass:#02x}':.>20}")
-				self.log.write("INFO", f"{'bDeviceProtocol: ':.<30}{f'{self.desc.bDeviceProtocol:#02x}':.>20}")
-				self.log.write("INFO", f"{'bMaxPacketSize0: ':.<30}{f'{self.desc.bMaxPacketSize0:#02x}':.>20}")
-				self.log.write("INFO", f"{'idVendor: ':.<30}{f'{self.desc.idVendor:#02x}':.>20}")
-				self.log.write("INFO", f"{'idProduct: ':.<30}{f'{self.desc.idProduct:#02x}':.>20}")
-				self.log.write("INFO", f"{'bcdDevice: ':.<30}{f'{self.desc.bcdDevice:#02x}':.>20}")
-				self.log.write("INFO", f"{'iManufacturer: ':.<30}{f'{self.desc.iManufacturer:#02x}':.>20}")
-				self.log.write("INFO", f"{'iProduct: ':.<30}{f'{self.desc.iProduct:#02x}':.>20}")
-				self.log.write("INFO", f"{'iSerialNumber: ':.<30}{f'{self.desc.iSerialNumber:#02x}':.>20}")
-				self.log.write("INFO", f"{'bNumConfigurations: ':.<30}{f'{self.desc.bNumConfigurations:#02x}':.>20}")				
-				self.dev_found  = True		
-				break
 
-			i += 1
 
 
-		#
-		# open device if matching vid/pid was found
-		#
-		if(self.dev_found  == True):
-			self.r = usb.open(self.dev, self.dev_handle)
-			if self.r < 0:
-				self.log.write("ERROR", f"ret val: {self.r} - {usb.strerror(self.r)}")
-				self.log.write("ERROR", "failed to open device!")
-				return (1, 4)
 
+	#------------------------------------------------------------
+	#
+	# Name: read_reg():
+	#
+	# Description:
+	#   Fast-path register read over INT0. Same transaction as
+	#	read_InternalReg() without the hex string, list copy and
+	#	per-packet logging.
+	#
+	# Parameters:
+	#	address: 32-bit register address
+	#	timeout: timeout in mS (default adaptive, see timeout_for())
+	#
+	# Return:
+	#	register value (int)
+	#	Raises USB20F_Error on libusb failure, USB20F_StatusError
+	#	when the bridge rejects the command
+	#
+	#------------------------------------------------------------
+	def read_reg(self, address, timeout=None):
+		self._txn_flush()
+		return self._int0_check(INT0_CMD_READ, address, timeout=timeout)
 
-			# DEBUG: Get ep size info and configuration
-			self.r = usb.get_string_descriptor(self.dev_handle, self.desc.iSerialNumber, 0x409, self.sn_string, 18)
-			self.r = usb.get_string_descriptor(self.dev_handle, self.desc.iProduct, 0x409, self.pd_string, 30)
-			self.r = usb.get_string_descriptor(self.dev_handle, self.desc.iManufacturer, 0x409, self.mf_string, 26)
-			
-			self.sn_string_d = bytes(self.sn_string)[2:].decode("utf-16") # type - string
-			self.pd_string_d = bytes(self.pd_string)[2:].decode("utf-16") # type - string
-			self.mf_string_d = bytes(self.mf_string)[2:].decode("utf-16") # type - string		
 
-			# utf-16 decoding
-			# skip first two bytes b/c they are USB protocol stuff not SN
-			# - don't really need the below for loop for manual decoding anymore
-			self.log.write("INFO", '\n')
-			self.log.write("INFO", "/* String descriptor info */")
-			self.log.write("INFO", f"{'Manufacturer Description: ':.<30}{self.mf_string_d:.>20}")		
-			self.log.write("INFO", f"{'Product Description: ':.<30}{self.pd_string_d:.>20}")
-			self.log.write("INFO", f"{'Serial Number: ':.<30}{self.sn_string_d:.>20}")
 
-			if self.r < 0:
-				self.log.write("ERROR", f"ret val: {self.r} - {usb.strerror(self.r)}")
-				self.log.write("ERROR", "failed to open device", file=sys.stdout)
-				return (1, 5)
 
-			# get device info for debugging
-			self.log.write("INFO", '\n')
-			self.log.write("INFO", "/* Endpoint Sizes */")
-			self.ep_size = usb.get_max_packet_size(self.dev, 0x01)
-			self.log.write("INFO", f"ep_out_size: {self.ep_size}")
-			self.ep_size = usb.get_max_packet_size(self.dev, 0x81)
-			self.log.write("INFO", f"ep_in_size: {self.ep_size}")
-			self.r = usb.get_configuration(self.dev_handle, self.device_configuration)
-			self.log.write("INFO", f"r: {self.r}, configuration: {self.device_configuration.contents}")
 
-			# success - return usb device handle
-			return (0, self.dev_handle)
 
-		# ERROR: Failed to find vid/pid
+	#------------------------------------------------------------
+	#
+	# Name: read_reg_packet():
+	#
+	# Description:
+	#   Register read returning a RegPacket with the response
+	#	status and, on request, the raw 64 byte response.
+	#
+	# Parameters:
+	#	address: 32-bit register address
+	#	raw: None - no raw data
+	#		"bytes" - bytes copy of the response packet
+	#		"view" - memoryview onto the reusable receive buffer
+	#			(only valid until the next INT0 access)
+	#	timeout: timeout in mS (default adaptive, see timeout_for())
+	#
+	# Return:
+	#	RegPacket
+	#	Raises USB20F_Error on libusb failure
+	#
+	#------------------------------------------------------------
+	def read_reg_packet(self, address, raw=None, timeout=None):
+		self._txn_flush()
+		status, value = self._int0_cmd(INT0_CMD_READ, address, timeout=timeout)
+
+		if(raw is None):
+			data = None
+		elif(raw == "bytes"):
+			data = bytes(self._int0_in)
+		elif(raw == "view"):
+			data = memoryview(self._int0_in).cast("B")
 		else:
-			self.log.write("ERROR", f'ERROR: failed to find vid: {self.vid}, pid: {self.vid}')
-			return (1, 6)
+			raise ValueError(f"raw must be None, 'bytes' or 'view', got <{raw}>")
+
+		return RegPacket(address, value, status, data)
 
-		self.log.write("DEBUG", "<-- Exit open_usb()")
 
 
 
 
 
 	#------------------------------------------------------------
-	# Name: dump_descriptors():
+	#
+	# Name: write_reg():
 	#
 	# Description:
-	#   This method prints all USB descriptor information for the 
-	#	bridge USB interface.
+	#   Fast-path masked register write over INT0. Only the bits
+	#	set in mask are modified.
 	#
 	# Parameters:
-	#	<TBD>
+	#	address: 32-bit register address
+	#	data: 32-bit value to be written
+	#	mask: 32-bit data mask (default all bits)
+	#	timeout: timeout in mS (default adaptive, see timeout_for())
 	#
 	# Return:
-	#	- returns tuple with (<pass/fail flag>, <error_code or data>)
-	#	Success: (0, 0)
-	#	Failure: (1, <error code>)
+	#	None
+	#	Raises USB20F_Error on libusb failure, USB20F_StatusError
+	#	when the bridge rejects the command
 	#
 	#------------------------------------------------------------
-	def dump_descriptors(self, vid=0x1cbf, pid=0x0007):
-		self.log.write("DEBUG", "--> Enter open_usb()")
-		#
-		# callback vars
-		#
-		#self.dev = None
-		#self.sn_string = (ct.c_ubyte* 18)()	# sn string
-		#self.pd_string = (ct.c_ubyte* 30)()	# product string
-		#self.mf_string = (ct.c_ubyte* 26)()	# manf string
-		#self.device_configuration = ct.POINTER(ct.c_int)()	
-		#self.dev_handle = ct.POINTER(usb.device_handle)() # creates device handle (not device obj)
-		#self.desc = None
-		#self.r = None
-		#self.vid = vid
-		#self.pid = pid
+	def write_reg(self, address, data, mask=0xFFFFFFFF, timeout=None):
+		txn = self._txn
+		if(txn is not None):
+			txn.write(address, data, mask)
+			return
 
+		self._int0_check(INT0_CMD_WRITE, address, mask, data, timeout)
 
-		#
-		# inits
-		#
-		#self.device_configuration.contents = ct.c_int(0)
 
-		# open usb device
-		#self.r = usb.init(None)
-		#if self.r < 0:
-		#	self.log.write("ERROR", f'usb init failure: {self.r}')
-		#	return (1, 1)
 
-		#self.devs = ct.POINTER(ct.POINTER(usb.device))() # creates device structure
-		#cnt = usb.get_device_list(None, ct.byref(self.devs))
 
-		#if cnt < 0:
-		#	self.log.write("ERROR", f'get device list failure: {cnt}')
-		#	return (1, 2)
 
-		#self.log.write("INFO", '\n')
-		#self.log.write("INFO", "/* Getting USB device list */")
 
-		self.desc = usb.device_descriptor()
-		self.r = usb.get_device_descriptor(self.dev, ct.byref(self.desc))
+	#------------------------------------------------------------
+	#
+	# Name: write_regs():
+	#
+	# Description:
+	#   Batched masked register writes, sent back to back over
+	#	INT0 while holding the INT0 lock, optionally followed by
+	#	one batched read back to verify the written bits.
+	#
+	# Parameters:
+	#	writes: iterable of (address, data, mask)
+	#	verify: read back and compare (data & mask)
+	#	timeout: per transfer timeout in mS (default adaptive)
+	#
+	# Return:
+	#	None
+	#	Raises USB20F_Error on libusb failure, USB20F_StatusError
+	#	when the bridge rejects a command, USB20F_VerifyError on a
+	#	read back mismatch
+	#
+	#------------------------------------------------------------
+	def write_regs(self, writes, verify=False, timeout=None, _direct=False):
+		writes = list(writes)
 
-		if self.r < 0:
-			self.log.write("ERROR", f'failed to get device descriptor: {self.r}')
-			return (1, 3)
+		txn = self._txn
+		if(not _direct and txn is not None):
+			for (a, d, m) in writes:
+				txn.write(a, d, m)
+			return
 
-		self.log.write("INFO", "{:04x}:{:04x} (bus {:d}, device {:d})".format(
-			  self.desc.idVendor, self.desc.idProduct, 
-			  usb.get_bus_number(self.dev), usb.get_device_address(self.dev)))
+		cmd = self._int0_check
+		with self._int0_lock:
+			for (a, d, m) in writes:
+				cmd(INT0_CMD_WRITE, a, m, d, timeout)
 
+			if(verify):
+				values = self.read_regs([a for (a, d, m) in writes], timeout)
 
-		if(self.desc.idVendor == self.vid) and (self.desc.idProduct == self.pid):
-			print('\n')
-			print('/* Descriptor Inforamtion */')
-			print(f"{'bLength: ':.<30}{f'{self.desc.bLength:#02x}':.>20}")
-			print(f"{'bDescriptorType: ':.<30}{f'{self.desc.bDescriptorType:#02x}':.>20}")
-			print(f"{'bcdUSB: ':.<30}{f'{self.desc.bcdUSB:#04x}':.>20}")
-			print(f"{'bDeviceClass: ':.<30}{f'{self.desc.bDeviceClass:#02x}':.>20}")
-			print(f"{'bDeviceSubClass: ':.<30}{f'{self.desc.bDeviceSubClass:#02x}':.>20}")
-			print(f"{'bDeviceProtocol: ':.<30}{f'{self.desc.bDeviceProtocol:#02x}':.>20}")
-			print(f"{'bMaxPacketSize0: ':.<30}{f'{self.desc.bMaxPacketSize0:#02x}':.>20}")
-			print(f"{'idVendor: ':.<30}{f'{self.desc.idVendor:#02x}':.>20}")
-			print(f"{'idProduct: ':.<30}{f'{self.desc.idProduct:#02x}':.>20}")
-			print(f"{'bcdDevice: ':.<30}{f'{self.desc.bcdDevice:#02x}':.>20}")
-			print(f"{'iManufacturer: ':.<30}{f'{self.desc.iManufacturer:#02x}':.>20}")
-			print(f"{'iProduct: ':.<30}{f'{self.desc.iProduct:#02x}':.>20}")
-			print(f"{'iSerialNumber: ':.<30}{f'{self.desc.iSerialNumber:#02x}':.>20}")
-			print(f"{'bNumConfigurations: ':.<30}{f'{self.desc.bNumConfigurations:#02x}':.>20}")				
-			#self.log.write("INFO", '\n')
-			#self.log.write("INFO", '/* Descriptor Inforamtion */')
-			#self.log.write("INFO", f"{'bLength: ':.<30}{f'{self.desc.bLength:#02x}':.>20}")
-			#self.log.write("INFO", f"{'bDescriptorType: ':.<30}{f'{self.desc.bDescriptorType:#02x}':.>20}")
-			#self.log.write("INFO", f"{'bcdUSB: ':.<30}{f'{self.desc.bcdUSB:#04x}':.>20}")
-			#self.log.write("INFO", f"{'bDeviceClass: ':.<30}{f'{self.desc.bDeviceClass:#02x}':.>20}")
-			#self.log.write("INFO", f"{'bDeviceSubClass: ':.<30}{f'{self.desc.bDeviceSubClass:#02x}':.>20}")
-			#self.log.write("INFO", f"{'bDeviceProtocol: ':.<30}{f'{self.desc.bDeviceProtocol:#02x}':.>20}")
-			#self.log.write("INFO", f"{'bMaxPacketSize0: ':.<30}{f'{self.desc.bMaxPacketSize0:#02x}':.>20}")
-			#self.log.write("INFO", f"{'idVendor: ':.<30}{f'{self.desc.idVendor:#02x}':.>20}")
-			#self.log.write("INFO", f"{'idProduct: ':.<30}{f'{self.desc.idProduct:#02x}':.>20}")
-			#self.log.write("INFO", f"{'bcdDevice: ':.<30}{f'{self.desc.bcdDevice:#02x}':.>20}")
-			#self.log.write("INFO", f"{'iManufacturer: ':.<30}{f'{self.desc.iManufacturer:#02x}':.>20}")
-			#self.log.write("INFO", f"{'iProduct: ':.<30}{f'{self.desc.iProduct:#02x}':.>20}")
-			#self.log.write("INFO", f"{'iSerialNumber: ':.<30}{f'{self.desc.iSerialNumber:#02x}':.>20}")
-			#self.log.write("INFO", f"{'bNumConfigurations: ':.<30}{f'{self.desc.bNumConfigurations:#02x}':.>20}")
-			return (0, 0)
-		else:
-			print(f'ERROR: Cannot find VID or PID expected, VID={vid}, PID={pid}, found VID={self.desc.idVendor}, PID={self.desc.idProduct}')
-			return (1, 1)
+		if(verify):
+			bad = [(a, m, d & m, v) for ((a, d, m), v) in zip(writes, values) if (v & m) != (d & m)]
+			if(bad):
+				self.log.write("ERROR", f"write_regs() verify failed on {len(bad)} register(s)")
+				raise USB20F_VerifyError(bad)
 
 
 
@@ -421,105 +2602,123 @@ class USB20F_Device(object):
 
 	#------------------------------------------------------------
 	#
-	# Name: write_InternalReg():
+	# Name: transaction():
 	#
 	# Description:
-	#   Setup and execute a register write to the usb bridge
-	#	using the INT0 command/control interface. This function 
-	#	will auto read the response received from the bridge
-	#	when a register access operation is performed. Each
-	#	access has an associated status response from the USB
-	#	bridge. 
+	#   Open a write coalescing transaction, see RegTransaction.
+	#
+	#	with dev.transaction(verify=True):
+	#		dev.write_reg(dev.CR1_ADDR, 0x1, mask=0x1)
+	#		dev.write_reg(dev.CR1_ADDR, 0x4, mask=0xC)
+	#		dev.write_reg(dev.CR2_ADDR, 0x10, mask=0x10)
+	#	# -> one CR1 write (mask 0xD), one CR2 write, read back
 	#
 	# Parameters:
-	#	address: 32-bit hex value for register address
-	#	mask: 32-bit hex value for data mask
-	#	data: 32-bit value to be written to register
+	#	verify: read back and check written bits on exit
 	#
 	# Return:
-	#	- returns tuple with (<pass/fail flag>, <error_code or data>)
-	#	Success: (0, <received response>)
-	#	Failure: (1, <error information>)
+	#	RegTransaction
 	#
 	#------------------------------------------------------------
-	def write_InternalReg(self, address, mask, data):
-		self.log.write("DEBUG", "--> Enter write_InternalReg()")
+	def transaction(self, verify=False):
+		return RegTransaction(self, verify)
 
-		self.EPOUT_ACTIVE = self._EP_INT0_OUT
-		self.EPIN_ACTIVE = self._EP_INT0_IN
-		# send single packet
-		self.EP_SIZE = 64
-		# create new buffers
-		self.ep_data_out = (ct.c_ubyte*(self.EP_SIZE))()
-		self.ep_data_in = (ct.c_ubyte*(self.EP_SIZE))()
 
-		# --------------------------------------
-		# Setup first write packet
-		# --------------------------------------	
-
-		# setup rd/wr command
-		self.ep_data_out[0] = 0x42 & 0xFF
-		# setup address data
-		self.ep_data_out[1] = address & 0xFF
-		self.ep_data_out[2] = (address >> 8) & 0xFF
-		self.ep_data_out[3] = (address >> 16) & 0xFF
-		self.ep_data_out[4] = (address >> 24) & 0xFF
-		# setup mask data
-		self.ep_data_out[5] = mask & 0xFF
-		self.ep_data_out[6] = (mask >> 8) & 0xFF
-		self.ep_data_out[7] = (mask >> 16) & 0xFF
-		self.ep_data_out[8] = (mask >> 24) & 0xFF
-		# setup data
-		self.ep_data_out[9] = data & 0xFF
-		self.ep_data_out[10] = (data >> 8) & 0xFF
-		self.ep_data_out[11] = (data >> 16) & 0xFF
-		self.ep_data_out[12] = (data >> 24) & 0xFF
-
-		usb.claim_interface(self.dev_handle, 0)
 
-		# --------------------------------------
-		# Handle Transmit Case
-		# --------------------------------------
-		self.log.write("INFO", f"INT1 TX, EPIN_ACTIVE: {hex(self.EPIN_ACTIVE)}, len: {len(self.ep_data_in)}")
 
-		r = usb.bulk_transfer(self.dev_handle, self.EPOUT_ACTIVE, self.ep_data_out, 
-								self.EP_SIZE, self.bulk_transferred, self.EP_TIMEOUT)
 
-		self.log.write("INFO", f"Write xfer {self.bulk_transferred.contents} bytes!")
 
-		if (r < 0):
-			self.log.write("ERROR", f"Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
-			self.log.write("ERROR", f"Expected to xfer <{self.EPIN_ACTIVE}> bytes!")
-			self.log.write("ERROR", f"bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
-			return (1, r)
-		else:	
-			self.log.write("INFO", f"Sent {self.bulk_transferred.contents} bytes!")
+	#------------------------------------------------------------
+	#
+	# Name: read_regs():
+	#
+	# Description:
+	#   Batched register read. All addresses are read back to
+	#	back over INT0 with no logging in between, holding the
+	#	INT0 lock so other threads can't interleave.
+	#
+	# Parameters:
+	#	addresses: iterable of 32-bit register addresses
+	#	timeout: per transfer timeout in mS (default adaptive, see timeout_for())
+	#
+	# Return:
+	#	list of register values, same order as addresses
+	#	Raises USB20F_Error on libusb failure, USB20F_StatusError
+	#	when the bridge rejects the command
+	#
+	#------------------------------------------------------------
+	def read_regs(self, addresses, timeout=None):
+		self._txn_flush()
+		cmd = self._int0_check
+		with self._int0_lock:
+			return [cmd(INT0_CMD_READ, a, timeout=timeout) for a in addresses]
 
 
-		# --------------------------------------
-		# Handle Receive Case
-		# --------------------------------------
-		self.log.write("INFO", f"INT1 RX, EPIN_ACTIVE: {hex(self.EPIN_ACTIVE)}, len: {len(self.ep_data_in)}")
 
-		# send test data
-		r = usb.bulk_transfer(self.dev_handle, self.EPIN_ACTIVE, self.ep_data_in, 
-								self.EP_SIZE, self.bulk_transferred, self.EP_TIMEOUT)	
 
-		if (r < 0):
-			self.log.write("ERROR", f"Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
-			self.log.write("ERROR", f"Expected to xfer <{self.EPIN_ACTIVE}> bytes!")
-			self.log.write("ERROR", f"bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
-			return (1, r)
-		else:	
-			self.log.write("INFO", f"Read xfer {self.bulk_transferred.contents} bytes!")
 
-		self.log.writeUSBPacket("INFO", self.ep_data_in)
 
 
-		usb.release_interface(self.dev_handle, 0)
+	#------------------------------------------------------------
+	#
+	# Name: snapshot():
+	#
+	# Description:
+	#   Capture the register space with one batched read_regs()
+	#	call.
+	#
+	#	With base, only names (default VOLATILE_REGS) are read
+	#	again and every other register is copied from base, an
+	#	incremental capture of the registers the bridge changes.
+	#
+	# Parameters:
+	#	names: registers to capture (default REG_NAMES)
+	#	base: earlier RegSnapshot to update incrementally
+	#
+	# Return:
+	#	RegSnapshot
+	#	Raises USB20F_Error on libusb failure
+	#
+	#------------------------------------------------------------
+	def snapshot(self, names=None, base=None, timeout=None):
+		if(base is None):
+			names = tuple(names) if names is not None else REG_NAMES
+			addrs = tuple(getattr(self, f"{n}_ADDR") for n in names)
+			values = array("I", self.read_regs(addrs, timeout))
+			return RegSnapshot(names, addrs, values, time.time())
+
+		names = VOLATILE_REGS if names is None else frozenset(names)
+		idx = [i for (i, n) in enumerate(base.names) if n in names]
+		values = array("I", base.values)
+		for (i, v) in zip(idx, self.read_regs([base.addresses[i] for i in idx], timeout)):
+			values[i] = v
+		return RegSnapshot(base.names, base.addresses, values, time.time())
+
 
-		self.log.write("DEBUG", "<-- Exit write_InternalReg()")
-		return (0, list(self.ep_data_in))
+
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: wait_for():
+	#
+	# Description:
+	#   Poll a register until (value & mask) == expected or the
+	#	deadline passes. See wait_for_all().
+	#
+	# Parameters:
+	#	address: 32-bit register address
+	#	mask: bits to compare
+	#	value: expected value of the masked bits
+	#	timeout: hard deadline in mS
+	#
+	# Return:
+	#	WaitResult
+	#
+	#------------------------------------------------------------
+	def wait_for(self, address, mask, value, timeout=1000, **kwargs):
+		return self.wait_for_all(((address, mask, value),), timeout, **kwargs)
 
 
 
@@ -528,96 +2727,127 @@ class USB20F_Device(object):
 
 	#------------------------------------------------------------
 	#
-	# Name: read_InternalReg():
+	# Name: wait_for_all():
 	#
 	# Description:
-	#   Read internal register (INT0 interface) and return error
-	#	or register read result. 
+	#   Poll until every (address, mask, value) condition holds.
+	#	Each poll reads every distinct address once (batched),
+	#	conditions on the same register share the read. The first
+	#	spin polls are issued back to back, after that the delay
+	#	between polls doubles from min_delay up to max_delay.
+	#	Sleeps never run past the deadline and no poll starts
+	#	after it.
 	#
 	# Parameters:
-	#	address: 32-bit hex value for register address
+	#	conditions: iterable of (address, mask, value)
+	#	timeout: hard deadline in mS
+	#	spin: number of polls without delay
+	#	min_delay: first backoff delay in mS
+	#	max_delay: backoff delay cap in mS
+	#	raise_on_timeout: raise USB20F_TimeoutError instead of
+	#		returning a WaitResult with met == False
 	#
 	# Return:
-	#	- returns tuple with (<pass/fail flag>, <error_code or data>)
-	#	Success: (0, (reg hex data, raw usb packet))
-	#	Failure: (1, <error information>)
+	#	WaitResult (also stored in self.last_wait)
+	#	Raises USB20F_Error on libusb failure
 	#
 	#------------------------------------------------------------
-	def read_InternalReg(self, address):
-		self.log.write("DEBUG", "--> Enter read_InternalReg()")
-
-		self.EPOUT_ACTIVE = self._EP_INT0_OUT
-		self.EPIN_ACTIVE = self._EP_INT0_IN
-		# send single packet
-		self.EP_SIZE = 64
-		# create new buffers
-		self.ep_data_out = (ct.c_ubyte*(self.EP_SIZE))()
-		self.ep_data_in = (ct.c_ubyte*(self.EP_SIZE))()
+	def wait_for_all(self, conditions, timeout=1000, spin=4, min_delay=0.5, max_delay=50,
+						raise_on_timeout=False):
+		conditions = [(a, m & 0xFFFFFFFF, v & m & 0xFFFFFFFF) for (a, m, v) in conditions]
+		addresses = list(dict.fromkeys(a for (a, m, v) in conditions))
+
+		start = time.monotonic()
+		deadline = start + timeout / 1000.0
+		delay = min_delay / 1000.0
+		polls = 0
+
+		while True:
+			# normal transfer timeout - one clipped to the deadline
+			# turns a slow round trip into a transfer error and
+			# leaves the late response queued on INT0 IN
+			values = dict(zip(addresses, self.read_regs(addresses)))
+			polls += 1
+
+			met = True
+			for (a, m, v) in conditions:
+				if((values[a] & m) != v):
+					met = False
+					break
+
+			now = time.monotonic()
+			if(met or now >= deadline):
+				break
 
-		# --------------------------------------
-		# Setup first write packet
-		# --------------------------------------	
+			if(polls > spin):
+				time.sleep(min(delay, deadline - now))
+				delay = min(delay * 2, max_delay / 1000.0)
+				# slept up to the deadline, don't poll past it
+				if(time.monotonic() >= deadline):
+					break
 
-		# setup rd/wr command
-		self.ep_data_out[0] = 0x24 & 0xFF
-		# setup address data
-		self.ep_data_out[1] = address & 0xFF
-		self.ep_data_out[2] = (address >> 8) & 0xFF
-		self.ep_data_out[3] = (address >> 16) & 0xFF
-		self.ep_data_out[4] = (address >> 24) & 0xFF
+		self.last_wait = WaitResult(met, values, polls, time.monotonic() - start)
 
+		if(not met):
+			self.log.write("WARNING", f"wait_for_all() timed out after {polls} polls, {timeout} mS: {self.last_wait}")
+			if(raise_on_timeout):
+				raise USB20F_TimeoutError(LIBUSB_ERROR_TIMEOUT)
 
-		usb.claim_interface(self.dev_handle, 0)
+		return self.last_wait
 
-		# --------------------------------------
-		# Handle Transmit Case
-		# --------------------------------------
-		self.log.write("INFO", f"INT1 TX, EPIN_ACTIVE: {hex(self.EPIN_ACTIVE)}, len: {len(self.ep_data_in)}")
 
-		r = usb.bulk_transfer(self.dev_handle, self.EPOUT_ACTIVE, self.ep_data_out, 
-								self.EP_SIZE, self.bulk_transferred, self.EP_TIMEOUT)
 
-		self.log.write("INFO", f"Write xfer {self.bulk_transferred.contents} bytes!")
 
-		if (r < 0):
-			self.log.write("ERROR", f"Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
-			self.log.write("ERROR", f"Expected to xfer <{self.EPIN_ACTIVE}> bytes!")
-			self.log.write("ERROR", f"bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
-			return (1, r)
-		else:	
-			self.log.write("INFO", f"Sent {self.bulk_transferred.contents} bytes!")
 
 
-		# --------------------------------------
-		# Handle Receive Case
-		# --------------------------------------
-		self.log.write("INFO", f"INT1 RX, EPIN_ACTIVE: {hex(self.EPIN_ACTIVE)}, len: {len(self.ep_data_in)}")
+	#------------------------------------------------------------
+	#
+	# Name: read_int1_into():
+	#
+	# Description:
+	#   Receive one INT1 report into a caller supplied writable
+	#	buffer (bytearray, memoryview, mmap, ctypes array).
+	#
+	# Parameters:
+	#	buf: writable buffer, at least one INT1 IN packet (64
+	#		bytes on full speed bridges)
+	#	timeout: timeout in mS
+	#
+	# Return:
+	#	number of bytes received
+	#	Raises USB20F_Error on libusb failure
+	#
+	#------------------------------------------------------------
+	def read_int1_into(self, buf, timeout=500):
+		cbuf, n = _as_cbuf(buf, writable=True)
+		self._claim(1)
+		return self._xfer(self._EP_INT1_IN, cbuf, min(n, self.packet_size(self._EP_INT1_IN)), timeout)
 
-		# send test data
-		r = usb.bulk_transfer(self.dev_handle, self.EPIN_ACTIVE, self.ep_data_in, 
-								self.EP_SIZE, self.bulk_transferred, self.EP_TIMEOUT)	
 
-		if (r < 0):
-			self.log.write("ERROR", f"Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
-			self.log.write("ERROR", f"Expected to xfer <{self.EPIN_ACTIVE}> bytes!")
-			self.log.write("ERROR", f"bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
-			return (1, r)
-		else:	
-			self.log.write("INFO", f"Read xfer {self.bulk_transferred.contents} bytes!")
 
-		self.log.writeUSBPacket("INFO", self.ep_data_in)
 
-		# parse return value
-		hex_value = self.ep_data_in[2]
-		hex_value += (self.ep_data_in[3] << 8)
-		hex_value += (self.ep_data_in[4] << 16)
-		hex_value += (self.ep_data_in[5] << 24)
 
 
-		usb.release_interface(self.dev_handle, 0)
+	#------------------------------------------------------------
+	#
+	# Name: read_int1_raw():
+	#
+	# Description:
+	#   Receive one INT1 report as bytes, or as a memoryview onto
+	#	a reusable buffer (valid until the next call).
+	#
+	# Return:
+	#	bytes or memoryview of the received data
+	#	Raises USB20F_Error on libusb failure
+	#
+	#------------------------------------------------------------
+	def read_int1_raw(self, timeout=500, view=False):
+		self._claim(1)
+		n = self._xfer(self._EP_INT1_IN, self._int1_in, len(self._int1_in), timeout)
+		if(view):
+			return memoryview(self._int1_in).cast("B")[:n]
+		return bytes(self._int1_in)[:n]
 
-		self.log.write("DEBUG", "<-- Exit read_InternalReg()")
-		return (0, (f"0x{hex_value:08x}", list(self.ep_data_in)))
 
 
 
@@ -625,58 +2855,59 @@ class USB20F_Device(object):
 
 	#------------------------------------------------------------
 	#
-	# Name: read_int1():
+	# Name: write_int1_raw():
 	#
 	# Description:
-	#    read 64 byte USB packet from interrupt interface 1.
+	#   Send one or more INT1 reports from a bytes-like object in
+	#	a single transfer, no list conversion.
 	#
 	# Parameters:
-	#	timeout: Amount of time in mS to wait for packet to be
-	#		received
+	#	data: bytes-like payload, length a multiple of the INT1
+	#		OUT packet size (64 bytes on full speed bridges)
+	#	timeout: timeout in mS (default adaptive)
 	#
 	# Return:
-	#	- returns tuple with (<pass/fail flag>, <error_code or data>)
-	#	Success: (0, <data received>)
-	#	Failure: (1, <error information>)
+	#	number of bytes transferred
+	#	Raises USB20F_Error on libusb failure
 	#
 	#------------------------------------------------------------
-	def read_int1(self, timeout=250):
-		self.log.write("DEBUG", "--> Enter read_int1()")
-
-		self.EPOUT_ACTIVE = self._EP_INT1_OUT
-		self.EPIN_ACTIVE = self._EP_INT1_IN
-		self.EP_SIZE = 64
-		self.ep_data_out = (ct.c_ubyte*(self.EP_SIZE))()
-		self.ep_data_in = (ct.c_ubyte*(self.EP_SIZE))()
+	def write_int1_raw(self, data, timeout=None):
+		cbuf, n = _as_cbuf(data)
+		self._check_packets(n, self._EP_INT1_OUT, "Data passed to write_int1_raw()")
 
-		usb.claim_interface(self.dev_handle, 1)
+		self._claim(1)
+		return self._xfer(self._EP_INT1_OUT, cbuf, n, timeout)
 
 
-		# --------------------------------------
-		# Handle Receive Case
-		# --------------------------------------
-		self.log.write("INFO", "-------- INT1 Report -----------")
-		self.log.write("INFO", f"EP1IN_SIZE: {self.EP_SIZE}, len: {len(self.ep_data_in)}")
-
-		# receive data
-		r = usb.bulk_transfer(self.dev_handle, self.EPIN_ACTIVE, self.ep_data_in, 
-								self.EP_SIZE, self.bulk_transferred, 500)	
 
-		if (r < 0):
-			self.log.write("ERROR", f"Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
-			self.log.write("ERROR", f"Endpoint <{hex(self.EPIN_ACTIVE)}> bytes!")
-			self.log.write("ERROR", f"bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
-			return (1, r)
-		else:
-			self.log.write("INFO", f"Read xfer {self.bulk_transferred.contents} bytes!")
 
 
-		self.log.writeUSBPacket("INFO", self.ep_data_in)
 
-		usb.release_interface(self.dev_handle, 1)
+	#------------------------------------------------------------
+	#
+	# Name: send_bulk_raw():
+	#
+	# Description:
+	#   Send a bytes-like payload on the BULK OUT endpoint in a
+	#	single transfer. Writable buffers are sent without a copy.
+	#
+	# Parameters:
+	#	data: bytes, bytearray, memoryview, mmap etc. Length must
+	#		be a multiple of the bulk OUT packet size (64 bytes
+	#		full speed, 512 high speed).
+	#	timeout: timeout in mS (default adaptive)
+	#
+	# Return:
+	#	number of bytes transferred
+	#	Raises USB20F_Error on libusb failure
+	#
+	#------------------------------------------------------------
+	def send_bulk_raw(self, data, timeout=None):
+		cbuf, n = _as_cbuf(data)
+		self._check_packets(n, self._EP_BULK_OUT, "Data passed to send_bulk_raw()")
 
-		self.log.write("DEBUG", "<-- Exit read_int1()")
-		return (0, list(self.ep_data_in))
+		self._claim(2)
+		return self._xfer(self._EP_BULK_OUT, cbuf, n, timeout)
 
 
 
@@ -685,85 +2916,226 @@ class USB20F_Device(object):
 
 	#------------------------------------------------------------
 	#
-	# Name: write_int1():
+	# Name: rec_bulk_into():
 	#
 	# Description:
-	#    write 64 byte USB packet to interrupt interface 1.
+	#   Receive bulk data straight into a caller supplied writable
+	#	buffer, no list copy.
 	#
 	# Parameters:
-	#	data: data to be sent. Must be in 64 byte blocks.
-	#	timeout: Amount of time in mS to wait for packet to be
-	#		transmitted
+	#	buf: writable buffer, length must be a multiple of the
+	#		bulk IN packet size (64 bytes full speed, 512 high
+	#		speed)
+	#	timeout: timeout in mS (default EP_TIMEOUT)
 	#
 	# Return:
-	#	- returns tuple with (<pass/fail flag>, <error_code>)
-	#	Success: (0, <0 - no data>)
-	#	Failure: (1, <error information>)
+	#	number of bytes received
+	#	Raises USB20F_Error on libusb failure
 	#
 	#------------------------------------------------------------
-	def write_int1(self, data=False, timeout=250):
-		self.log.write("DEBUG", "--> Enter write_int1()")
+	def rec_bulk_into(self, buf, timeout=None):
+		cbuf, n = _as_cbuf(buf, writable=True)
+		self._check_packets(n, self._EP_BULK_IN, "Buffer passed to rec_bulk_into()")
 
-		self.EPOUT_ACTIVE = self._EP_INT1_OUT
-		self.EPIN_ACTIVE = self._EP_INT1_IN
-		self.EP_SIZE = 64
-		self.ep_data_out = (ct.c_ubyte*(self.EP_SIZE))()
-		self.ep_data_in = (ct.c_ubyte*(self.EP_SIZE))()
+		self._claim(2)
+		return self._xfer(self._EP_BULK_IN, cbuf, n, timeout)
 
-		usb.claim_interface(self.dev_handle, 1)
 
 
-		# --------------------------------------
-		# Handle Transmist Case
-		# --------------------------------------
-		self.log.write("INFO", "-------- INT1 Report -----------")
 
-		# make sure data is of type 'list'
-		if(isinstance(data, list)):
-			pass
-		else:
-			self.log.write("ERROR", "Data is not of type list")
 
 
-		# send data over int 1 when payload is passed into function
-		if(data != False):
+	#------------------------------------------------------------
+	#
+	# Name: rec_bulk_array():
+	#
+	# Description:
+	#   Receive bulk data into a preallocated uint8 array.
+	#
+	# Parameters:
+	#	out: writable buffer to receive into (numpy uint8 array,
+	#		bytearray ...), allocated when None
+	#	nbytes: size of the allocated buffer when out is None
+	#		(multiple of the bulk IN packet size, default one
+	#		packet)
+	#	timeout: timeout in mS (default EP_TIMEOUT)
+	#
+	# Return:
+	#	view of out trimmed to the received length - numpy array
+	#	when numpy is available, memoryview otherwise
+	#	Raises USB20F_Error on libusb failure
+	#
+	#------------------------------------------------------------
+	def rec_bulk_array(self, out=None, nbytes=None, timeout=None):
+		if(out is None):
+			nbytes = nbytes or self.packet_size(self._EP_BULK_IN)
+			out = np.empty(nbytes, dtype=np.uint8) if np is not None else bytearray(nbytes)
 
-			# check to ensure data is in 64 byte blocks!
-			if(len(data) % 64):
-				# error - data isn't in blocks of 64 bytes
-				self.log.write("ERROR", "Data passed to function is not in 64 byte blocks!")
-				return (1, 100)
+		n = self.rec_bulk_into(out, timeout)
 
-			self.EP_SIZE = len(data)
-			data_s = (ct.c_ubyte*len(data))(*data)
+		if(np is not None and isinstance(out, np.ndarray)):
+			return out.reshape(-1).view(np.uint8)[:n]
+		return memoryview(out).cast("B")[:n]
 
-			self.log.write("INFO", f"EP1IN_SIZE: {self.EP_SIZE}, len: {len(data_s)}, timeout: {timeout}")
 
-			# send data
-			r = usb.bulk_transfer(self.dev_handle, self.EPOUT_ACTIVE, data_s, 
-									self.EP_SIZE, self.bulk_transferred, timeout)	
 
-			if (r < 0):
-				self.log.write("ERROR", f"Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
-				self.log.write("ERROR", f"Endpoint <{hex(self.EPOUT_ACTIVE)}> bytes!")
-				self.log.write("ERROR", f"bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
-				return (1, r)
-			else:
-				self.log.write("INFO", f"Write xfer {self.bulk_transferred.contents} bytes!")
 
 
-		# send data over int 1 when payload isn't passed into function
-		else:
-			# error - no data was passed in to function 
-			return (1, 200)
 
+	#------------------------------------------------------------
+	#
+	# Name: _xfer_async():
+	#
+	# Description:
+	#   Run a sequence of bulk transfers on one endpoint using the
+	#	libusb async API, keeping up to depth transfers submitted
+	#	so the bus doesn't idle between segments. After an error
+	#	no new transfers are submitted, in-flight ones are drained
+	#	and the first error is raised.
+	#
+	# Parameters:
+	#	ep: endpoint address
+	#	segments: iterable of (c_ubyte array, length), each buffer
+	#		must stay untouched until its transfer completes
+	#	depth: max transfers in flight
+	#	timeout: per transfer timeout in mS
+	#
+	# Return:
+	#	(bytes transferred, number of transfers)
+	#	Raises USB20F_Error on failure
+	#
+	#------------------------------------------------------------
+	def _xfer_async(self, ep, segments, depth, timeout):
+		completed = []
+		callback = usb.transfer_cb_fn(lambda t: completed.append(t))
+
+		xfers = [usb.alloc_transfer(0) for i in range(depth)]
+		slot_of = {ct.addressof(x.contents): k for (k, x) in enumerate(xfers)}
+		bufs = [None] * depth
+		started = [0] * depth
+		free = list(range(depth))
+		pending = set()			# submitted slots whose callback hasn't run
+		inflight = 0
+		total = 0
+		count = 0
+		err = 0
+		tv = usb.timeval(0, 100000)
+		segments = iter(segments)
+		exhausted = False
+
+		# the handle can't be closed by a reopen while transfers
+		# are queued on it
+		self._gate.enter()
+		try:
+			while True:
+				# keep the queue full
+				while free and not exhausted and err == 0:
+					seg = next(segments, None)
+					if(seg is None):
+						exhausted = True
+						break
+
+					k = free.pop()
+					bufs[k] = seg[0]
+					usb.fill_bulk_transfer(xfers[k], self.dev_handle, ep, ct.cast(seg[0], ct.POINTER(ct.c_ubyte)),
+											seg[1], callback, None, timeout)
+					if(self._tracing):
+						started[k] = time.monotonic_ns()
+						for h in self._pre_hooks:
+							h(self, "async", ep, seg[1], None, started[k])
+					r = usb.submit_transfer(xfers[k])
+					if(r < 0):
+						if(self._tracing):
+							# close the operation the pre hooks opened
+							ns1 = time.monotonic_ns()
+							for h in self._post_hooks:
+								h(self, "async", ep, seg[1], None, r, started[k], ns1)
+						err = r
+						free.append(k)
+						bufs[k] = None
+						break
+					pending.add(k)
+					inflight += 1
+
+				if(inflight == 0):
+					break
+
+				usb.handle_events_timeout(None, ct.byref(tv))
+
+				while completed:
+					t = completed.pop(0).contents
+					k = slot_of[ct.addressof(t)]
+					pending.discard(k)
+					bufs[k] = None
+					free.append(k)
+					inflight -= 1
+					count += 1
+					total += t.actual_length
+					if(self._tracing):
+						ns1 = time.monotonic_ns()
+						st = 0 if t.status == LIBUSB_TRANSFER_COMPLETED else _TRANSFER_STATUS_ERR.get(t.status, LIBUSB_ERROR_OTHER)
+						for h in self._post_hooks:
+							h(self, "async", ep, t.length, None, st, started[k], ns1)
+					if(t.status != LIBUSB_TRANSFER_COMPLETED and err == 0):
+						err = _TRANSFER_STATUS_ERR.get(t.status, LIBUSB_ERROR_OTHER)
+		finally:
+			# left early (exception, interrupt) - libusb still owns the
+			# queued transfers and their buffers until their callbacks ran
+			for k in pending:
+				usb.cancel_transfer(xfers[k])
+			while pending:
+				usb.handle_events_timeout(None, ct.byref(tv))
+				while completed:
+					pending.discard(slot_of[ct.addressof(completed.pop(0).contents)])
+			for x in xfers:
+				usb.free_transfer(x)
+			self._gate.leave()
+
+		if(err):
+			self.log.write("ERROR", f"async bulk transfer ret code <{err}> <{usb.error_name(err)}> on endpoint <{ep:#04x}>, "
+									f"transferred <{total}> bytes!")
+			raise _usb_error(err, ep, total)
+
+		return (total, count)
 
 
-		
-		usb.release_interface(self.dev_handle, 1)
 
-		self.log.write("DEBUG", "<-- Exit write_int1()")
-		return (0, 0)
+
+
+
+	#------------------------------------------------------------
+	#
+	# Name: _stream_segments():
+	#
+	# Description:
+	#   Split a byte memoryview into bulk transfer segments of at
+	#	most size bytes. Writable memory is shared with the
+	#	transfers, read-only memory is copied segment by segment
+	#	into depth + 1 rotating buffers. A tail shorter than one
+	#	pkt byte packet is padded with pad_byte up to pkt.
+	#
+	#------------------------------------------------------------
+	def _stream_segments(self, mv, size, pad_byte, depth, pkt=64):
+		whole = len(mv) - (len(mv) % pkt)
+		pool = None if not mv.readonly else [(ct.c_ubyte*size)() for i in range(depth + 1)]
+		k = 0
+		off = 0
+
+		while off < whole:
+			n = min(size, whole - off)
+			if(pool is None):
+				cbuf = (ct.c_ubyte*n).from_buffer(mv[off:off + n])
+			else:
+				cbuf = pool[k]
+				memoryview(cbuf).cast("B")[:n] = mv[off:off + n]
+				k = (k + 1) % len(pool)
+			yield (cbuf, n)
+			off += n
+
+		if(off < len(mv)):
+			tail = (ct.c_ubyte*pkt)(*([pad_byte] * pkt))
+			memoryview(tail).cast("B")[:len(mv) - off] = mv[off:]
+			yield (tail, pkt)
 
 
 
@@ -772,75 +3144,81 @@ class USB20F_Device(object):
 
 	#------------------------------------------------------------
 	#
-	# Name: send_bulk():
+	# Name: send_stream():
 	#
 	# Description:
-	#	Send a bulk data transfer. Data size must be in increments
-	#	of 64 byte blocks.
+	#   Stream an arbitrarily large payload over the BULK OUT
+	#	endpoint. The payload is split into transfers of
+	#	transfer_size bytes that are pipelined (depth transfers
+	#	in flight), the tail is padded to a whole bulk packet
+	#	(64 bytes full speed, 512 high speed) according to pad.
 	#
 	# Parameters:
-	#	data: data payload to be transmitted over USB link via
-	#	BULK interface (interface 3).
-	#	
+	#	data: bytes-like payload (bytes, bytearray, memoryview,
+	#		mmap ...). Writable buffers are sent without copying.
+	#	transfer_size: bytes per bulk transfer, multiple of the
+	#		bulk packet size (default self.STREAM_XFER_SIZE)
+	#	pad: tail padding policy
+	#		"zero" - pad with 0x00
+	#		"ff" - pad with 0xFF
+	#		<int> - pad with this byte value
+	#		None - no padding, raise ValueError if the payload
+	#			isn't a whole number of packets
+	#	depth: transfers in flight (default self.STREAM_DEPTH),
+	#		1 uses plain synchronous transfers
+	#	timeout: per transfer timeout in mS (default adaptive,
+	#		scaled by depth since queued transfers wait on the
+	#		ones ahead of them)
 	#
 	# Return:
-	#	- returns tuple with (<pass/fail flag>, <error_code or data>)
-	#	Success: (0, 0) {no data returned}
-	#	Failure: (1, <error information>)
+	#	StreamResult (see .mbps for achieved throughput)
+	#	Raises USB20F_Error on libusb failure
 	#
 	#------------------------------------------------------------
-	def send_bulk(self, data=False, timeout=250, verbose=False, log=False):
-		self.log.write("DEBUG", "--> Enter send_bulk()")
-
-		self.EPOUT_ACTIVE = self._EP_BULK_OUT
-		self.EPIN_ACTIVE = self._EP_BULK_IN
-		self.EP_TIMEOUT = timeout
-
+	def send_stream(self, data, transfer_size=None, pad="zero", depth=None, timeout=None):
+		size = transfer_size or self.STREAM_XFER_SIZE
+		depth = depth or self.STREAM_DEPTH
+		ep = self._EP_BULK_OUT
+		pkt = self.packet_size(ep)
+
+		if(size % pkt):
+			raise ValueError(f"transfer_size <{size}> not a multiple of {pkt} bytes!")
+
+		if(pad == "zero"):
+			pad_byte = 0x00
+		elif(pad == "ff"):
+			pad_byte = 0xFF
+		elif(isinstance(pad, int) and 0 <= pad <= 0xFF):
+			pad_byte = pad
+		elif(pad is None):
+			pad_byte = None
+		else:
+			raise ValueError(f"pad must be 'zero', 'ff', a byte value or None, got <{pad}>")
 
-		usb.claim_interface(self.dev_handle, 2)
-		
-		if(data != False):
-			# ensure data in 64 byte blocks
-			if(len(data)%64):
-				self.log.write("ERROR", f"Data passed to send_bulk() not 64 byte blocks, mod result <{len(data) % 64}>!")
-				return (1, 1)
+		mv = memoryview(data).cast("B")
+		padded = (-len(mv)) % pkt
+		if(padded and pad_byte is None):
+			raise ValueError(f"Data passed to send_stream() not {pkt} byte blocks, mod result <{len(mv) % pkt}>!")
 
-			self.EP_SIZE = len(data)
-			data_s = (ct.c_ubyte*len(data))(*data)
+		if(timeout is None):
+			timeout = self.timeout_for(ep, size) * depth
 
-			# send bulk data
-			r = usb.bulk_transfer(self.dev_handle, self.EPOUT_ACTIVE, data_s, 
-									self.EP_SIZE, self.bulk_transferred, self.EP_TIMEOUT)
-			# error check
-			if (r < 0):
-				self.log.write("ERROR", f"ERROR: Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
-				self.log.write("ERROR", f"ERROR: Expected to xfer <{self.EP_SIZE}> bytes!")
-				self.log.write("ERROR", f"ERROR: bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
-				return (1, r)
-			else:	
-				self.log.write("INFO", f"transferred {self.bulk_transferred.contents} bytes!")
+		self._claim(2)
 
-			
+		t0 = time.perf_counter()
+		segments = self._stream_segments(mv, size, pad_byte, depth, pkt)
+		if(depth > 1):
+			sent, count = self._xfer_async(ep, segments, depth, timeout)
 		else:
-			self.EP_SIZE = 64
-			# send bulk data
-			r = usb.bulk_transfer(self.dev_handle, self.EPOUT_ACTIVE, self.ep_data_out, 
-									self.EP_SIZE, self.bulk_transferred, self.EP_TIMEOUT)		
-
-			# error check
-			if (r < 0):
-				self.log.write("ERROR", f"ERROR: Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
-				self.log.write("ERROR", f"ERROR: Expected to xfer <{self.EP_SIZE}> bytes!")
-				self.log.write("ERROR", f"ERROR: bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
-				return (1, r)
-			else:	
-				self.log.write("INFO", f"transferred {self.bulk_transferred.contents} bytes!")
-
-		usb.release_interface(self.dev_handle, 2)
-
-		self.log.write("DEBUG", "<-- Exit send_bulk()")
-		return (0, 0)
+			sent = 0
+			count = 0
+			for (cbuf, n) in segments:
+				sent += self._xfer(ep, cbuf, n, timeout)
+				count += 1
 
+		result = StreamResult(len(mv), padded, count, time.perf_counter() - t0)
+		self.log.write("INFO", f"send_stream(): {result}")
+		return result
 
 
 
@@ -849,60 +3227,200 @@ class USB20F_Device(object):
 
 	#------------------------------------------------------------
 	#
-	# Name: rec_bulk():
+	# Name: send_file():
 	#
 	# Description:
-	#   Receive a bulk data transfer. Endpoint size must be in
-	#	64 byte block increments.
+	#   Stream a file over the BULK OUT endpoint. The file is
+	#	memory mapped copy-on-write, so send_stream() transfers
+	#	straight out of the page cache without reading it into
+	#	Python objects.
 	#
 	# Parameters:
-	#	timeout: timeout for reception in mS
-	#	ep_size: endpoint size/data transfer size (must be 64 byte
-	#		increments). Data is transferred over interface 3.
-	#	
+	#	path: file to send
+	#	**kwargs: passed to send_stream() (transfer_size, pad,
+	#		depth, timeout)
 	#
 	# Return:
-	#	- returns tuple with (<pass/fail flag>, <error_code or data>)
-	#	Success: (0, received data)
-	#	Failure: (1, error flag)
+	#	StreamResult
+	#	Raises USB20F_Error on libusb failure
 	#
 	#------------------------------------------------------------
-	def rec_bulk(self, timeout=250, ep_size=64):
-		self.log.write("DEBUG", "--> Enter rec_bulk()")
+	def send_file(self, path, **kwargs):
+		with open(path, "rb") as f:
+			if(os.fstat(f.fileno()).st_size == 0):
+				return StreamResult(0, 0, 0, 0.0)
 
-		self.EPOUT_ACTIVE = self._EP_BULK_OUT
-		self.EPIN_ACTIVE = self._EP_BULK_IN
-		self.EP_TIMEOUT = timeout
+			mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
 
-		# adjust endpoint size and buffer if needed
-		if(ep_size != 64):
-			self.EP_SIZE = ep_size
-			self.ep_data_in = (ct.c_ubyte*(self.EP_SIZE))()
-		else:
-			self.EP_SIZE = 64
-			self.ep_data_in = (ct.c_ubyte*(self.EP_SIZE))()
+		try:
+			return self.send_stream(mm, **kwargs)
+		finally:
+			try:
+				mm.close()
+			except BufferError:
+				# transfer buffers still referenced by an exception
+				# traceback, the mapping goes away with them
+				pass
 
-		usb.claim_interface(self.dev_handle, 2)
-		
 
-		# read bulk data
-		r = usb.bulk_transfer(self.dev_handle, self.EPIN_ACTIVE, self.ep_data_in, 
-									self.EP_SIZE, self.bulk_transferred, self.EP_TIMEOUT)	
-		# error check
-		if (r < 0):
-			self.log.write("ERROR", f"ERROR: Total bytes transferred <{self.bulk_transferred.contents}> bytes!")
-			self.log.write("ERROR", f"ERROR: Expected to xfer <{self.EP_SIZE}> bytes!")
-			self.log.write("ERROR", f"ERROR: bulk_transfer() ret code <{r}> <{usb.error_name(r)}> bytes!")
-			return (1, r)
-		else:
-			self.log.write("INFO", f"Received {self.bulk_transferred.contents} bytes!")	
 
 
-		usb.release_interface(self.dev_handle, 2)
 
-		self.log.write("DEBUG", "<-- Exit rec_bulk()")
 
-		return (0, list(self.ep_data_in))
+	#------------------------------------------------------------
+	#
+	# Name: capture_to_file():
+	#
+	# Description:
+	#   Record bulk RX data to a file with constant memory use.
+	#
+	#	nbytes given: the file is preallocated to nbytes, memory
+	#		mapped and every transfer lands directly in the
+	#		mapping (no copies, no writer thread).
+	#	duration only: transfers are received into a fixed pool
+	#		of self.CAPTURE_BUFFERS buffers which a background
+	#		writer thread drains to the file.
+	#
+	#	Timeouts are retried until the duration deadline passes,
+	#	without a duration the first timeout ends the capture
+	#	with USB20F_TimeoutError.
+	#
+	# Parameters:
+	#	path: output file (created/truncated)
+	#	nbytes: number of bytes to capture
+	#	duration: capture time limit in seconds
+	#	chunk: bytes per bulk transfer, multiple of the bulk IN
+	#		packet size (default self.STREAM_XFER_SIZE)
+	#	timeout: per transfer timeout in mS (default EP_TIMEOUT)
+	#
+	# Return:
+	#	StreamResult (nbytes = bytes written to the file)
+	#	Raises USB20F_Error on libusb failure
+	#
+	#------------------------------------------------------------
+	def capture_to_file(self, path, nbytes=None, duration=None, chunk=None, timeout=None):
+		chunk = chunk or self.STREAM_XFER_SIZE
+		pkt = self.packet_size(self._EP_BULK_IN)
+		if(chunk % pkt):
+			raise ValueError(f"chunk <{chunk}> not a multiple of {pkt} bytes!")
+		if(nbytes is None and duration is None):
+			raise ValueError("capture_to_file() needs nbytes and/or duration")
+
+		deadline = None if duration is None else time.monotonic() + duration
+
+		if(nbytes is not None):
+			result = self._capture_mmap(path, nbytes, chunk, timeout, deadline)
+		else:
+			result = self._capture_writer(path, chunk, timeout, deadline)
+
+		self.log.write("INFO", f"capture_to_file(): {path}, {result}")
+		return result
+
+
+	# one bulk receive, with a deadline a timeout just returns 0
+	# and the capture loop checks the deadline
+	def _capture_rx(self, cbuf, n, timeout, deadline):
+		try:
+			return self._xfer(self._EP_BULK_IN, cbuf, n, timeout)
+		except USB20F_TimeoutError:
+			if(deadline is None):
+				raise
+			return 0
+
+
+	def _capture_mmap(self, path, nbytes, chunk, timeout, deadline):
+		with open(path, "w+b") as f:
+			f.truncate(nbytes)
+			if(nbytes == 0):
+				return StreamResult(0, 0, 0, 0.0)
+			mm = mmap.mmap(f.fileno(), nbytes)
+
+		mv = memoryview(mm)
+		scratch = (ct.c_ubyte*chunk)()
+		cbuf = None
+		pos = 0
+		count = 0
+		self._claim(2)
+		t0 = time.perf_counter()
+
+		try:
+			while pos < nbytes and (deadline is None or time.monotonic() < deadline):
+				if(nbytes - pos >= chunk):
+					cbuf = (ct.c_ubyte*chunk).from_buffer(mv[pos:pos + chunk])
+					pos += self._capture_rx(cbuf, chunk, timeout, deadline)
+					cbuf = None
+				else:
+					# short tail - receive a full chunk, keep what fits
+					n = self._capture_rx(scratch, chunk, timeout, deadline)
+					n = min(n, nbytes - pos)
+					mv[pos:pos + n] = memoryview(scratch).cast("B")[:n]
+					pos += n
+				count += 1
+		finally:
+			cbuf = None
+			mv.release()
+			mm.flush()
+			try:
+				mm.close()
+			except BufferError:
+				# transfer buffer still referenced by an exception
+				# traceback, the mapping goes away with it
+				pass
+
+			# only keep what was actually received
+			if(pos < nbytes):
+				with open(path, "r+b") as f:
+					f.truncate(pos)
+
+		return StreamResult(pos, 0, count, time.perf_counter() - t0)
+
+
+	def _capture_writer(self, path, chunk, timeout, deadline):
+		free = queue.Queue()
+		full = queue.Queue()
+		for i in range(self.CAPTURE_BUFFERS):
+			free.put((ct.c_ubyte*chunk)())
+
+		written = [0]
+		errors = []
+
+		def writer(f):
+			while True:
+				item = full.get()
+				if(item is None):
+					return
+				buf, n = item
+				try:
+					f.write(memoryview(buf).cast("B")[:n])
+					written[0] += n
+				except OSError as e:
+					errors.append(e)
+				free.put(buf)
+
+		count = 0
+		self._claim(2)
+		t0 = time.perf_counter()
+
+		with open(path, "wb") as f:
+			th = threading.Thread(target=writer, args=(f,), name="capture_to_file", daemon=True)
+			th.start()
+			try:
+				while time.monotonic() < deadline and not errors:
+					buf = free.get()
+					n = self._capture_rx(buf, chunk, timeout, deadline)
+					if(n):
+						full.put((buf, n))
+						count += 1
+					else:
+						free.put(buf)
+			finally:
+				full.put(None)
+				th.join()
+
+		if(errors):
+			raise errors[0]
+
+		return StreamResult(written[0], 0, count, time.perf_counter() - t0)
 
 
 
@@ -927,7 +3445,8 @@ class USB20F_Device(object):
 	def close_usb(self):
 		self.log.write("DEBUG", "--> Enter close_usb()")
 
-		
+		self._claimed.clear()
+		self._reg_shadow.clear()
 
 		self.log.write("DEBUG", "<-- Exit close_usb()")
 		self.log.shutdown_logging()
@@ -1299,4 +3818,12 @@ class USB20F_Device(object):
 		if(r[0]):
 			print(f"ERROR: libusb ret code <{r[1]}> <{usb.error_name(r[1])}> bytes!")			
 		else:
-			print(f"Address: {self.CTRMODECR_ADDR:#08x}, Value: {r[1][0]}")
\ No newline at end of file
+			print(f"Address: {self.CTRMODECR_ADDR:#08x}, Value: {r[1][0]}")
+
+
+
+
+# command line entry point: python -m USB_SSI_Libs.rei_usb_lib <command>
+if __name__ == "__main__":
+	from USB_SSI_Libs import CLI_USB20F
+	sys.exit(CLI_USB20F.main())